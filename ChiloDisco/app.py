@@ -1,11 +1,15 @@
 import os
 import io
+import csv
 import time
 import json
+import bisect
+import threading
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Tuple
 
-from flask import Flask, jsonify, render_template, send_from_directory, request, send_file, abort
+from flask import Flask, jsonify, render_template, send_from_directory, request, send_file, abort, Response, \
+    stream_with_context
 
 # Try to import yaml, but provide a fallback parser if not available
 try:
@@ -308,6 +312,126 @@ def api_logs():
     return resp
 
 
+# ————— 增量日志推送（SSE）：按字节偏移只读新增内容，/api/logs 轮询保留为回退方式 —————
+class _LogFollower:
+    """Follow one log file by byte offset.
+
+    Only complete lines are consumed; a trailing partial line is read again on the next poll.
+    An inode change (rotation), a size smaller than the offset (truncation) or different leading bytes
+    (the file was rewritten and reused the inode) restarts from the beginning.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self.head = b''     # 文件开头的字节，用于识别被重写的文件
+
+    def _read_head(self, f) -> bytes:
+        f.seek(0)
+        return f.read(64)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path)
+        except OSError:
+            return None
+
+    def snapshot(self, max_bytes: int = 120_000, max_lines: int = 500) -> List[str]:
+        st = self._stat()
+        if st is None:
+            self.offset, self.inode = 0, None
+            return []
+        start = max(0, st.st_size - max_bytes)
+        with open(self.path, 'rb') as f:
+            self.head = self._read_head(f)
+            f.seek(start)
+            data = f.read(st.st_size - start)
+        end = data.rfind(b'\n') + 1
+        self.offset, self.inode = start + end, st.st_ino
+        lines = data[:end].decode('utf-8', errors='replace').splitlines()
+        if start > 0 and lines:
+            lines = lines[1:]   # 从行中间开始读，丢弃第一行
+        return lines[-max_lines:]
+
+    def read_new(self, max_bytes: int = 1_000_000) -> Tuple[List[str], bool]:
+        """Returns (new complete lines, whether the file was rotated or truncated)."""
+        st = self._stat()
+        if st is None:
+            reset = self.inode is not None
+            self.offset, self.inode = 0, None
+            return [], reset
+        reset = False
+        if (self.inode is not None and st.st_ino != self.inode) or st.st_size < self.offset:
+            self.offset, reset = 0, True
+        self.inode = st.st_ino
+        if st.st_size == self.offset:
+            return [], reset
+        with open(self.path, 'rb') as f:
+            head = self._read_head(f)
+            if not reset and head[:len(self.head)] != self.head:
+                self.offset, reset = 0, True
+            self.head = head
+            f.seek(self.offset)
+            data = f.read(min(max_bytes, st.st_size - self.offset))
+        end = data.rfind(b'\n') + 1
+        if end == 0 and len(data) == max_bytes:
+            end = len(data)     # 超长的一行，按块推送
+        self.offset += end
+        return data[:end].decode('utf-8', errors='replace').splitlines(), reset
+
+
+def _sse_event(event: str, payload: Dict) -> str:
+    return f'event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n'
+
+
+@app.route('/api/logs/stream')
+def api_logs_stream():
+    """Server-Sent Events: one 'snapshot' with the tail of every log, then 'append' events with new lines only."""
+    try:
+        poll_interval = min(10.0, max(0.1, float(request.args.get('interval', 0.5))))
+    except ValueError:
+        poll_interval = 0.5
+    keys = [k for k in (request.args.get('keys') or '').split(',') if k] or list(LOG_PATHS)
+    followers = {k: _LogFollower(LOG_PATHS[k]) for k in keys if k in LOG_PATHS}
+
+    def _meta(path: str) -> Dict:
+        exists = os.path.exists(path)
+        return {'path': path, 'exists': exists, 'size': os.path.getsize(path) if exists else 0,
+                'mtime': _file_mtime_iso(path)}
+
+    def generate():
+        now_dt = datetime.now(tz=timezone.utc)
+        logs = {}
+        for key, follower in followers.items():
+            lines = follower.snapshot()
+            # 与 /api/logs 首次请求一致：历史行按行序分配递进时间戳
+            logs[key] = dict(_meta(follower.path), lines=[
+                {'s': line, 't': (now_dt - timedelta(seconds=(len(lines) - 1 - i) * 0.8)).isoformat()}
+                for i, line in enumerate(lines)])
+        yield 'retry: 3000\n'
+        yield _sse_event('snapshot', {'now': now_dt.isoformat(), 'logs': logs})
+        last_sent = time.time()
+        while True:
+            time.sleep(poll_interval)
+            now_iso = datetime.now(tz=timezone.utc).isoformat()
+            changed = {}
+            for key, follower in followers.items():
+                lines, reset = follower.read_new()
+                if lines or reset:
+                    changed[key] = dict(_meta(follower.path), reset=reset,
+                                        lines=[{'s': line, 't': now_iso} for line in lines])
+            if changed:
+                yield _sse_event('append', {'now': now_iso, 'logs': changed})
+                last_sent = time.time()
+            elif time.time() - last_sent > 15:
+                yield ': keepalive\n\n'
+                last_sent = time.time()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/health')
 def health():
     ok = bool(LOG_PATHS)
@@ -402,91 +526,152 @@ def _plotdata_path() -> str:
     return cand[0]
 
 
-def _tail_read_lines(path: str, max_bytes: int = 256_000) -> List[str]:
-    if not os.path.exists(path):
-        return []
-    size = os.path.getsize(path)
-    start = max(0, size - max_bytes)
-    with open(path, 'rb') as f:
-        if start > 0:
-            f.seek(start)
-        data = f.read()
-    text = data.decode('utf-8', errors='replace')
-    lines = text.splitlines()
-    if start > 0 and lines:
-        lines = lines[1:]
-    return lines
-
-
-def _parse_plotdata(lines: List[str], limit: int = 2000) -> Dict[str, List[float]]:
-    # Prepare arrays
-    result = {
-        't': [],
-        'map_size': [],
-        'edges_found': [],
-        'corpus_count': [],
-        'cycles_done': [],
-        'cur_item': [],
-        'saved_crashes': [],
-        'max_depth': [],
-        'total_execs': [],
-        'pending_total': [],
-        'pending_favs': [],
-        'execs_per_sec': [],
-    }
-    rows: List[List[str]] = []
-    for raw in lines:
-        if not raw or raw.lstrip().startswith('#'):
-            continue
-        parts = [p.strip() for p in raw.split(',')]
-        if len(parts) < 12:
-            continue
-        rows.append(parts)
-    # limit to last N
-    rows = rows[-limit:]
+PLOT_SERIES_KEYS = ['t', 'map_size', 'edges_found', 'corpus_count', 'cycles_done', 'cur_item', 'saved_crashes',
+                    'max_depth', 'total_execs', 'pending_total', 'pending_favs', 'execs_per_sec']
+
+
+def _parse_plot_row(raw: str):
+    """Parse one plot_data line into a tuple ordered like PLOT_SERIES_KEYS, or None for comments/bad rows."""
+    if not raw or raw.lstrip().startswith('#'):
+        return None
+    cols = [p.strip() for p in raw.split(',')]
+    if len(cols) < 12:
+        return None
 
     def to_int(s: str) -> int:
-        try:
-            return int(float(s))
-        except Exception:
-            return 0
+        return int(float(s))
 
-    def to_float(s: str) -> float:
-        try:
-            return float(s)
-        except Exception:
-            return 0.0
+    # indices per AFL++ header
+    # 0 rel_time, 1 cycles_done, 2 cur_item, 3 corpus_count, 4 pending_total, 5 pending_favs,
+    # 6 map_size(%) 7 saved_crashes 8 saved_hangs 9 max_depth 10 execs_per_sec 11 total_execs
+    # 12 edges_found 13 total_crashes 14 servers_count
+    try:
+        ms = cols[6][:-1] if cols[6].endswith('%') else cols[6]
+        return (float(cols[0]), float(ms), to_int(cols[12]) if len(cols) > 12 else 0, to_int(cols[3]),
+                to_int(cols[1]), to_int(cols[2]), to_int(cols[7]), to_int(cols[9]), to_int(cols[11]),
+                to_int(cols[4]), to_int(cols[5]), float(cols[10]))
+    except ValueError:
+        return None
+
+
+class _PlotDataCache:
+    """Full plot_data history as columnar lists, extended by reading only the bytes appended since the last call.
+
+    A new inode, a shrinking file or changed leading bytes (AFL restarted into the same output dir) rebuilds it.
+    """
 
-    for cols in rows:
-        # indices per AFL++ header in issue
-        # 0 rel_time, 1 cycles_done, 2 cur_item, 3 corpus_count, 4 pending_total, 5 pending_favs,
-        # 6 map_size(%) 7 saved_crashes 8 saved_hangs 9 max_depth 10 execs_per_sec 11 total_execs
-        # 12 edges_found 13 total_crashes 14 servers_count
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = ''
+        self.inode = None
+        self.offset = 0
+        self.head = b''
+        self.columns: Dict[str, List[float]] = {k: [] for k in PLOT_SERIES_KEYS}
+
+    def _reset(self, path: str):
+        self.path, self.inode, self.offset, self.head = path, None, 0, b''
+        self.columns = {k: [] for k in PLOT_SERIES_KEYS}
+
+    def _refresh(self, path: str):
+        if path != self.path:
+            self._reset(path)
         try:
-            rel_t = to_float(cols[0])
-            result['t'].append(rel_t)
-            result['cycles_done'].append(to_int(cols[1]))
-            result['cur_item'].append(to_int(cols[2]))
-            result['corpus_count'].append(to_int(cols[3]))
-            result['pending_total'].append(to_int(cols[4]))
-            result['pending_favs'].append(to_int(cols[5]))
-            ms = cols[6].strip()
-            if ms.endswith('%'):
-                ms = ms[:-1]
-            result['map_size'].append(to_float(ms))
-            result['saved_crashes'].append(to_int(cols[7]))
-            # saved_hangs (cols[8]) currently not used in visuals
-            result['max_depth'].append(to_int(cols[9]))
-            result['execs_per_sec'].append(to_float(cols[10]))
-            result['total_execs'].append(to_int(cols[11]))
-            if len(cols) > 12:
-                result['edges_found'].append(to_int(cols[12]))
-            else:
-                result['edges_found'].append(0)
-        except Exception:
-            # skip bad row
+            st = os.stat(path)
+        except OSError:
+            self._reset(path)
+            return
+        if (self.inode is not None and st.st_ino != self.inode) or st.st_size < self.offset:
+            self._reset(path)
+        if st.st_size == self.offset:
+            return
+        with open(path, 'rb') as f:
+            head = f.read(64)
+            if head[:len(self.head)] != self.head:
+                self._reset(path)
+            self.inode, self.head = st.st_ino, head
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        end = data.rfind(b'\n') + 1    # 最后一行可能尚未写完，下次再读
+        self.offset += end
+        columns = list(self.columns.values())
+        for raw in data[:end].decode('utf-8', errors='replace').splitlines():
+            row = _parse_plot_row(raw)
+            if row is None:
+                continue
+            for column, value in zip(columns, row):
+                column.append(value)
+
+    def window(self, path: str, t_start=None, t_end=None) -> Tuple[Dict[str, List[float]], int]:
+        """Refresh, then copy the rows with t in [t_start, t_end] while still holding the lock.
+
+        A concurrent refresh appends to the live lists, so callers must never keep references to them.
+        :return: (columns sliced to the range, total row count)
+        """
+        with self.lock:
+            self._refresh(path)
+            t = self.columns['t']
+            lo = bisect.bisect_left(t, t_start) if t_start is not None else 0
+            hi = bisect.bisect_right(t, t_end) if t_end is not None else len(t)
+            return {k: v[lo:hi] for k, v in self.columns.items()}, len(t)
+
+
+PLOT_CACHE = _PlotDataCache()
+
+
+def _lttb_indices(xs: List[float], ys: List[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the visual shape of (xs, ys)."""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_count = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / avg_count
+        avg_y = sum(ys[avg_start:avg_end]) / avg_count
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        max_area, next_a = -1.0, range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area, next_a = area, j
+        selected.append(next_a)
+        a = next_a
+    selected.append(n - 1)
+    return selected
+
+
+def _minmax_indices(ys: List[float], buckets: int) -> List[int]:
+    """Per bucket keep the first point plus the minimum and maximum, so spikes survive downsampling."""
+    n = len(ys)
+    if buckets * 3 >= n or buckets < 1:
+        return list(range(n))
+    selected = set()
+    for b in range(buckets):
+        lo, hi = b * n // buckets, (b + 1) * n // buckets
+        if lo >= hi:
             continue
-    return result
+        part = ys[lo:hi]
+        selected.update((lo, lo + part.index(min(part)), lo + part.index(max(part))))
+    selected.add(n - 1)
+    return sorted(selected)
+
+
+def _downsample_plot(sliced: Dict[str, List[float]], points: int, mode: str, key: str) -> Dict[str, List[float]]:
+    """Pick indices on the `key` series of an already range-sliced window; all series share the same indices."""
+    if mode == 'none' or len(sliced['t']) <= points:
+        return sliced
+    ys = sliced.get(key) or sliced['execs_per_sec']
+    if mode == 'minmax':
+        indices = _minmax_indices(ys, max(1, points // 3))
+    else:
+        indices = _lttb_indices(sliced['t'], ys, points)
+    return {k: [v[i] for i in indices] for k, v in sliced.items()}
 
 
 # 全局维护 .cur_input 内容变更的起始时间（用于计时）
@@ -588,10 +773,19 @@ def api_plot():
         'size': os.path.getsize(path) if exists else 0,
         'mtime': _file_mtime_iso(path) if exists else '',
     }
-    series = {k: [] for k in ['t','map_size','edges_found','corpus_count','cycles_done','cur_item','saved_crashes','max_depth','total_execs','pending_total','pending_favs','execs_per_sec']}
+    # 全部历史增量缓存在 PLOT_CACHE 中；按 points/mode/key/start/end 降采样（默认LTTB到2000点）
+    def _arg_float(name: str):
+        try:
+            return float(request.args[name]) if request.args.get(name) else None
+        except ValueError:
+            return None
+    points = min(20000, max(10, int(_arg_float('points') or 2000)))
+    mode = request.args.get('mode', 'lttb')
+    key = request.args.get('key', 'execs_per_sec')
+    series = {k: [] for k in PLOT_SERIES_KEYS}
     if exists:
-        lines = _tail_read_lines(path, max_bytes=512_000)
-        series = _parse_plotdata(lines, limit=2000)
+        window, meta['total_rows'] = PLOT_CACHE.window(path, _arg_float('start'), _arg_float('end'))
+        series = _downsample_plot(window, points, mode, key if key in PLOT_SERIES_KEYS else 'execs_per_sec')
 
     # .cur_input 内容读取与计时
     cur_path = _cur_input_path()
@@ -639,6 +833,456 @@ def api_plot():
     return resp
 
 
+# ————— 崩溃分诊（由 code/crash_triage.py 生成 OUTPUT_DIR/triage/index.json） —————
+def _triage_dir() -> str:
+    out_dir = _fuzz_output_dir()
+    return os.path.join(out_dir, 'triage') if out_dir else ''
+
+
+def _load_triage_index() -> Dict:
+    triage_dir = _triage_dir()
+    path = os.path.join(triage_dir, 'index.json') if triage_dir else ''
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+@app.route('/api/triage')
+def api_triage():
+    index = _load_triage_index()
+    buckets = sorted((index.get('buckets') or {}).values(), key=lambda b: b.get('count', 0), reverse=True)
+    crashes = index.get('crashes') or {}
+    status_count: Dict[str, int] = {}
+    for entry in crashes.values():
+        status_count[entry.get('status', '')] = status_count.get(entry.get('status', ''), 0) + 1
+    updated_at = index.get('updated_at')
+    return jsonify({
+        'exists': bool(index),
+        'updated_at': datetime.fromtimestamp(updated_at, tz=timezone.utc).isoformat() if updated_at else '',
+        'harness': index.get('harness', ''),
+        'top_n': index.get('top_n'),
+        'crash_count': len(crashes),
+        'status_count': status_count,
+        'buckets': buckets,
+    })
+
+
+def _triage_bucket_or_404(bucket_id: str) -> Dict:
+    bucket = (_load_triage_index().get('buckets') or {}).get(bucket_id)
+    if not bucket:
+        abort(404, description='分诊桶不存在')
+    return bucket
+
+
+@app.route('/api/triage/<bucket_id>/representative')
+def download_triage_representative(bucket_id: str):
+    bucket = _triage_bucket_or_404(bucket_id)
+    out_dir = _fuzz_output_dir()
+    path = os.path.realpath(os.path.join(out_dir, bucket.get('representative') or ''))
+    if not path.startswith(os.path.realpath(out_dir) + os.sep) or not os.path.isfile(path):
+        return abort(404, description='代表崩溃文件不存在')
+    return send_file(path, as_attachment=True, download_name=f'{bucket_id}_{os.path.basename(path).replace(":", "_")}')
+
+
+@app.route('/api/triage/<bucket_id>/report')
+def triage_report(bucket_id: str):
+    _triage_bucket_or_404(bucket_id)
+    path = os.path.join(_triage_dir(), 'reports', f'{bucket_id}.txt')
+    if not os.path.exists(path):
+        return abort(404, description='分诊报告不存在')
+    return send_file(path, mimetype='text/plain')
+
+
+# ————— 实时指标（由工厂的 metrics.py 定期写入 metrics.prom） —————
+def _metrics_paths() -> List[str]:
+    """The factory's metrics file plus those of every multi-instance sub directory (main/sec1/...)."""
+    csv_paths = load_csv_paths()
+    path = csv_paths.get('METRICS_PATH')
+    if not path and csv_paths.get('MAIN_CSV_PATH'):
+        path = os.path.join(os.path.dirname(csv_paths['MAIN_CSV_PATH']), 'metrics.prom')
+    if not path:
+        return []
+    base_dir, file_name = os.path.split(path)
+    paths = [path] if os.path.exists(path) else []
+    try:
+        for name in sorted(os.listdir(base_dir)):
+            sub_path = os.path.join(base_dir, name, file_name)
+            if os.path.isfile(sub_path):
+                paths.append(sub_path)
+    except OSError:
+        pass
+    return paths
+
+
+def _merge_prometheus_texts(texts: List[str]) -> str:
+    """Group samples of the same metric family from several files so that each family appears once."""
+    families: Dict[str, List[str]] = {}
+    for text in texts:
+        family = ''
+        for line in text.splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                family = line.split(' ', 3)[2]
+                lines = families.setdefault(family, [])
+                if line not in lines:
+                    lines.append(line)
+            elif line.strip():
+                families.setdefault(family, []).append(line)
+    return ''.join(line + '\n' for lines in families.values() for line in lines)
+
+
+@app.route('/metrics')
+def metrics():
+    texts = []
+    for path in _metrics_paths():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                texts.append(f.read())
+        except OSError:
+            continue
+    resp = app.response_class(_merge_prometheus_texts(texts), mimetype='text/plain')
+    resp.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    return resp
+
+
+# ————— 战役分析（对工厂 CSV 增量建立按时间桶的列式汇总，查询不再扫描整个 CSV） —————
+ANALYTICS_BUCKET_SECONDS = max(1, int(os.environ.get('CHILO_DISCO_ANALYTICS_BUCKET', '60')))
+_ANALYTICS_READ_SIZE = 8 << 20
+
+# 来源名 -> CSV key、LLM阶段名、汇总指标（指标名 -> 列名或列名元组，按数值求和，True/False 计为 1/0）、
+# 全时段分组计数（分组名 -> 列名或列名元组，多列时键为 "值1:值2"）。LLM相关指标在各来源中统一命名为 llm_time/up_token/down_token/llm_count。
+ANALYTICS_SOURCES = {
+    'main': {
+        'csv_key': 'MAIN_CSV_PATH', 'stage': '',
+        'metrics': {'random': 'is_by_ramdom', 'error': 'is_error_occur', 'cut': 'is_cut',
+                    'structural': 'is_from_structural_mutator', 'fuzz_use_time': 'fuzz_use_time',
+                    'out_size': 'real_mutate_out_size'},
+        # 变异器编号只在种子内唯一，按 (种子, 变异器) 分组
+        'groups': {'seed': 'real_fuzz_seed_id', 'mutator': ('real_fuzz_seed_id', 'real_mutator_id'), 'arm': 'arm'},
+    },
+    'parser': {
+        'csv_key': 'PARSER_CSV_PATH', 'stage': 'parser',
+        'metrics': {'llm_time': 'LLM_use_time', 'up_token': 'up_token', 'down_token': 'down_token',
+                    'llm_count': 'LLM_count', 'format_error': 'LLM_format_error_count',
+                    'already_parsed': 'is_parsed'},    # is_parsed 为1表示种子此前已经解析过，本次没有调用LLM
+        'groups': {},
+    },
+    'generator': {
+        'csv_key': 'MUTATOR_GENERATOR_CSV_PATH', 'stage': 'generator',
+        'metrics': {'llm_time': 'llm_use_time', 'up_token': 'llm_up_token', 'down_token': 'llm_down_token',
+                    'llm_count': 'llm_count', 'format_error': 'llm_error_count'},
+        'groups': {},
+    },
+    'fixer': {
+        'csv_key': 'MUTATOR_FIXER_CSV_PATH', 'stage': 'fixer',
+        'metrics': {'llm_time': ('syntax_llm_use_time', 'semantic_error_llm_use_time'),
+                    'up_token': ('syntax_up_token', 'semantic_up_token'),
+                    'down_token': ('syntax_down_token', 'semantic_down_token'),
+                    'llm_count': 'all_llm_count', 'fixed': 'at_last_is_all_correct',
+                    'syntax_error': 'syntax_error_count', 'semantic_error': 'semantic_error_count'},
+        'groups': {},
+    },
+    'structural': {
+        'csv_key': 'STRUCTURAL_MUTATOR_CSV_PATH', 'stage': 'structural',
+        'metrics': {'llm_time': 'llm_use_time', 'up_token': 'llm_up_token', 'down_token': 'llm_down_token',
+                    'llm_count': 'llm_count', 'format_error': 'llm_format_error_count',
+                    'requested_variants': 'requested_variant_count', 'accepted_variants': 'accepted_variant_count'},
+        'groups': {},
+    },
+}
+
+# 派生比例：比例名 -> (来源, 分子指标, 分母指标)，分母 rows 为该来源的行数
+ANALYTICS_RATIOS = {
+    'random_ratio': ('main', 'random', 'rows'),
+    'structural_share': ('main', 'structural', 'rows'),
+    'error_ratio': ('main', 'error', 'rows'),
+    'cut_ratio': ('main', 'cut', 'rows'),
+    'fix_success_rate': ('fixer', 'fixed', 'rows'),
+    'already_parsed_ratio': ('parser', 'already_parsed', 'rows'),
+    'parser_format_error_rate': ('parser', 'format_error', 'llm_count'),
+    'variant_accept_rate': ('structural', 'accepted_variants', 'requested_variants'),
+}
+
+ANALYTICS_LLM_METRICS = ['llm_time', 'up_token', 'down_token', 'llm_count']
+
+
+def _csv_number(value: str) -> float:
+    if value == 'True':
+        return 1.0
+    if value in ('False', '', 'None'):
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+class _CsvRollupIndex:
+    """Per-time-bucket column sums and all-time group counts for one factory CSV, extended incrementally.
+
+    Only the bytes appended since the last refresh are parsed. Every header row (the factory appends one on each
+    start) re-maps the columns, so CSVs from older versions with fewer columns still index. A new inode, a
+    shrinking file or changed leading bytes rebuild the index from scratch.
+    """
+
+    def __init__(self, name: str, spec: Dict):
+        self.name = name
+        self.spec = spec
+        self.metric_names = ['rows'] + list(spec['metrics'])
+        self.lock = threading.Lock()
+        self.path = ''
+        self._reset('')
+
+    def _reset(self, path: str):
+        self.path, self.inode, self.offset, self.head = path, None, 0, b''
+        self.buckets: List[int] = []
+        self.columns: Dict[str, List[float]] = {k: [] for k in self.metric_names}
+        self.groups: Dict[str, Dict[str, int]] = {k: {} for k in self.spec['groups']}
+        self.row_count = 0
+        self.bad_rows = 0
+        self.first_time = None
+        self.last_time = None
+        self.header = None
+        self.time_pos, self.metric_pos, self.group_pos = 0, [], []
+        self.refresh_seconds = 0.0
+
+    def _bind_header(self, header: List[str]):
+        """Column positions of every metric/group for the current header; missing columns are skipped."""
+        pos = {name: i for i, name in enumerate(header)}
+        self.header = header
+        self.time_pos = pos.get('real_time', 0)
+        self.metric_pos = []
+        for k, cols in self.spec['metrics'].items():
+            cols = (cols,) if isinstance(cols, str) else cols
+            self.metric_pos.append((self.metric_names.index(k), [pos[c] for c in cols if c in pos]))
+        self.group_pos = []
+        for k, cols in self.spec['groups'].items():
+            cols = (cols,) if isinstance(cols, str) else cols
+            if all(c in pos for c in cols):
+                self.group_pos.append((self.groups[k], [pos[c] for c in cols]))
+
+    def _bucket_slot(self, bucket: int) -> int:
+        # 各线程写入CSV的顺序与 real_time 只是大致一致，绝大多数行落在最后一个桶
+        if self.buckets and self.buckets[-1] == bucket:
+            return len(self.buckets) - 1
+        i = bisect.bisect_left(self.buckets, bucket)
+        if i < len(self.buckets) and self.buckets[i] == bucket:
+            return i
+        self.buckets.insert(i, bucket)
+        for column in self.columns.values():
+            column.insert(i, 0.0)
+        return i
+
+    def _add_rows(self, text: str):
+        columns = [self.columns[k] for k in self.metric_names]
+        rows_column = columns[0]
+        for row in csv.reader(text.splitlines()):
+            if not row:
+                continue
+            if row[0] == 'real_time':
+                self._bind_header(row)
+                continue
+            if self.header is None:     # 表头之前的行无法确定列含义
+                self.bad_rows += 1
+                continue
+            try:
+                real_time = float(row[self.time_pos])
+            except (ValueError, IndexError):
+                self.bad_rows += 1
+                continue
+            slot = self._bucket_slot(int(real_time // ANALYTICS_BUCKET_SECONDS) * ANALYTICS_BUCKET_SECONDS)
+            rows_column[slot] += 1
+            for metric_index, positions in self.metric_pos:
+                columns[metric_index][slot] += sum(_csv_number(row[p]) for p in positions if p < len(row))
+            for counts, positions in self.group_pos:
+                values = [row[p] if p < len(row) else '' for p in positions]
+                if all(v not in ('', 'None') for v in values):
+                    key = ':'.join(values)
+                    counts[key] = counts.get(key, 0) + 1
+            self.row_count += 1
+            if self.first_time is None or real_time < self.first_time:
+                self.first_time = real_time
+            if self.last_time is None or real_time > self.last_time:
+                self.last_time = real_time
+
+    def refresh(self, path: str):
+        with self.lock:
+            if path != self.path:
+                self._reset(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._reset(path)
+                return
+            if (self.inode is not None and st.st_ino != self.inode) or st.st_size < self.offset:
+                self._reset(path)
+            if st.st_size == self.offset:
+                return
+            started = time.time()
+            with open(path, 'rb') as f:
+                head = f.read(64)
+                if head[:len(self.head)] != self.head:
+                    self._reset(path)
+                self.inode, self.head = st.st_ino, head
+                f.seek(self.offset)
+                while self.offset < st.st_size:
+                    data = f.read(min(_ANALYTICS_READ_SIZE, st.st_size - self.offset))
+                    end = data.rfind(b'\n') + 1    # 最后一行可能尚未写完，下次再读
+                    if not end:
+                        break
+                    self._add_rows(data[:end].decode('utf-8', errors='replace'))
+                    self.offset += end
+                    f.seek(self.offset)
+            self.refresh_seconds = time.time() - started
+
+    def meta(self) -> Dict:
+        return {'path': self.path, 'offset': self.offset, 'rows': self.row_count, 'bad_rows': self.bad_rows,
+                'buckets': len(self.buckets), 'first_time': self.first_time, 'last_time': self.last_time,
+                'last_refresh_seconds': round(self.refresh_seconds, 4)}
+
+    def totals(self) -> Dict[str, float]:
+        with self.lock:
+            return {k: sum(column) for k, column in self.columns.items()}
+
+    def series(self, bucket_seconds: int, metrics: List[str], start=None, end=None) -> Tuple[List[int], Dict]:
+        """Re-bucket the base rollup to `bucket_seconds` (a multiple of the base size) within [start, end]."""
+        with self.lock:
+            lo = bisect.bisect_left(self.buckets, start) if start is not None else 0
+            hi = bisect.bisect_right(self.buckets, end) if end is not None else len(self.buckets)
+            out_buckets: List[int] = []
+            out: Dict[str, List[float]] = {k: [] for k in metrics}
+            selected = [(out[k], self.columns[k]) for k in metrics]
+            for i in range(lo, hi):
+                bucket = self.buckets[i] // bucket_seconds * bucket_seconds
+                if not out_buckets or out_buckets[-1] != bucket:
+                    out_buckets.append(bucket)
+                    for target, _ in selected:
+                        target.append(0.0)
+                for target, column in selected:
+                    target[-1] += column[i]
+            return out_buckets, out
+
+    def top(self, group: str, limit: int) -> Tuple[List[Tuple[str, int]], int]:
+        with self.lock:
+            counts = dict(self.groups.get(group, {}))
+        items = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return items[:limit], len(counts)
+
+
+ANALYTICS_INDEXES = {name: _CsvRollupIndex(name, spec) for name, spec in ANALYTICS_SOURCES.items()}
+
+
+def _refresh_analytics(names=None) -> Dict[str, _CsvRollupIndex]:
+    csv_paths = load_csv_paths()
+    indexes = {}
+    for name in (names or ANALYTICS_INDEXES):
+        index = ANALYTICS_INDEXES[name]
+        path = csv_paths.get(index.spec['csv_key'], '')
+        if path:
+            index.refresh(path)
+        indexes[name] = index
+    return indexes
+
+
+def _ratio(numerator: float, denominator: float):
+    return numerator / denominator if denominator else None
+
+
+def _analytics_bucket_arg() -> int:
+    try:
+        seconds = int(float(request.args.get('bucket') or ANALYTICS_BUCKET_SECONDS))
+    except ValueError:
+        seconds = ANALYTICS_BUCKET_SECONDS
+    # 只能合并基础桶，向上取整到基础桶大小的整数倍
+    return max(1, -(-seconds // ANALYTICS_BUCKET_SECONDS)) * ANALYTICS_BUCKET_SECONDS
+
+
+def _analytics_range_args():
+    def _arg(name: str):
+        try:
+            return float(request.args[name]) if request.args.get(name) else None
+        except ValueError:
+            return None
+    return _arg('start'), _arg('end')
+
+
+@app.route('/api/analytics/summary')
+def analytics_summary():
+    indexes = _refresh_analytics()
+    totals = {name: index.totals() for name, index in indexes.items()}
+    ratios = {name: _ratio(totals[source][num], totals[source][den])
+              for name, (source, num, den) in ANALYTICS_RATIOS.items()}
+    llm = {index.spec['stage']: {k: totals[name][k] for k in ANALYTICS_LLM_METRICS}
+           for name, index in indexes.items() if index.spec['stage']}
+    return jsonify({'bucket_seconds': ANALYTICS_BUCKET_SECONDS, 'totals': totals, 'ratios': ratios, 'llm': llm,
+                    'meta': {name: index.meta() for name, index in indexes.items()}})
+
+
+@app.route('/api/analytics/timeseries')
+def analytics_timeseries():
+    """Bucketed sums of one source's metrics plus the ratios derived from that source; `t` is the epoch bucket start."""
+    source = request.args.get('source') or 'main'
+    if source not in ANALYTICS_INDEXES:
+        return abort(404, description='未知的分析来源')
+    index = _refresh_analytics([source])[source]
+    wanted = [k for k in (request.args.get('metrics') or '').split(',') if k in index.metric_names]
+    ratio_specs = {name: (num, den) for name, (src, num, den) in ANALYTICS_RATIOS.items() if src == source}
+    needed = list(dict.fromkeys((wanted or index.metric_names) + [k for pair in ratio_specs.values() for k in pair]))
+    bucket_seconds = _analytics_bucket_arg()
+    start, end = _analytics_range_args()
+    buckets, series = index.series(bucket_seconds, needed, start, end)
+    ratios = {name: [_ratio(n, d) for n, d in zip(series[num], series[den])]
+              for name, (num, den) in ratio_specs.items()}
+    return jsonify({'source': source, 'bucket_seconds': bucket_seconds, 't': buckets,
+                    'series': {k: series[k] for k in (wanted or index.metric_names)}, 'ratios': ratios,
+                    'meta': index.meta()})
+
+
+@app.route('/api/analytics/llm')
+def analytics_llm():
+    """LLM time and tokens per stage on one shared bucket axis (missing buckets are zero)."""
+    indexes = {name: index for name, index in _refresh_analytics().items() if index.spec['stage']}
+    bucket_seconds = _analytics_bucket_arg()
+    start, end = _analytics_range_args()
+    per_stage = {}
+    axis = set()
+    for index in indexes.values():
+        buckets, series = index.series(bucket_seconds, ANALYTICS_LLM_METRICS, start, end)
+        per_stage[index.spec['stage']] = (buckets, series)
+        axis.update(buckets)
+    t = sorted(axis)
+    position = {bucket: i for i, bucket in enumerate(t)}
+    stages = {}
+    for stage, (buckets, series) in per_stage.items():
+        aligned = {k: [0.0] * len(t) for k in ANALYTICS_LLM_METRICS}
+        for k in ANALYTICS_LLM_METRICS:
+            for bucket, value in zip(buckets, series[k]):
+                aligned[k][position[bucket]] = value
+        stages[stage] = aligned
+    return jsonify({'bucket_seconds': bucket_seconds, 't': t, 'stages': stages})
+
+
+@app.route('/api/analytics/top')
+def analytics_top():
+    """Exec counts per seed / mutator (keyed "seed_id:mutator_id") / arm over the whole campaign, largest first."""
+    group = request.args.get('group') or 'seed'
+    index = ANALYTICS_INDEXES['main']
+    if group not in index.groups:
+        return abort(404, description='未知的分组')
+    try:
+        limit = min(10000, max(1, int(request.args.get('limit') or 50)))
+    except ValueError:
+        limit = 50
+    _refresh_analytics(['main'])
+    items, distinct = index.top(group, limit)
+    return jsonify({'group': group, 'distinct': distinct, 'total_rows': index.row_count,
+                    'items': [{'key': k, 'execs': v} for k, v in items]})
+
+
 @app.route('/plot')
 def plot_page():
     # 若存在前端工程构建产物（未来可将 plot 集成 SPA），此处仍回退到服务端模板页
@@ -700,23 +1344,105 @@ def download_log():
     return send_file(p, as_attachment=True, download_name=os.path.basename(p))
 
 
+# ————— 流式 ZIP 下载：边压缩边发送，不在内存中构建整个压缩包 —————
+# 同时进行的压缩包下载数上限，超过时返回 429
+ZIP_DOWNLOAD_SEMAPHORE = threading.BoundedSemaphore(int(os.environ.get('CHILO_DISCO_MAX_ZIP_DOWNLOADS', '2')))
+ZIP_DEFAULT_LEVEL = int(os.environ.get('CHILO_DISCO_ZIP_LEVEL', '6'))
+# 本身已经压缩过的文件只存储不压缩
+_COMPRESSED_EXTS = {'.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.png', '.jpg', '.jpeg', '.gif', '.webp'}
+_ZIP_READ_SIZE = 1 << 20
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file object for zipfile: collects written bytes until the generator drains them."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def _zip_stream(entries, level: int):
+    """Yield the ZIP archive of (file_path, arcname) entries chunk by chunk; unreadable files are skipped."""
+    import zipfile
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED,
+                         compresslevel=level or None) as zf:
+        for file_path, arcname in entries:
+            try:
+                src = open(file_path, 'rb')
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname=arcname)
+            except OSError:
+                continue
+            with src:
+                stored = level == 0 or os.path.splitext(file_path)[1].lower() in _COMPRESSED_EXTS
+                zinfo.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                # Python 3.13 起为公开属性 compress_level
+                setattr(zinfo, 'compress_level' if hasattr(zinfo, 'compress_level') else '_compresslevel',
+                        None if stored else level)
+                with zf.open(zinfo, 'w', force_zip64=True) as dst:
+                    while True:
+                        data = src.read(_ZIP_READ_SIZE)
+                        if not data:
+                            break
+                        dst.write(data)
+                        yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def _walk_entries(folder_path: str, prefix: str = ''):
+    """Lazily list (file_path, arcname) for every file under folder_path."""
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            yield file_path, os.path.join(prefix, os.path.relpath(file_path, folder_path))
+
+
+def _zip_response(entries, download_name: str):
+    """Stream a ZIP download; `level` query parameter 0-9 (0 = store only), at most N concurrent downloads."""
+    try:
+        level = min(9, max(0, int(request.args.get('level', ZIP_DEFAULT_LEVEL))))
+    except ValueError:
+        level = ZIP_DEFAULT_LEVEL
+    if not ZIP_DOWNLOAD_SEMAPHORE.acquire(blocking=False):
+        resp = jsonify({'error': '同时进行的打包下载过多，请稍后重试'})
+        resp.status_code = 429
+        resp.headers['Retry-After'] = '10'
+        return resp
+    try:
+        resp = Response(stream_with_context(_zip_stream(entries, level)), mimetype='application/zip',
+                        headers={'Content-Disposition': f'attachment; filename="{download_name}"',
+                                 'X-Accel-Buffering': 'no'})
+    except Exception:
+        ZIP_DOWNLOAD_SEMAPHORE.release()
+        raise
+    resp.call_on_close(ZIP_DOWNLOAD_SEMAPHORE.release)
+    return resp
+
+
 @app.route('/api/download/csv/zip')
 def download_csv_zip():
-    import zipfile
-    buf = io.BytesIO()
     csv_paths = load_csv_paths()
-    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-        for k, p in csv_paths.items():
-            if p and os.path.exists(p):
-                arcname = os.path.basename(p) or (k + '.csv')
-                try:
-                    zf.write(p, arcname=arcname)
-                except Exception:
-                    # 如果写入失败，写入一个占位文本
-                    zf.writestr(arcname or (k + '.csv'), '')
-    buf.seek(0)
+    entries = [(p, os.path.basename(p) or (k + '.csv')) for k, p in csv_paths.items() if p and os.path.exists(p)]
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(buf, as_attachment=True, download_name=f'chilo_csv_{ts}.zip')
+    return _zip_response(entries, f'chilo_csv_{ts}.zip')
 
 
 def load_file_paths() -> Dict[str, str]:
@@ -769,127 +1495,62 @@ def load_file_paths() -> Dict[str, str]:
 
 @app.route('/api/download/folder/parsed_sql')
 def download_parsed_sql():
-    import zipfile
     file_paths = load_file_paths()
     folder_path = file_paths.get('PARSED_SQL_PATH', '')
     if not folder_path or not os.path.exists(folder_path):
         return abort(404, description='ParsedSQL 文件夹不存在')
-    
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, folder_path)
-                try:
-                    zf.write(file_path, arcname=arcname)
-                except Exception:
-                    pass
-    buf.seek(0)
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(buf, as_attachment=True, download_name=f'chilo_parsed_sql_{ts}.zip')
+    return _zip_response(_walk_entries(folder_path), f'chilo_parsed_sql_{ts}.zip')
 
 
 @app.route('/api/download/folder/generated_mutator')
 def download_generated_mutator():
-    import zipfile
     file_paths = load_file_paths()
     folder_path = file_paths.get('GENERATED_MUTATOR_PATH', '')
     if not folder_path or not os.path.exists(folder_path):
         return abort(404, description='GeneratedMutator 文件夹不存在')
-    
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, folder_path)
-                try:
-                    zf.write(file_path, arcname=arcname)
-                except Exception:
-                    pass
-    buf.seek(0)
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(buf, as_attachment=True, download_name=f'chilo_generated_mutator_{ts}.zip')
+    return _zip_response(_walk_entries(folder_path), f'chilo_generated_mutator_{ts}.zip')
 
 
 @app.route('/api/download/folder/structural_sql')
 def download_structural_sql():
-    import zipfile
     file_paths = load_file_paths()
     folder_path = file_paths.get('STRUCTURAL_MUTATE_PATH', '')
     if not folder_path or not os.path.exists(folder_path):
         return abort(404, description='StructuralMutateSQL 文件夹不存在')
-    
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, folder_path)
-                try:
-                    zf.write(file_path, arcname=arcname)
-                except Exception:
-                    pass
-    buf.seek(0)
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(buf, as_attachment=True, download_name=f'chilo_structural_sql_{ts}.zip')
+    return _zip_response(_walk_entries(folder_path), f'chilo_structural_sql_{ts}.zip')
 
 
 @app.route('/api/download/all')
 def download_all():
-    import zipfile
-    buf = io.BytesIO()
-    
     # 获取所有路径
     csv_paths = load_csv_paths()
     log_paths = load_log_paths()
     file_paths = load_file_paths()
-    
-    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+
+    def entries():
         # CSV文件
         for k, p in csv_paths.items():
             if p and os.path.exists(p):
-                arcname = os.path.join('csv', os.path.basename(p))
-                try:
-                    zf.write(p, arcname=arcname)
-                except Exception:
-                    pass
-        
+                yield p, os.path.join('csv', os.path.basename(p))
         # 日志文件
         for k, p in log_paths.items():
             if p and os.path.exists(p):
-                arcname = os.path.join('logs', os.path.basename(p))
-                try:
-                    zf.write(p, arcname=arcname)
-                except Exception:
-                    pass
-        
+                yield p, os.path.join('logs', os.path.basename(p))
         # 文件夹
         for folder_key in ['PARSED_SQL_PATH', 'GENERATED_MUTATOR_PATH', 'STRUCTURAL_MUTATE_PATH']:
             folder_path = file_paths.get(folder_key, '')
             if folder_path and os.path.exists(folder_path):
-                folder_name = os.path.basename(folder_path.rstrip('/\\'))
-                for root, dirs, files in os.walk(folder_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.join(folder_name, os.path.relpath(file_path, folder_path))
-                        try:
-                            zf.write(file_path, arcname=arcname)
-                        except Exception:
-                            pass
-        
+                yield from _walk_entries(folder_path, os.path.basename(folder_path.rstrip('/\\')))
         # plot_data
         plot_path = _plotdata_path()
         if plot_path and os.path.exists(plot_path):
-            try:
-                zf.write(plot_path, arcname=os.path.join('plot', os.path.basename(plot_path)))
-            except Exception:
-                pass
-    
-    buf.seek(0)
+            yield plot_path, os.path.join('plot', os.path.basename(plot_path))
+
     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-    return send_file(buf, as_attachment=True, download_name=f'chilo_all_output_{ts}.zip')
+    return _zip_response(entries(), f'chilo_all_output_{ts}.zip')
 
 
 if __name__ == '__main__':
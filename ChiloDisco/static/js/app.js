@@ -179,7 +179,52 @@ createApp({
     async function fetchLogs(){
       try{
         const r = await fetch('/api/logs?t='+Date.now(), { cache:'no-store' });
-        const data = await r.json();
+        await renderLogs(await r.json());
+      }catch(e){
+        console.error('fetch logs error', e);
+      }
+    }
+
+    // —— SSE 增量推送：服务端只推送新增行，浏览器不支持或连接被关闭时回退到轮询 /api/logs ——
+    let source = null;
+    const streamLogs = {};
+    const STREAM_KEEP_LINES = 5000;
+
+    function renderStream(){
+      return renderLogs({ now: new Date().toISOString(), logs: streamLogs });
+    }
+
+    function startStream(){
+      if (!window.EventSource) return false;
+      source = new EventSource('/api/logs/stream');
+      source.addEventListener('snapshot', (ev) => {
+        const data = JSON.parse(ev.data);
+        for (const key of Object.keys(streamLogs)) delete streamLogs[key];
+        Object.assign(streamLogs, data.logs || {});
+        renderStream();
+      });
+      source.addEventListener('append', (ev) => {
+        const data = JSON.parse(ev.data);
+        for (const [key, info] of Object.entries(data.logs || {})){
+          const prev = streamLogs[key];
+          const lines = (info.reset || !prev) ? info.lines : prev.lines.concat(info.lines);
+          streamLogs[key] = Object.assign({}, info, { lines: lines.slice(-STREAM_KEEP_LINES) });
+        }
+        renderStream();
+      });
+      source.onerror = () => {
+        // 连接断开时 EventSource 会自动重连；只有被关闭（如服务端不支持）时才回退到轮询
+        if (source && source.readyState === EventSource.CLOSED){
+          source = null;
+          fetchLogs();
+          start();
+        }
+      };
+      return true;
+    }
+
+    async function renderLogs(data){
+      try{
         const now = new Date(data.now);
         const nowIso = data.now;
         const logs = data.logs || {};
@@ -251,25 +296,26 @@ createApp({
 
         bindScrollHandlers();
       }catch(e){
-        console.error('fetch logs error', e);
+        console.error('render logs error', e);
       }
     }
 
     function start(){
       stop();
-      timer = setInterval(fetchLogs, interval.value);
+      // 推送模式下定时器只在本地重新着色，不再请求服务端
+      timer = setInterval(() => source ? renderStream() : fetchLogs(), interval.value);
     }
     function stop(){ if (timer) { clearInterval(timer); timer=null; } }
 
     watch(interval, () => start());
-    watch(maxLines, () => fetchLogs());
+    watch(maxLines, () => source ? renderStream() : fetchLogs());
 
     onMounted(() => {
-      fetchLogs();
+      if (!startStream()) fetchLogs();
       start();
       // 移除 computeVisibleRows，避免未定义导致错误；如需在窗口变化时刷新，可仅调用 fetchLogs。
       window.addEventListener('resize', () => {
-        fetchLogs();
+        source ? renderStream() : fetchLogs();
       });
     });
 
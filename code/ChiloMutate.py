@@ -1,11 +1,25 @@
+import os
 import time
 
 from ChiloMutatorFactory import chilo_factory as cf
-import threading
-from ChiloMutatorFactory import LLMParser,LLMMutatorGenerater,LLMStructuralMutator,mutator_fixer
+from ChiloMutatorFactory import factory_service, workers, squirrel_arm, sql_trimmer, mutator_runtime, profiler
 
 
 chilo_factory: cf.ChiloFactory | None = None
+# 设置了 CHILO_FACTORY_SOCKET 时，工厂运行在独立的守护进程中（chilo_daemon.py），这里只作为客户端
+factory_client: factory_service.FactoryClient | None = None
+current_seed_id = -1
+# 设置了 CHILO_SQUIRREL_LIB 时，Squirrel作为一个变异臂在进程内加载，与Chilo按实测产出率分配执行次数
+squirrel_mutator: squirrel_arm.SquirrelMutator | None = None
+arm_scheduler: squirrel_arm.ArmScheduler | None = None
+# AFL剪裁队列项时使用的SQL剪裁器（start_fuzz.py 中 TRIM 打开后AFL才会调用剪裁函数）
+trimmer = sql_trimmer.SqlTrimmer(int(os.environ.get("CHILO_TRIM_MAX_STEPS", 128)))
+# 设置了 CHILO_PROFILE_DIR 时可按需采样分析本进程（SIGUSR2 或修改该目录下的 profile.request），平时不采样
+hot_path_profiler: profiler.SamplingProfiler | None = None
+# 产生上一个测试用例的变异器 (seed_id, mutator_id)，AFL把它加入队列时计入该变异器的发现次数
+last_mutator_key = None
+# 上一次fuzz()返回的测试用例（只保存引用），新队列项的内容与它相同时才记功，同步导入、校准等队列项不是它产生的
+last_testcase = None
 fuzz_count_number = 0
 fuzz_number = 0
 
@@ -18,57 +32,51 @@ def init(seed):
     """
 
     global chilo_factory
+    global factory_client
+    global squirrel_mutator
+    global arm_scheduler
+    global hot_path_profiler
+    squirrel_lib_path = os.environ.get("CHILO_SQUIRREL_LIB")
+    if squirrel_lib_path:
+        squirrel_mutator = squirrel_arm.SquirrelMutator(squirrel_lib_path, os.environ["SQUIRREL_CONFIG"], seed)
+        arm_scheduler = squirrel_arm.ArmScheduler([squirrel_arm.ARM_CHILO, squirrel_arm.ARM_SQUIRREL],
+                                                  min_share=float(os.environ.get("CHILO_ARM_MIN_SHARE", 0.05)))
+    factory_socket_path = os.environ.get("CHILO_FACTORY_SOCKET")
+    if factory_socket_path:
+        factory_client = factory_service.FactoryClient(
+            factory_socket_path,
+            prefetch_count=int(os.environ.get("CHILO_PREFETCH_COUNT", 32)),
+            report_batch_size=int(os.environ.get("CHILO_REPORT_BATCH_SIZE", 64)))
+        # CHILO_FACTORY_TRANSPORT=shm 时测试用例通过共享内存环传递，套接字只用于fuzz_count与执行记录
+        if os.environ.get("CHILO_FACTORY_TRANSPORT", "socket") == "shm":
+            factory_client.open_ring(int(os.environ.get("CHILO_RING_SLOTS", 256)),
+                                     int(os.environ.get("CHILO_RING_SLOT_SIZE", 65536)))
+        hot_path_profiler = _start_profiler(None)
+        return 0
+
     chilo_factory = cf.ChiloFactory()   #首先初始化整个工厂（读配置文件）
     chilo_factory.main_logger.info("Chilo工厂初始化成功！")
-    
-    # 计算总线程数
-    total_threads = (chilo_factory.parser_thread_count + 
-                    chilo_factory.mutator_generator_thread_count + 
-                    chilo_factory.structural_mutator_thread_count + 
-                    chilo_factory.fixer_thread_count)
-    chilo_factory.main_logger.info(f"Chilo工厂准备启动{total_threads}个子线程")
-    
-    # 启动多个Parser线程
-    chilo_factory.main_logger.info(f"Chilo工厂启动解析器中~（共{chilo_factory.parser_thread_count}个线程）")
-    parser_threads = []
-    for i in range(chilo_factory.parser_thread_count):
-        parser_t = threading.Thread(target=LLMParser.chilo_parser, args=(chilo_factory,))
-        parser_t.start()
-        parser_threads.append(parser_t)
-        chilo_factory.main_logger.info(f"解析器[线程{i}]启动成功")
-    
-    # 启动多个Mutator Generator线程
-    chilo_factory.main_logger.info(f"Chilo工厂启动变异器生成器中~（共{chilo_factory.mutator_generator_thread_count}个线程）")
-    generator_threads = []
-    for i in range(chilo_factory.mutator_generator_thread_count):
-        generator_t = threading.Thread(target=LLMMutatorGenerater.chilo_mutator_generator, args=(chilo_factory,))
-        generator_t.start()
-        generator_threads.append(generator_t)
-        chilo_factory.main_logger.info(f"变异器生成器[线程{i}]启动成功")
-    
-    # 启动多个Structural Mutator线程
-    chilo_factory.main_logger.info(f"Chilo工厂启动结构化变异器中~（共{chilo_factory.structural_mutator_thread_count}个线程）")
-    structural_threads = []
-    for i in range(chilo_factory.structural_mutator_thread_count):
-        structural_t = threading.Thread(target=LLMStructuralMutator.structural_mutator, args=(chilo_factory,))
-        structural_t.start()
-        structural_threads.append(structural_t)
-        chilo_factory.main_logger.info(f"结构化变异器[线程{i}]启动成功")
-    
-    # 启动多个Fixer线程
-    chilo_factory.main_logger.info(f"Chilo工厂启动变异器修复器中~（共{chilo_factory.fixer_thread_count}个线程）")
-    fixer_threads = []
-    for i in range(chilo_factory.fixer_thread_count):
-        fixer_t = threading.Thread(target=mutator_fixer.fix_mutator, args=(chilo_factory, i))
-        fixer_t.start()
-        fixer_threads.append(fixer_t)
-        chilo_factory.main_logger.info(f"变异器修复器[线程{i}]启动成功")
-    
+    workers.start_workers(chilo_factory)
+    hot_path_profiler = _start_profiler(chilo_factory.main_logger)
     chilo_factory.main_logger.info("初始化完成，结束初始化~")
 
 
     return 0
 
+def _start_profiler(main_logger):
+    """
+    安装按需采样分析器的触发方式，没有设置 CHILO_PROFILE_DIR 时不启用
+    """
+    profile_dir = os.environ.get("CHILO_PROFILE_DIR")
+    if not profile_dir:
+        return None
+    sampling_profiler = profiler.SamplingProfiler(profile_dir, f"afl_{os.environ.get('CHILO_INSTANCE_ID') or 'main'}",
+                                                  float(os.environ.get("CHILO_PROFILE_INTERVAL", 0.005)),
+                                                  float(os.environ.get("CHILO_PROFILE_DURATION", 30)), main_logger)
+    sampling_profiler.install_signal()
+    sampling_profiler.watch_control_file()
+    return sampling_profiler
+
 def fuzz_count(buf):
     """
     能量调度函数，决定一个种子调用多少次的fuzz()
@@ -81,6 +89,10 @@ def fuzz_count(buf):
     mutate_time = 64
     #应该采用队列的设计，先放入工厂的队列中，等待加工
     global chilo_factory
+    global current_seed_id
+    if factory_client is not None:
+        current_seed_id = factory_client.fuzz_count(buf, mutate_time)
+        return mutate_time
     chilo_factory.main_logger.info("进入fuzz_count~")
     chilo_factory.main_logger.info("准备将buf中种子加入到待解析队列中~")
     chilo_factory.add_one_seed_to_parse_list(buf, mutate_time)
@@ -107,8 +119,12 @@ def fuzz(buf, add_buf, max_size):
     global chilo_factory
     global fuzz_number
     global fuzz_count_number
+    global last_mutator_key
+    global last_testcase
     fuzz_number += 1
     is_cut = False
+    last_mutator_key = None
+    last_testcase = None
     #思路：
     #其实整个变异的返回值的获取，就是读文件，将文件内容作为返回值即可
     #这里应该启用一次LLM生成的程序，并将程序生成的SQL测试用例作为返回值，这样可以不用记录次数...
@@ -120,21 +136,41 @@ def fuzz(buf, add_buf, max_size):
     #下一步呢，其实变异阶段有两部分，分别是掩码解析和掩码变异... 到这里已经完成了解析，直接变异就好
 
     #这里应该只需要做一件事就行，那就是启动LLM生成的变异程序，并获得一个SQL！
+    if arm_scheduler is not None and arm_scheduler.choose() == squirrel_arm.ARM_SQUIRREL:
+        return _fuzz_by_squirrel(buf, max_size, fuzz_start_time)
+    if factory_client is not None:
+        if factory_client.ring_config is not None:
+            mutated_out, ori_mutate_out_size, is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator = \
+                factory_client.next_testcase_from_ring(max_size)
+        else:
+            mutated_out, is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator = \
+                factory_client.next_testcase(max_size)
+            mutated_out = bytearray(mutated_out)
+            ori_mutate_out_size = len(mutated_out)
+        cut_mode = mutator_runtime.fit_testcase(mutated_out, max_size, ori_mutate_out_size)
+        is_cut = cut_mode != mutator_runtime.CUT_NONE
+        if mutator_id is not None:
+            last_mutator_key = (seed_id, mutator_id)
+        fuzz_end_time = time.time()
+        factory_client.report((fuzz_end_time, is_random, fuzz_end_time - fuzz_start_time, current_seed_id, seed_id,
+                               mutator_id, factory_client.left_wait_exec_queue_count, ori_mutate_out_size,
+                               len(mutated_out), is_cut, is_error_occur, is_from_structural_mutator,
+                               squirrel_arm.ARM_CHILO, cut_mode))
+        last_testcase = mutated_out
+        return mutated_out
     chilo_factory.main_logger.info("进入fuzz阶段~")
     chilo_factory.main_logger.info("准备调用mutator生成")
-    mutated_out,is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator = chilo_factory.mutate_once()
+    mutated_out,is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator = chilo_factory.mutate_once(max_size)
     chilo_factory.main_logger.info("变异完成")
-    # 确保类型正确
-    if isinstance(mutated_out, str):
-        mutated_out = bytearray(mutated_out, "utf-8", errors="ignore")
-        # 检查并截断
+    if mutator_id is not None:
+        last_mutator_key = (seed_id, mutator_id)
 
+    # 变异器已经按max_size控制长度，仍然超长时在最后一个完整语句处原地截断
     ori_mutate_out_size = len(mutated_out)
-
-    if len(mutated_out) > max_size:
+    cut_mode = mutator_runtime.fit_testcase(mutated_out, max_size)
+    if cut_mode != mutator_runtime.CUT_NONE:
         is_cut = True
-        mutated_out = mutated_out[:max_size]
-        chilo_factory.main_logger.warning("由于变异结果过长，被迫进行截断")
+        chilo_factory.main_logger.warning(f"由于变异结果过长，被迫进行截断（截断方式：{cut_mode}）")
     real_mutate_out_size = len(mutated_out)
     now_seed_id = chilo_factory.all_seed_list.index_of_seed_buf(buf)
 
@@ -142,11 +178,78 @@ def fuzz(buf, add_buf, max_size):
     chilo_factory.write_main_csv(fuzz_end_time, fuzz_count_number, fuzz_number,
                                  is_random, fuzz_end_time - fuzz_start_time, now_seed_id, seed_id, mutator_id,
                                  chilo_factory.wait_exec_mutator_list.qsize(), ori_mutate_out_size,
-                                 real_mutate_out_size, is_cut, is_error_occur, is_from_structural_mutator)
+                                 real_mutate_out_size, is_cut, is_error_occur, is_from_structural_mutator,
+                                 squirrel_arm.ARM_CHILO, cut_mode)
+    last_testcase = mutated_out
     return mutated_out
 
+def _fuzz_by_squirrel(buf, max_size, fuzz_start_time):
+    """
+    由Squirrel臂产生本次的测试用例，并照常记录到主CSV中（arm列为squirrel）
+    """
+    global last_testcase
+    mutated_out = squirrel_mutator.fuzz(buf, max_size)
+    last_testcase = mutated_out
+    fuzz_end_time = time.time()
+    if factory_client is not None:
+        factory_client.report((fuzz_end_time, None, fuzz_end_time - fuzz_start_time, current_seed_id, None, None,
+                               factory_client.left_wait_exec_queue_count, len(mutated_out), len(mutated_out),
+                               False, False, False, squirrel_arm.ARM_SQUIRREL, mutator_runtime.CUT_NONE))
+    else:
+        chilo_factory.write_main_csv(fuzz_end_time, fuzz_count_number, fuzz_number, None,
+                                     fuzz_end_time - fuzz_start_time, chilo_factory.all_seed_list.index_of_seed_buf(buf),
+                                     None, None, chilo_factory.wait_exec_mutator_list.qsize(), len(mutated_out),
+                                     len(mutated_out), False, False, False, squirrel_arm.ARM_SQUIRREL)
+    return mutated_out
+
+def queue_new_entry(filename_new_queue, filename_orig_queue):
+    """
+    有新的种子加入队列后AFL++会调用这个函数
+    把这次发现记在产生上一个测试用例的变异器上（用于变异器池的淘汰）；
+    启用Squirrel臂时，同时记在产生它的臂上，并把新种子交给Squirrel
+    只有新队列项的内容就是上一个测试用例时才记功，其他实例同步来的、校准阶段加入的队列项不记功
+    :return: False，表示没有修改新种子
+    """
+    global last_testcase
+    if _is_last_testcase(filename_new_queue):
+        last_testcase = None    # 同一个测试用例只记一次
+        if last_mutator_key is not None:
+            if factory_client is not None:
+                factory_client.credit(*last_mutator_key)
+            else:
+                chilo_factory.mutator_pool.credit_find(*last_mutator_key)
+        if arm_scheduler is not None:
+            arm_scheduler.credit_last()
+    if arm_scheduler is not None:
+        squirrel_mutator.queue_new_entry(filename_new_queue, filename_orig_queue)
+    return False
+
+def _is_last_testcase(filename_new_queue):
+    """
+    :return: 新队列项的内容是否与上一次fuzz()返回的测试用例相同（先比较长度，相同时才读文件）
+    """
+    if last_testcase is None:
+        return False
+    try:
+        if os.path.getsize(filename_new_queue) != len(last_testcase):
+            return False
+        with open(filename_new_queue, "rb") as f:
+            return f.read() == bytes(last_testcase)
+    except OSError:
+        return False
+
 #当AFL++停止或结束的时候调用该函数，进行清理
 def deinit():  # optional for Python
+    if squirrel_mutator is not None:
+        squirrel_mutator.deinit()
+        if chilo_factory is not None:
+            chilo_factory.main_logger.info(f"各变异臂的执行与发现次数：{arm_scheduler.summary()}")
+    if factory_client is not None:
+        factory_client.close()
+        return
+    chilo_factory.main_logger.info(f"变异器池状态：{chilo_factory.mutator_pool.stats()}")
+    if chilo_factory.tracer.enabled:
+        chilo_factory.tracer.write()
     chilo_factory.main_logger.info("FUZZ结束！祝您早日找到CVE！！")
     pass
 # def describe(max_description_length):
@@ -167,15 +270,30 @@ def deinit():  # optional for Python
 #     """
 #     return out_buf
 
-#下面三个函数都是修剪相关的函数，即得到最小化输入，在DBMS模糊测试中不需要，因此被注释
-# def init_trim(buf):
-#     return cnt
-#
-# def trim():
-#     return out_buf
-#
-# def post_trim(success):
-#     return next_index
+def init_trim(buf):
+    """
+    AFL开始剪裁一个新的队列项时调用
+    :param buf: 队列项内容
+    :return: 剪裁步数上限，0表示不剪裁
+    """
+    return trimmer.init(buf)
+
+def trim():
+    """
+    :return: 本步的剪裁结果，AFL执行后通过post_trim告知覆盖率是否不变
+    """
+    return trimmer.trim()
+
+def post_trim(success):
+    """
+    :param success: 剪裁结果是否被AFL接受
+    :return: 下一步的序号
+    """
+    next_index = trimmer.post_trim(success)
+    if next_index >= trimmer.max_steps and chilo_factory is not None:
+        chilo_factory.main_logger.info(f"剪裁完成：{trimmer.ori_size} -> {trimmer.size} 字节，"
+                                       f"共{trimmer.step}步，成功{trimmer.success_count}步")
+    return next_index
 
 
 #下面两个函数都是自定义havoc变异及其概率，在启动AFL_CUSTOM_MUTATOR_ONLY=1时，该函数将不起作用，因此被注释
@@ -193,11 +311,6 @@ def deinit():  # optional for Python
 # def fuzz_send(buf):
 #     pass
 
-# # 有新的种子加入测试用例后会调用这个函数，可以对种子进行处理，但本方法不需要该函数
-# def queue_new_entry(filename_new_queue, filename_orig_queue):
-#
-#     return False
-
 # #返回一个字符串，用于描述变异方法的，不需要
 # def introspection():
 #     return string
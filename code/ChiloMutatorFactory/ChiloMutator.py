@@ -6,48 +6,267 @@
 2. 一个变异器
 3. 一个任务队列
 """
+import heapq
+import os
 import random
-from typing import List
+import shutil
+import threading
+import time
+from typing import Dict, List
 
 
 #先定义变异器
 
 class ChiloMutator:
-    def __init__(self, file_path, seed_id, mutator_id, mutator_index):
+    def __init__(self, file_path, seed_id, mutator_id, mutator_index, native=None, file_name=None):
         """
         初始化一个变异器池，其中具有一些属性
+        :param native: 本地编译的变异器对象（如模板变异器），不为None时直接调用其mutate()而不加载文件
+        :param file_name: 变异器文件的完整路径（如共享存储中其他实例发布的变异器），为None时按编号拼接
         """
         self.seed_id = seed_id
         self.mutator_id = mutator_id
         self.mutator_index = mutator_index
-        self.file_name = f"{file_path}{seed_id}_{mutator_id}.py"
-        self.is_error = False   #是否在最终的FUZZ出现了错误
-        self.last_error_count = 0   #如果出现了最终FUZZ错误则加1...不过好像没啥用
+        self.file_name = file_name if file_name is not None else f"{file_path}{seed_id}_{mutator_id}.py"
+        self.is_error = False   #是否在最终的FUZZ出现了错误（处于退避等待或已被禁用）
+        self.last_error_count = 0   #连续出错的次数，成功变异一次后清零
+        self.total_error_count = 0  #累计出错的次数
+        self.is_disabled = False    #连续出错次数达到上限后不再重试
+        self.native = native
+        self.module = None  # 已加载的变异器模块，只加载一次
+        self.batch_cache = []   # 批量生成后尚未使用的变异结果
+        self.is_evicted = False     #因变异器池容量不足被淘汰
+        self.created_time = time.time()
+        self.exec_count = 0         #产出并交给AFL执行的测试用例个数
+        self.find_count = 0         #其测试用例被AFL加入队列的次数
+        self.mutate_use_time = 0.0  #调用变异器的累计用时（秒）
+
+    def value_score(self):
+        """
+        变异器的价值，用于容量不足时决定淘汰谁（越小越先淘汰）
+        产出率 (发现+1)/(执行+100) 带先验，执行越多先验影响越小，老而无产出的变异器分数逐渐下降；
+        乘以未出错的比例，除以每个测试用例的生成开销（毫秒）
+        """
+        yield_rate = (self.find_count + 1) / (self.exec_count + 100)
+        error_rate = self.total_error_count / (self.exec_count + self.total_error_count + 1)
+        cost_ms = self.mutate_use_time * 1000 / max(1, self.exec_count)
+        return yield_rate * (1 - error_rate) / (1 + cost_ms)
 
 class ChiloMutatorPool:
-    def __init__(self, file_path):
+    def __init__(self, file_path, retry_base=30, retry_max=1800, max_error_count=5, capacity=0, per_seed_cap=0,
+                 evict_min_age=300):
         """
         初始化一个变异器池，用于保存所有变异器
+        可被随机选择的健康变异器保存在 healthy_list 中（删除时与末尾元素交换，healthy_position 记录每个变异器的位置），
+        出错的变异器移出健康集合，按指数退避在 retry_heap 中等待重新加入
+        存活的变异器超过 capacity 个或同一种子超过 per_seed_cap 个时，淘汰价值最低的一个：
+        从 mutators 中删除，释放已加载的模块与缓存的变异结果，释放锁之后再把变异器文件移入 archive 目录
+        :param retry_base: 第一次出错后的退避时间（秒），之后每次连续出错翻倍
+        :param retry_max: 退避时间上限（秒）
+        :param max_error_count: 连续出错达到该次数后禁用，不再重试
+        :param capacity: 存活变异器个数上限，不大于0时不限制
+        :param per_seed_cap: 每个种子的存活变异器个数上限，不大于0时不限制
+        :param evict_min_age: 按总容量淘汰时，创建不足该时间（秒）的变异器不参与淘汰
         """
-        self.mutator_list:List[ChiloMutator] = []
+        self.mutators: Dict[int, ChiloMutator] = {}    # 变异器下标 -> 存活的变异器，下标只增不复用
         self.next_mutator_index = 0
         self.file_path = file_path
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_error_count = max_error_count
+        self.healthy_list: List[int] = []   # 健康变异器的下标
+        self.healthy_position = {}          # 变异器下标 -> 在 healthy_list 中的位置
+        self.retry_heap = []                # (重新加入的时间, 变异器下标)
+        self.lock = threading.Lock()
+        self.error_fallback_count = 0   # 因变异器出错而改用其他变异器的执行次数
+        self.skipped_task_count = 0     # 因变异器不健康而跳过的待执行任务数
+        self.retry_count = 0            # 退避结束后重新加入健康集合的次数
+        self.disabled_count = 0         # 被禁用的变异器个数
+        self.capacity = capacity
+        self.per_seed_cap = per_seed_cap
+        self.evict_min_age = evict_min_age
+        self.archive_path = os.path.join(file_path, "archive")
+        self.live_count = 0
+        self.seed_live = {}     # 种子id -> 该种子存活变异器的下标集合
+        self.id_index = {}      # (种子id, 变异器编号) -> 变异器下标
+        self.evicted_count = 0  # 被淘汰的变异器个数
+
+    def add_mutator(self, seed_id, mutator_id, native=None, file_name=None):
+        """
+        :return: 新加入的变异器对象（它本身不会被这次加入引起的淘汰选中）
+        """
+        archive_files = []
+        with self.lock:
+            mutator_index = self.next_mutator_index
+            mutator = ChiloMutator(self.file_path, seed_id, mutator_id, mutator_index, native, file_name)
+            self.mutators[mutator_index] = mutator
+            self._add_healthy(mutator_index)
+            self.next_mutator_index += 1
+            self.live_count += 1
+            self.seed_live.setdefault(seed_id, set()).add(mutator_index)
+            self.id_index[(seed_id, mutator_id)] = mutator_index
+            if self.per_seed_cap > 0 and len(self.seed_live[seed_id]) > self.per_seed_cap:
+                archive_files.append(self._evict_lowest(self.seed_live[seed_id] - {mutator_index}, 0))
+            if self.capacity > 0 and self.live_count > self.capacity:
+                archive_files.append(self._evict_lowest(self.mutators.keys() - {mutator_index}, self.evict_min_age))
+        self._archive(archive_files)
+        return mutator
+
+    def _evict_lowest(self, candidates, min_age):
+        """
+        淘汰候选中价值最低的一个变异器；模板变异器（本地编译，每个种子一个）与新创建的变异器不参与
+        :return: 需要归档的变异器文件，没有时返回None
+        """
+        now = time.time()
+        victim = None
+        for mutator_index in candidates:
+            mutator = self.mutators[mutator_index]
+            if mutator.native is not None or now - mutator.created_time < min_age:
+                continue
+            if victim is None or mutator.value_score() < victim.value_score():
+                victim = mutator
+        if victim is not None:
+            return self._evict(victim)
+        return None
+
+    def _evict(self, mutator: ChiloMutator):
+        """
+        在持有锁时调用，只修改内存中的状态
+        :return: 需要归档的变异器文件，由调用者释放锁之后交给 _archive()；没有时返回None
+        """
+        self._remove_healthy(mutator.mutator_index)
+        del self.mutators[mutator.mutator_index]
+        self.live_count -= 1
+        self.seed_live[mutator.seed_id].discard(mutator.mutator_index)
+        if self.id_index.get((mutator.seed_id, mutator.mutator_id)) == mutator.mutator_index:
+            del self.id_index[(mutator.seed_id, mutator.mutator_id)]
+        mutator.is_evicted = True
+        mutator.module = None
+        mutator.batch_cache = []
+        self.evicted_count += 1
+        # 只归档本实例生成的文件，共享存储中的文件由发布它的实例管理
+        if mutator.native is None and \
+                os.path.dirname(os.path.abspath(mutator.file_name)) == os.path.abspath(self.file_path):
+            return mutator.file_name
+        return None
+
+    def _archive(self, archive_files):
+        """
+        把被淘汰的变异器文件移入 archive 目录；在锁外调用，避免选择变异器时等待文件操作
+        """
+        for file_name in archive_files:
+            if file_name is None or not os.path.exists(file_name):
+                continue
+            try:
+                os.makedirs(self.archive_path, exist_ok=True)
+                shutil.move(file_name, os.path.join(self.archive_path, os.path.basename(file_name)))
+            except OSError:
+                pass    # 归档失败不影响变异器池，文件留在原处
+
+    def _add_healthy(self, mutator_index):
+        self.healthy_position[mutator_index] = len(self.healthy_list)
+        self.healthy_list.append(mutator_index)
+
+    def _remove_healthy(self, mutator_index):
+        position = self.healthy_position.pop(mutator_index, None)
+        if position is None:
+            return
+        last_index = self.healthy_list.pop()
+        if last_index != mutator_index:
+            self.healthy_list[position] = last_index
+            self.healthy_position[last_index] = position
+
+    def _release_due_retries(self):
+        now = time.time()
+        while self.retry_heap and self.retry_heap[0][0] <= now:
+            _, mutator_index = heapq.heappop(self.retry_heap)
+            if mutator_index not in self.mutators:
+                continue    # 退避期间被淘汰
+            self.mutators[mutator_index].is_error = False
+            self._add_healthy(mutator_index)
+            self.retry_count += 1
 
-    def add_mutator(self, seed_id, mutator_id):
-        self.mutator_list.append(ChiloMutator(self.file_path, seed_id, mutator_id, self.next_mutator_index))
-        self.next_mutator_index += 1
-        return self.next_mutator_index - 1
+    def is_healthy(self, mutator: ChiloMutator):
+        return mutator.mutator_index in self.healthy_position
 
+    def mark_error(self, mutator: ChiloMutator):
+        """
+        变异器出错：移出健康集合，连续出错次数未达上限时按指数退避安排重试，否则禁用
+        """
+        archive_file = None
+        with self.lock:
+            mutator.is_error = True
+            mutator.last_error_count += 1
+            mutator.total_error_count += 1
+            mutator.batch_cache = []
+            if mutator.mutator_index not in self.healthy_position:
+                return  # 已经在退避中（例如同一变异器的多个任务先后出错）
+            self._remove_healthy(mutator.mutator_index)
+            if mutator.last_error_count >= self.max_error_count:
+                mutator.is_disabled = True
+                self.disabled_count += 1
+                archive_file = self._evict(mutator)    # 禁用的变异器不再占用容量
+            else:
+                delay = min(self.retry_max, self.retry_base * 2 ** (mutator.last_error_count - 1))
+                heapq.heappush(self.retry_heap, (time.time() + delay, mutator.mutator_index))
+        self._archive([archive_file])
+
+    def mark_success(self, mutator: ChiloMutator):
+        """
+        变异器成功产出一批结果，连续出错次数清零
+        """
+        mutator.last_error_count = 0
+
+    def credit_find(self, seed_id, mutator_id):
+        """
+        AFL把该变异器产生的测试用例加入了队列
+        """
+        with self.lock:
+            mutator_index = self.id_index.get((seed_id, mutator_id))
+            if mutator_index is not None:
+                self.mutators[mutator_index].find_count += 1
+
+    def seed_mutators(self, seed_id):
+        """
+        :return: 该种子当前健康的变异器列表
+        """
+        with self.lock:
+            return [self.mutators[mutator_index] for mutator_index in self.seed_live.get(seed_id, ())
+                    if mutator_index in self.healthy_position]
 
+    def seed_live_mutators(self, seed_id):
+        """
+        :return: 该种子所有存活的文件变异器（包括正在退避的，不包括模板变异器）
+        """
+        with self.lock:
+            return [self.mutators[mutator_index] for mutator_index in self.seed_live.get(seed_id, ())
+                    if self.mutators[mutator_index].native is None]
+
+    def seed_is_full(self, seed_id):
+        """
+        :return: 该种子的存活变异器是否已达到 per_seed_cap
+        """
+        return self.per_seed_cap > 0 and len(self.seed_live.get(seed_id, ())) >= self.per_seed_cap
 
     def random_select_mutator(self):
         """
-        从变异器池中随机选择一个
-        :return: 返回的变异器对象
+        从健康的变异器中均匀随机选择一个
+        :return: 返回的变异器对象，没有健康的变异器时返回None
         """
-        if self.next_mutator_index == 0:    #说明还没有变异器呢，要稍微等一会
-            return None
-        else:
-            num = random.randint(0, self.next_mutator_index - 1)
-            return self.mutator_list[num]
+        with self.lock:
+            if self.retry_heap:
+                self._release_due_retries()
+            if not self.healthy_list:    #说明还没有（健康的）变异器呢，要稍微等一会
+                return None
+            return self.mutators[self.healthy_list[random.randrange(len(self.healthy_list))]]
 
+    def stats(self):
+        """
+        :return: 容量、健康集合与出错回退相关的计数
+        """
+        with self.lock:
+            return {"mutator_count": self.next_mutator_index, "live_count": self.live_count,
+                    "evicted_count": self.evicted_count, "healthy_count": len(self.healthy_list),
+                    "backoff_count": len(self.retry_heap), "disabled_count": self.disabled_count,
+                    "retry_count": self.retry_count, "error_fallback_count": self.error_fallback_count,
+                    "skipped_task_count": self.skipped_task_count}
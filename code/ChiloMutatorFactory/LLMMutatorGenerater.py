@@ -2,8 +2,10 @@
 这个函数用于对已经解析结束的SQL，使用LLM
 生成对应的变异器
 """
+import random
 import time
 from .chilo_factory import ChiloFactory
+from . import shared_store
 
 
 def  _get_constant_mutator_prompt(parsed_sql:str, target_dbms, dbms_version):
@@ -140,13 +142,26 @@ MASKS = {{
     # ... all masks
 }}
 
-def mutate() -> str:
+# SQL text split around the masks once, at import time
+SEGMENTS = [...]  # len(SEGMENTS) == len(MASKS) + 1
+
+def mutate(max_size: int = None) -> str:
     \"\"\"
     Generate one mutated SQL statement.
+    max_size: Optional length budget in characters (None means unlimited).
     Returns: Complete SQL string with all masks replaced.
     \"\"\"
     # Implementation here
     pass
+
+def mutate_batch(n: int, max_size: int = None) -> list:
+    \"\"\"
+    Generate n mutated SQL statements in one call.
+    max_size: Optional length budget in characters for each output (None means unlimited).
+    Returns: A list of n complete SQL strings.
+    \"\"\"
+    # Implementation here
+    pass
 ```
 
 ### Mutation Logic
@@ -163,6 +178,20 @@ def mutate() -> str:
    - Unselected masks → original values
 4. **Return valid SQL**: Ensure proper quoting for strings, correct syntax
 
+### Batch Entry Point
+
+`mutate_batch(n)` is called on the fuzzing hot path, so make it cheaper than calling `mutate()` n times:
+- Draw the random decisions for all n outputs together (e.g. `random.choices(candidates, k=count)` per mask)
+- Assemble each output by joining the pre-split `SEGMENTS` with the chosen values (`''.join(...)`), never by re-scanning the SQL text
+- Every returned string must follow the same mutation rules as `mutate()`
+
+### Size Budget
+
+When `max_size` is given, every returned string must fit in it. Anything longer is truncated before execution:
+- Size huge values (long strings, repeated patterns, big hex blobs) to the remaining budget instead of building them and throwing them away
+- Prefer SQL functions such as `zeroblob(N)`, `randomblob(N)` or `printf('%.*c', N, 'a')` to make large values, so the text stays short
+- If an output would still be too long, fall back to the original value for the largest mutated masks
+
 ### Code Quality
 
 - Use **only Python standard library** (random, struct, re, etc.)
@@ -213,6 +242,7 @@ Create a Python module that implements aggressive, crash-inducing mutations for
 
 **Remember**:
 - High diversity (different output each time)
+- Provide both `mutate()` and `mutate_batch(n)`
 - Include AFL-style binary mutations (bit flip, interesting values)
 - Target known vulnerability patterns
 - Balance fixed candidates (40%), AFL mutations (40%), and random mutations (20%)
@@ -229,8 +259,35 @@ def chilo_mutator_generator(my_chilo_factory: ChiloFactory):
         llm_error_count = 0
         my_chilo_factory.mutator_generator_logger.info("接收变异器生成任务中~")
         generate_target = my_chilo_factory.wait_mutator_generate_list.get()    #拿一个需要生成变异器的
+        my_chilo_factory.tracer.dequeue("generate", generate_target)
         my_chilo_factory.mutator_generator_logger.info(f"变异器生成任务接收完毕 任务目标   seed_id：{generate_target['seed_id']}    变异次数：{generate_target['mutate_time']}")
         mutate_time = generate_target['mutate_time']
+        is_warmup = generate_target.get('is_warmup', False)
+        #该种子的变异器已达到 MUTATOR_PER_SEED_CAP 时不再生成新的，把任务分给它现有的健康变异器
+        if my_chilo_factory.mutator_pool.seed_is_full(generate_target['seed_id']):
+            seed_mutators = my_chilo_factory.mutator_pool.seed_mutators(generate_target['seed_id'])
+            if seed_mutators:
+                for each_mutator in random.choices(seed_mutators, k=mutate_time):
+                    my_chilo_factory.wait_exec_mutator_list.put(each_mutator)
+                my_chilo_factory.mutator_generator_logger.info(
+                    f"seed_id：{generate_target['seed_id']}  变异器已达上限，直接发布{mutate_time}个现有变异器任务")
+                if is_warmup:
+                    my_chilo_factory.finish_warmup_generate(generate_target['seed_id'], True)
+                continue
+        #多实例FUZZ时，同一个种子的每一轮生成只由抢到该轮的实例调用LLM，其他实例直接使用同步来的变异器
+        if my_chilo_factory.shared_store is not None:
+            target_seed = my_chilo_factory.all_seed_list.seed_list[generate_target['seed_id']]
+            target_seed.generate_round += 1
+            if not my_chilo_factory.shared_store.try_claim("generate", f"{target_seed.seed_sha}_{target_seed.generate_round}"):
+                shared_mutators = shared_store.pick_shared_mutators(my_chilo_factory, generate_target['seed_id'], mutate_time)
+                if shared_mutators:
+                    for each_mutator in shared_mutators:
+                        my_chilo_factory.wait_exec_mutator_list.put(each_mutator)
+                    my_chilo_factory.mutator_generator_logger.info(
+                        f"seed_id：{generate_target['seed_id']}  第{target_seed.generate_round}轮已由其他实例生成，直接发布{mutate_time}个共享变异器任务")
+                    if is_warmup:
+                        my_chilo_factory.finish_warmup_generate(generate_target['seed_id'], True)
+                    continue
         parsed_sql = my_chilo_factory.all_seed_list.seed_list[generate_target['seed_id']].parser_content   #拿出对应的已经解析过的内容
         prompt = _get_constant_mutator_prompt(parsed_sql, my_chilo_factory.target_dbms, my_chilo_factory.target_dbms_version)  #构建提示词
         mutator_code_success = False
@@ -266,14 +323,20 @@ def chilo_mutator_generator(my_chilo_factory: ChiloFactory):
         if mutator_code_success:
             my_chilo_factory.mutator_generator_logger.info(
                 f"seed_id：{generate_target['seed_id']}  LLM生成变异器代码提取成功，准备放入待修复队列")
-            my_chilo_factory.fix_mutator_list.put({"seed_id" : generate_target['seed_id'], "mutate_time" : mutate_time, "mutator_code": mutator_code})
+            fix_task = {"seed_id" : generate_target['seed_id'], "mutate_time" : mutate_time, "mutator_code": mutator_code,
+                        "is_warmup": is_warmup}
+            my_chilo_factory.tracer.enqueue(fix_task)
+            my_chilo_factory.fix_mutator_list.put(fix_task)
             my_chilo_factory.mutator_generator_logger.info(
                 f"seed_id：{generate_target['seed_id']}  变异器放入修复队列成功")
         else:
             my_chilo_factory.mutator_generator_logger.warning(
                 f"seed_id：{generate_target['seed_id']}  生成变异器失败，已跳过该种子")
+            if is_warmup:
+                my_chilo_factory.finish_warmup_generate(generate_target['seed_id'], False)
         my_chilo_factory.mutator_generator_logger.info("-"*10)
         all_end_time = time.time()
+        my_chilo_factory.tracer.complete("generate", all_start_time, generate_target['seed_id'], end_time=all_end_time)
         my_chilo_factory.write_mutator_generator_csv(all_end_time, generate_target['seed_id'], all_end_time-all_start_time,
                                                      end_time-start_time, all_up_token, all_down_token, llm_count,
                                                      llm_error_count, my_chilo_factory.fix_mutator_list.qsize())
\ No newline at end of file
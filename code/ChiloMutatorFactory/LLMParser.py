@@ -6,6 +6,8 @@ import os
 import time
 
 from .chilo_factory import ChiloFactory
+from . import mask_parser
+from . import template_mutator
 
 def _get_constant_prompt(ori_sql, target_dbms, dbms_version):
     prompt = f"""
@@ -182,6 +184,115 @@ Please annotate the following SQL for fuzzing {target_dbms} version {dbms_versio
 """
     return prompt
 
+def _publish_template_mutator(chilo_factory: ChiloFactory, seed_id, mutate_time):
+    """
+    将种子的解析结果在本地编译为模板变异器（每个种子只编译一次），并发布 mutate_time 个执行任务
+    :return: 是否发布成功，解析结果中没有可识别的掩码或编译失败时返回False
+    """
+    target_seed = chilo_factory.all_seed_list.seed_list[seed_id]
+    with target_seed.parse_lock:    # 预热线程也可能同时编译同一个种子的模板变异器
+        if target_seed.template_mutator is None:
+            compile_start_time = time.time()
+            try:
+                if target_seed.parsed_index is not None:
+                    native_mutator = template_mutator.compile_parsed_index(target_seed.parsed_index)
+                else:
+                    native_mutator = template_mutator.compile_masked_sql(target_seed.parser_content)
+            except Exception as e:
+                # 编译失败不能让解析线程退出，改为走LLM生成变异器的流程
+                chilo_factory.parser_logger.error(f"seed_id:{seed_id} 模板变异器编译失败：{e}，改用LLM变异器")
+                return False
+            if native_mutator is None:
+                chilo_factory.parser_logger.warning(f"seed_id:{seed_id} 解析结果中没有可识别的掩码，无法编译模板变异器")
+                return False
+            with chilo_factory.mutator_id_lock:
+                mutator_id = target_seed.next_mutator_id
+                target_seed.next_mutator_id += 1
+            with chilo_factory.mutator_pool_lock:
+                target_seed.template_mutator = chilo_factory.mutator_pool.add_mutator(seed_id, mutator_id,
+                                                                                      native_mutator)
+            chilo_factory.parser_logger.info(
+                f"seed_id:{seed_id} 模板变异器编译完成，mutator_id：{mutator_id}，掩码个数：{native_mutator.mask_count}，用时：{(time.time() - compile_start_time) * 1000:.2f}ms")
+    for _ in range(mutate_time):
+        chilo_factory.wait_exec_mutator_list.put(target_seed.template_mutator)
+    chilo_factory.parser_logger.info(f"seed_id:{seed_id} 模板变异器任务发布成功，变异次数：{mutate_time}")
+    return True
+
+def parse_seed(chilo_factory: ChiloFactory, seed_id):
+    """
+    调用LLM解析一个种子，保存解析结果并建立结构化索引
+    同一个种子持有 parse_lock 时才会解析，解析线程与预热线程同时处理同一个种子时，后到的一方等待并直接使用结果
+    :return: (LLM总用时, 上行token, 下行token, LLM调用次数, 格式错误次数)；种子已经被解析过时返回None
+    """
+    target_seed = chilo_factory.all_seed_list.seed_list[seed_id]
+    with target_seed.parse_lock:
+        if target_seed.is_parsed:
+            return None
+        llm_usd_time_all = 0
+        up_token_all = 0
+        down_token_all = 0
+        llm_use_count = 0
+        llm_format_error_count = 0
+        chilo_factory.parser_logger.info(f"seed_id:{seed_id} 没有被解析过，进入解析过程")
+        need_parse_sql = target_seed.seed_sql
+        seed_sha = target_seed.seed_sha
+        #多实例FUZZ时优先使用其他实例已经发布的解析结果，其他实例正在解析时等待其完成
+        is_parse_shared = False
+        if chilo_factory.shared_store is not None:
+            parse_msg = chilo_factory.shared_store.fetch_or_claim_parsed(seed_sha, chilo_factory.shared_store_claim_wait)
+            if parse_msg is not None:
+                is_parse_shared = True
+                chilo_factory.parser_logger.info(f"seed_id:{seed_id} 使用共享存储中的解析结果，跳过LLM解析")
+        while not is_parse_shared:
+            parse_start_time = time.time()
+            chilo_factory.parser_logger.info(f"seed_id:{seed_id} 调用LLM解析开始")
+            prompt = _get_constant_prompt(need_parse_sql, chilo_factory.target_dbms, chilo_factory.target_dbms_version)
+            parse_msg, up_token, down_token = chilo_factory.llm_tool_parser.chat_llm(prompt)
+            up_token_all += up_token
+            down_token_all += down_token
+            parser_end_time = time.time()
+            llm_use_count += 1
+            chilo_factory.parser_logger.info(
+                f"seed_id:{seed_id} LLM解析结束，用时：{parser_end_time - parse_start_time:.2f}s")
+            llm_usd_time_all += parser_end_time - parse_start_time
+            parse_msg = chilo_factory.llm_tool_parser.get_sql_block_content(parse_msg)
+            try:
+                parse_msg = parse_msg[0]
+                break
+            except:
+                llm_format_error_count += 1
+                chilo_factory.parser_logger.warning(f"seed_id:{seed_id} LLM解析内容提取失败，LLM生成格式错误（第{llm_format_error_count}次），重新解析...")
+                # 检查是否超过最大重试次数
+                if llm_format_error_count >= chilo_factory.llm_format_error_max_retry:
+                    chilo_factory.parser_logger.error(f"seed_id:{seed_id} 解析格式错误次数超过上限{chilo_factory.llm_format_error_max_retry}，放弃该种子")
+                    parse_msg = need_parse_sql  # 使用原始SQL作为fallback
+                    break
+        chilo_factory.parser_logger.info(
+            f"seed_id:{seed_id} LLM解析内容提取成功")
+        save_parsed_sql_path = os.path.join(chilo_factory.parsed_sql_path, f"{seed_id}.txt")
+        chilo_factory.parser_logger.info(
+            f"seed_id:{seed_id} 解析结果存入文件中")
+        with open(save_parsed_sql_path, "w", encoding="utf-8") as f:
+            f.write(parse_msg)  #保存到文件中
+        if chilo_factory.shared_store is not None and not is_parse_shared:
+            chilo_factory.shared_store.publish_parsed(seed_sha, target_seed.seed_buf, parse_msg)
+            chilo_factory.parser_logger.info(f"seed_id:{seed_id} 解析结果已发布到共享存储")
+        chilo_factory.parser_logger.info(
+            f"seed_id:{seed_id} 解析结果存入文件成功")
+        #建立结构化索引（片段、掩码表、语句边界），与文本结果一起保存，后续阶段无需再次解析
+        try:
+            parsed_index = mask_parser.build_masked_sql(parse_msg)
+            parsed_index.save(os.path.join(chilo_factory.parsed_sql_path, f"{seed_id}.json"))
+            chilo_factory.parser_logger.info(
+                f"seed_id:{seed_id} 解析索引建立成功，掩码个数：{parsed_index.mask_count}，语句个数：{parsed_index.statement_count}")
+        except Exception as e:
+            parsed_index = None
+            chilo_factory.parser_logger.warning(f"seed_id:{seed_id} 解析索引建立失败：{e}")
+        target_seed.parser_content = parse_msg
+        target_seed.parsed_index = parsed_index
+        target_seed.is_parsed = True
+    return llm_usd_time_all, up_token_all, down_token_all, llm_use_count, llm_format_error_count
+
 def chilo_parser(chilo_factory: ChiloFactory):
     #这里需要单独启动一个线程，用于对SQL进行处理
     chilo_factory.parser_logger.info("解析器启动成功！")
@@ -195,62 +306,43 @@ def chilo_parser(chilo_factory: ChiloFactory):
         llm_format_error_count = 0
         chilo_factory.parser_logger.info("解析器正在等待解析任务~")
         parse_target = chilo_factory.wait_parse_list.get()
+        chilo_factory.tracer.dequeue("parse", parse_target)
         chilo_factory.parser_logger.info(f"解析任务获取成功：seed_id:{parse_target['seed_id']}")
-        #取一个之后，判断该目标是否已经被解析过
-        if chilo_factory.all_seed_list.seed_list[parse_target['seed_id']].is_parsed:
-            #说明已经被解析过了，则将这个种子加入待变异队列
-            chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 已经被解析过，正在放入变异器生成队列")
-            chilo_factory.wait_mutator_generate_list.put(parse_target)
-            chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 放入变异器生成队列成功")
+        #取一个之后，判断该目标是否已经被解析过（预热线程可能正在解析它，此时parse_seed等待其完成后返回None）
+        parse_stats = None
+        if not chilo_factory.all_seed_list.seed_list[parse_target['seed_id']].is_parsed:
+            parse_stats = parse_seed(chilo_factory, parse_target['seed_id'])
+        if parse_stats is None:
+            #说明已经被解析过了，则将这个种子加入待变异队列（default模式下直接使用模板变异器）
+            if chilo_factory.claim_warmup_mutators(parse_target['seed_id'], parse_target['mutate_time']):
+                # 预热时已经为该种子生成了变异器（或正在生成），直接使用，不再调用LLM
+                chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 使用预热生成的变异器")
+            elif not (chilo_factory.template_mutator_mode == 'default' and
+                      _publish_template_mutator(chilo_factory, parse_target['seed_id'], parse_target['mutate_time'])):
+                chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 已经被解析过，正在放入变异器生成队列")
+                chilo_factory.tracer.enqueue(parse_target)
+                chilo_factory.wait_mutator_generate_list.put(parse_target)
+                chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 放入变异器生成队列成功")
             tmp_seed_is_fuzz_flag_for_csv = 1
         else:
-            #说明还没有被解析过，需要先进行解析...
-            chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 没有被解析过，进入解析过程")
-            need_parse_sql = chilo_factory.all_seed_list.seed_list[parse_target['seed_id']].seed_sql
-            while True:
-                parse_start_time = time.time()
-                chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 调用LLM解析开始")
-                prompt = _get_constant_prompt(need_parse_sql, chilo_factory.target_dbms, chilo_factory.target_dbms_version)
-                parse_msg, up_token, down_token = chilo_factory.llm_tool_parser.chat_llm(prompt)
-                up_token_all += up_token
-                down_token_all += down_token
-                parser_end_time = time.time()
-                llm_use_count += 1
-                chilo_factory.parser_logger.info(
-                    f"seed_id:{parse_target['seed_id']} LLM解析结束，用时：{parser_end_time - parse_start_time:.2f}s")
-                llm_usd_time_all += parser_end_time - parse_start_time
-                parse_msg = chilo_factory.llm_tool_parser.get_sql_block_content(parse_msg)
-                try:
-                    parse_msg = parse_msg[0]
-                    break
-                except:
-                    llm_format_error_count += 1
-                    chilo_factory.parser_logger.warning(f"seed_id:{parse_target['seed_id']} LLM解析内容提取失败，LLM生成格式错误（第{llm_format_error_count}次），重新解析...")
-                    # 检查是否超过最大重试次数
-                    if llm_format_error_count >= chilo_factory.llm_format_error_max_retry:
-                        chilo_factory.parser_logger.error(f"seed_id:{parse_target['seed_id']} 解析格式错误次数超过上限{chilo_factory.llm_format_error_max_retry}，放弃该种子")
-                        parse_msg = need_parse_sql  # 使用原始SQL作为fallback
-                        break
-            chilo_factory.parser_logger.info(
-                f"seed_id:{parse_target['seed_id']} LLM解析内容提取成功")
-            save_parsed_sql_path = os.path.join(chilo_factory.parsed_sql_path, f"{parse_target['seed_id']}.txt")
-            chilo_factory.parser_logger.info(
-                f"seed_id:{parse_target['seed_id']} 解析结果存入文件中")
-            with open(save_parsed_sql_path, "w", encoding="utf-8") as f:
-                f.write(parse_msg)  #保存到文件中
-            chilo_factory.parser_logger.info(
-                f"seed_id:{parse_target['seed_id']} 解析结果存入文件成功")
-            chilo_factory.all_seed_list.seed_list[parse_target['seed_id']].parser_content = parse_msg
-            chilo_factory.all_seed_list.seed_list[parse_target['seed_id']].is_parsed = True
-            #然后要将这个加入到待变异中
-            chilo_factory.parser_logger.info(
-                f"seed_id:{parse_target['seed_id']} 准备加入到变异器待生成队列中")
-            chilo_factory.wait_mutator_generate_list.put(parse_target)
+            llm_usd_time_all, up_token_all, down_token_all, llm_use_count, llm_format_error_count = parse_stats
+            #启用模板变异器时，先在本地编译并立即发布任务，无需等待LLM生成变异器
+            is_template_published = False
+            if chilo_factory.template_mutator_mode in ('stopgap', 'default'):
+                is_template_published = _publish_template_mutator(chilo_factory, parse_target['seed_id'],
+                                                                  parse_target['mutate_time'])
             tmp_seed_is_fuzz_flag_for_csv = 0
-            chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 放入变异器生成队列成功")
+            if chilo_factory.template_mutator_mode != 'default' or not is_template_published:
+                #然后要将这个加入到待变异中
+                chilo_factory.parser_logger.info(
+                    f"seed_id:{parse_target['seed_id']} 准备加入到变异器待生成队列中")
+                chilo_factory.tracer.enqueue(parse_target)
+                chilo_factory.wait_mutator_generate_list.put(parse_target)
+                chilo_factory.parser_logger.info(f"seed_id:{parse_target['seed_id']} 放入变异器生成队列成功")
             chilo_factory.parser_logger.info(f"-"*10)
         left_parser_queue_size = chilo_factory.wait_parse_list.qsize()
         all_end_time = time.time()
+        chilo_factory.tracer.complete("parse", all_start_time, parse_target['seed_id'], end_time=all_end_time)
         chilo_factory.write_parser_csv(all_end_time, parse_target['seed_id'], parse_target['mutate_time'],
                                        tmp_seed_is_fuzz_flag_for_csv, llm_usd_time_all, up_token_all, down_token_all,
                                        llm_use_count, llm_format_error_count, all_end_time-all_start_time,
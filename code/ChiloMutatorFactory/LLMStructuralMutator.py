@@ -2,7 +2,37 @@ import time
 
 from .chilo_factory import ChiloFactory
 
-def _get_structural_prompt(sql, target_dbms, dbms_version):
+
+def _get_output_format(variant_count):
+    """
+    输出格式说明，variant_count>1时要求LLM在一次回复中给出多个互不相同的变体
+    """
+    if variant_count <= 1:
+        return """Return ONLY the mutated SQL wrapped as:
+
+```sql
+(your crash-inducing mutated SQL here)
+```
+
+**No explanations, no comments, just pure SQL.**"""
+    return f"""Return EXACTLY {variant_count} DISTINCT mutated test cases. Each test case is a complete, self-contained SQL script wrapped in its OWN code block:
+
+```sql
+(crash-inducing variant 1)
+```
+
+```sql
+(crash-inducing variant 2)
+```
+
+... and so on, up to variant {variant_count}.
+
+- Each variant must apply a DIFFERENT combination of crash patterns; do not repeat the same script with trivial changes.
+- Each variant must create the tables it uses, because variants are executed independently.
+- **No explanations, no comments, just {variant_count} blocks of pure SQL.**"""
+
+
+def _get_structural_prompt(sql, target_dbms, dbms_version, variant_count=1):
     prompt = f"""
 You are an **ELITE database security researcher** specializing in {target_dbms} v{dbms_version} crash discovery. Your mission is to generate **CRASH-INDUCING SQL** by learning from REAL historical vulnerabilities.
 
@@ -228,13 +258,7 @@ Transform this SQL using crash-inducing patterns:
 
 ## 📤 OUTPUT FORMAT
 
-Return ONLY the mutated SQL wrapped as:
-
-```sql
-(your crash-inducing mutated SQL here)
-```
-
-**No explanations, no comments, just pure SQL.**
+{_get_output_format(variant_count)}
 
 ---
 
@@ -246,13 +270,72 @@ Apply 3-5 crash-inducing patterns from the examples above to transform the input
 """
     return prompt
 
+
+class _VariantCountController:
+    def __init__(self, max_count, max_completion_tokens=0):
+        """
+        自适应决定每次LLM请求的变体个数K
+        :param max_count: K的上限（配置 STRUCTURAL_VARIANT_COUNT）
+        :param max_completion_tokens: 单次回复的补全token上限，<=0表示不限制
+        """
+        self.max_count = max(1, max_count)
+        self.max_completion_tokens = max_completion_tokens
+        self.current_count = self.max_count
+        self.tokens_per_variant = None  # 每个变体平均消耗的补全token（指数滑动平均）
+
+    def next_count(self):
+        """
+        :return: 本次请求的变体个数
+        """
+        count = self.current_count
+        if self.max_completion_tokens > 0 and self.tokens_per_variant:
+            count = min(count, int(self.max_completion_tokens // self.tokens_per_variant))
+        return max(1, count)
+
+    def record(self, requested_count, returned_count, down_token):
+        """
+        根据一次请求的结果调整K：格式错误（没有提取到任何代码块）时减半，返回的块数不足时降到实际块数，
+        完整返回时逐步增加，直到上限
+        :param requested_count: 请求的变体个数
+        :param returned_count: 实际提取到的代码块个数
+        :param down_token: 本次补全token
+        """
+        if returned_count <= 0:
+            self.current_count = max(1, requested_count // 2)
+            return
+        per_variant = down_token / returned_count
+        if self.tokens_per_variant is None:
+            self.tokens_per_variant = per_variant
+        else:
+            self.tokens_per_variant = 0.7 * self.tokens_per_variant + 0.3 * per_variant
+        if returned_count < requested_count:
+            self.current_count = max(1, returned_count)
+        else:
+            self.current_count = min(self.max_count, requested_count + 1)
+
+
+def _dedup_variants(variants):
+    """
+    去掉空白与重复的变体（忽略空白差异）
+    """
+    unique_variants = []
+    seen = set()
+    for variant in variants:
+        key = " ".join(variant.split())
+        if key and key not in seen:
+            seen.add(key)
+            unique_variants.append(variant)
+    return unique_variants
+
 def structural_mutator(my_chilo_factory: ChiloFactory):
     """
     实现SQL的结构性变异
     :return: 无返回值
     """
     structural_count = 0
-    my_chilo_factory.structural_mutator_logger.info("结构化变异器已启动！")
+    variant_controller = _VariantCountController(my_chilo_factory.structural_variant_count,
+                                                 my_chilo_factory.structural_max_completion_tokens)
+    my_chilo_factory.structural_mutator_logger.info(f"结构化变异器已启动！每次请求的变体个数上限：{variant_controller.max_count}")
     system_prompt = """You are an AGGRESSIVE database security researcher and fuzzing expert specializing in crash discovery. Your mission is to generate EXTREME SQL test cases that exploit edge cases, boundary conditions, and known vulnerability patterns in database systems. You have deep knowledge of:
 - DBMS implementation bugs and historical CVEs
 - Type system vulnerabilities and implicit conversion edge cases  
@@ -272,14 +355,17 @@ Your generated SQL should be MAXIMALLY COMPLEX and target crash-prone areas. Pri
         llm_use_time = 0
         my_chilo_factory.structural_mutator_logger.info("结构化变异器等待任务中")
         need_structural_mutate = my_chilo_factory.structural_mutator_list.get()  #拿出一个需要结构化变异的
+        my_chilo_factory.tracer.dequeue("structural", need_structural_mutate)
         target_seed_id = need_structural_mutate["seed_id"]
         my_chilo_factory.structural_mutator_logger.info(f"结构化变异器接收到变异任务，seed_id：{target_seed_id}")
         seed_sql = my_chilo_factory.all_seed_list.seed_list[target_seed_id].seed_sql
-        prompt = _get_structural_prompt(seed_sql, my_chilo_factory.target_dbms, my_chilo_factory.target_dbms_version)   #获取提示词
         structural_mutate_success = False
         while True:
+            requested_count = variant_controller.next_count()
+            prompt = _get_structural_prompt(seed_sql, my_chilo_factory.target_dbms, my_chilo_factory.target_dbms_version,
+                                            requested_count)   #获取提示词
             structural_mutate_llm_start_time = time.time()
-            my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，准备调用LLM进行结构化变异")
+            my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，准备调用LLM进行结构化变异，请求变体个数：{requested_count}")
             after_mutate_testcase,up_token, down_token = my_chilo_factory.llm_tool_structural_mutator.chat_llm(prompt, system_prompt)
             all_up_token += up_token
             all_down_token += down_token
@@ -288,11 +374,12 @@ Your generated SQL should be MAXIMALLY COMPLEX and target crash-prone areas. Pri
             llm_use_time += structural_mutate_llm_end_time - structural_mutate_llm_start_time
             my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，调用LLM结束，用时：{structural_mutate_llm_end_time-structural_mutate_llm_start_time:.2f}s")
             after_mutate_testcase = my_chilo_factory.llm_tool_structural_mutator.get_sql_block_content(after_mutate_testcase)  # 提取内容
-            try:
-                after_mutate_testcase = after_mutate_testcase[0]
+            variant_controller.record(requested_count, len(after_mutate_testcase), down_token)
+            after_mutate_testcase_list = _dedup_variants(after_mutate_testcase)
+            if after_mutate_testcase_list:
                 structural_mutate_success = True
                 break
-            except:
+            else:
                 #说明生成格式出现错误，需要从新生成
                 llm_error_count += 1
                 my_chilo_factory.structural_mutator_logger.warning(f"seed_id：{target_seed_id}，LLM生成格式错误（第{llm_error_count}次），正在重新生成")
@@ -300,7 +387,7 @@ Your generated SQL should be MAXIMALLY COMPLEX and target crash-prone areas. Pri
                 if llm_error_count >= my_chilo_factory.llm_format_error_max_retry:
                     my_chilo_factory.structural_mutator_logger.error(
                         f"seed_id：{target_seed_id}，格式错误次数超过上限{my_chilo_factory.llm_format_error_max_retry}，使用原始SQL")
-                    after_mutate_testcase = seed_sql  # 使用原始SQL作为fallback
+                    after_mutate_testcase_list = [seed_sql]  # 使用原始SQL作为fallback
                     structural_mutate_success = True  # 标记为成功以继续流程
                     break
                 continue
@@ -310,16 +397,33 @@ Your generated SQL should be MAXIMALLY COMPLEX and target crash-prone areas. Pri
             my_chilo_factory.structural_mutator_logger.warning(f"seed_id：{target_seed_id}，结构化变异失败，跳过")
             continue  # 跳过后续处理，继续下一个任务
 
-        my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，正在加入到种子池中")
-        _, new_seed_id = my_chilo_factory.all_seed_list.add_seed_to_list(after_mutate_testcase.encode("utf-8"))
-        with open(f"{my_chilo_factory.structural_mutator_path}{structural_count}_{target_seed_id}_{new_seed_id}.txt", "w", encoding="utf-8") as f:
-            f.write(after_mutate_testcase)
-        my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，变异后，新的seed_id为：{new_seed_id}，已保存到文件{structural_count}_{target_seed_id}_{new_seed_id}.txt")
-        my_chilo_factory.wait_exec_structural_list.put({"seed_id": new_seed_id, "is_from_structural_mutator": True, "mutate_content": after_mutate_testcase})
-        my_chilo_factory.structural_mutator_logger.info(f"seed_id：{new_seed_id}，已加入等待执行结构化变异队列")
+        my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，正在将{len(after_mutate_testcase_list)}个变体加入到种子池中")
+        new_seed_id_list = []
+        for after_mutate_testcase in after_mutate_testcase_list:
+            screen_action = 'keep'
+            if my_chilo_factory.screen_mode in ('structural', 'all'):
+                after_mutate_testcase, screen_action = my_chilo_factory.screen_testcase("structural", target_seed_id, None,
+                                                                                        after_mutate_testcase)
+                if after_mutate_testcase is None:
+                    my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，变体未通过执行前筛查，已丢弃")
+                    continue
+            _, new_seed_id = my_chilo_factory.all_seed_list.add_seed_to_list(after_mutate_testcase.encode("utf-8"))
+            new_seed_id_list.append(new_seed_id)
+            with open(f"{my_chilo_factory.structural_mutator_path}{structural_count}_{target_seed_id}_{new_seed_id}.txt", "w", encoding="utf-8") as f:
+                f.write(after_mutate_testcase)
+            my_chilo_factory.structural_mutator_logger.info(f"seed_id：{target_seed_id}，变异后，新的seed_id为：{new_seed_id}，已保存到文件{structural_count}_{target_seed_id}_{new_seed_id}.txt")
+            if screen_action == 'deprioritize':
+                my_chilo_factory.defer_testcase(new_seed_id, None, after_mutate_testcase, True)
+                my_chilo_factory.structural_mutator_logger.info(f"seed_id：{new_seed_id}，执行较慢，已加入降低优先级的队列")
+                continue
+            my_chilo_factory.wait_exec_structural_list.put({"seed_id": new_seed_id, "is_from_structural_mutator": True, "mutate_content": after_mutate_testcase})
+            my_chilo_factory.structural_mutator_logger.info(f"seed_id：{new_seed_id}，已加入等待执行结构化变异队列")
         my_chilo_factory.structural_mutator_logger.info("-" * 10)
         structural_mutate_end_time = time.time()
-        my_chilo_factory.write_structural_mutator_csv(structural_mutate_end_time, target_seed_id, new_seed_id, structural_mutate_end_time-structural_mutate_start_time,
-                                                      all_up_token, all_down_token, llm_count, llm_error_count, llm_use_time, my_chilo_factory.structural_mutator_list.qsize())
+        my_chilo_factory.tracer.complete("structural", structural_mutate_start_time, target_seed_id,
+                                         end_time=structural_mutate_end_time, new_seed_count=len(new_seed_id_list))
+        my_chilo_factory.write_structural_mutator_csv(structural_mutate_end_time, target_seed_id, new_seed_id_list[0] if new_seed_id_list else -1, structural_mutate_end_time-structural_mutate_start_time,
+                                                      all_up_token, all_down_token, llm_count, llm_error_count, llm_use_time, my_chilo_factory.structural_mutator_list.qsize(),
+                                                      requested_count, len(new_seed_id_list), new_seed_id_list)
 
         
\ No newline at end of file
@@ -4,7 +4,7 @@ chillo的工厂！
 主要定义了FUZZ过程中需要用到的一系列API函数，并封装好~
 """
 import csv
-import importlib.util
+import random
 import queue
 import os
 import time
@@ -16,6 +16,23 @@ from . import llm_tool
 from . import seed
 from . import ChiloMutator
 from . import logger
+from . import mutator_runtime
+from . import sql_checker
+from . import shared_store
+from . import metrics
+from . import tracing
+
+def _instance_path(path, instance_id):
+    """
+    多实例FUZZ时，在路径的最后一级之前插入实例名，使每个实例的日志、CSV与中间文件互不覆盖
+    例如 ./logs/main.log -> ./logs/sec1/main.log，./GeneratedMutator/ -> ./sec1/GeneratedMutator/
+    """
+    if not instance_id:
+        return path
+    head, tail = os.path.split(path.rstrip("/"))
+    new_path = os.path.join(head, instance_id, tail)
+    return new_path + "/" if path.endswith("/") else new_path
+
 
 class ChiloFactory:
     """
@@ -36,6 +53,7 @@ class ChiloFactory:
         self.mutator_id_lock = threading.Lock()  # 保护 mutator_id 分配
         self.mutator_pool_lock = threading.Lock()  # 保护 mutator_pool 操作
         self.csv_lock = threading.Lock()  # 保护 CSV 文件写入
+        self.mutate_lock = threading.Lock()  # 守护进程模式下多个客户端线程串行调用 mutate_once（变异器的批量缓存等不是线程安全的）
 
         self.main_log_path = config['LOG']['MAIN_LOG_PATH']   #主日志
         self.parser_log_path = config['LOG']['PARSER_LOG_PATH']   #解析器日志
@@ -53,18 +71,57 @@ class ChiloFactory:
         self.structural_mutator_list = queue.Queue()    #等待结构性变异的队列
         self.fix_mutator_list = queue.Queue()   #等待修复队列
         self.wait_exec_structural_list = queue.Queue()   #等待执行结构性变异的队列 (优先)
+        self.wait_exec_deferred_list = queue.Queue(config['OTHERS'].get('SCREEN_DEFERRED_MAX', 1000))   #筛查后被降低优先级的测试用例（最后执行）
 
         self.parsed_sql_path = config['FILE_PATH']['PARSED_SQL_PATH']
         self.generated_mutator_path = config['FILE_PATH']['GENERATED_MUTATOR_PATH']
         self.structural_mutator_path = config['FILE_PATH']['STRUCTURAL_MUTATE_PATH']   #结构化变异的文件路径
         self.mutator_fix_tmp_path = config['FILE_PATH']['MUTATOR_FIX_TMP_PATH']
-        self.mutator_pool = ChiloMutator.ChiloMutatorPool(self.generated_mutator_path)  #一个变异器池
+        # 一个变异器池；出错的变异器按指数退避（MUTATOR_RETRY_BASE起，最长MUTATOR_RETRY_MAX秒）后重试，
+        # 连续出错 MUTATOR_MAX_ERROR_COUNT 次后禁用；
+        # 存活变异器超过 MUTATOR_POOL_CAPACITY 个或同一种子超过 MUTATOR_PER_SEED_CAP 个时淘汰价值最低的（0表示不限制）
+        self.mutator_pool = ChiloMutator.ChiloMutatorPool(self.generated_mutator_path,
+                                                          config['OTHERS'].get('MUTATOR_RETRY_BASE', 30),
+                                                          config['OTHERS'].get('MUTATOR_RETRY_MAX', 1800),
+                                                          config['OTHERS'].get('MUTATOR_MAX_ERROR_COUNT', 5),
+                                                          config['OTHERS'].get('MUTATOR_POOL_CAPACITY', 0),
+                                                          config['OTHERS'].get('MUTATOR_PER_SEED_CAP', 0),
+                                                          config['OTHERS'].get('MUTATOR_EVICT_MIN_AGE', 300))
         self.all_seed_list = seed.AFLSeedList() #收到的所有seed的列表
 
 
         self.fix_mutator_try_time = config['OTHERS']['FIX_MUTATOR_TRY_TIME']
+        # 变异器试运行（隔离子进程）配置
+        self.fix_validate_timeout = config['OTHERS'].get('FIX_VALIDATE_TIMEOUT', 30)
+        self.fix_validate_memory_limit_mb = config['OTHERS'].get('FIX_VALIDATE_MEMORY_LIMIT_MB', 2048)
+        self.fix_validate_worker_count = config['OTHERS'].get('FIX_VALIDATE_WORKER_COUNT', 4)
+        # 变异器输出SQL格式良好性检测（借助sqlite3解析器），比例低于下限时交给LLM修复，默认只记录不修复
+        self.fix_sql_check_enable = config['OTHERS'].get('FIX_SQL_CHECK', False)
+        self.fix_sql_valid_min_ratio = config['OTHERS'].get('FIX_SQL_VALID_MIN_RATIO', 0.0)
+        # 本地模板变异器：off 不启用；stopgap 解析后立即发布模板变异器，同时照常生成LLM变异器；
+        # default 直接使用模板变异器，不再调用LLM生成变异器
+        self.template_mutator_mode = config['OTHERS'].get('TEMPLATE_MUTATOR_MODE', 'off')
+        # 每次调用变异器时一次性生成的结果个数，多余的结果缓存在变异器上供后续fuzz使用
+        self.mutate_batch_size = config['OTHERS'].get('MUTATE_BATCH_SIZE', 8)
+        # 执行前筛查：off 不筛查；structural 只筛查结构化变异结果；all 同时筛查变异器输出
+        # all 模式下筛查发生在AFL的fuzz()热路径上：每批变异器输出逐个执行，每个测试用例最多耗时 SCREEN_TIME_LIMIT 秒，
+        # 一次 mutate_once 最坏要等待 MUTATE_BATCH_SIZE * SCREEN_TIME_LIMIT 秒，会明显降低执行速度，默认不启用
+        # 各结论的处理方式：keep 保留；drop 丢弃；rewrite 截断到超时语句之前；deprioritize 放入最低优先级队列
+        self.screen_mode = config['OTHERS'].get('SCREEN_MODE', 'off')
+        self.screen_max_steps = config['OTHERS'].get('SCREEN_MAX_STEPS', 2000000)
+        self.screen_slow_steps = config['OTHERS'].get('SCREEN_SLOW_STEPS', 200000)
+        self.screen_time_limit = config['OTHERS'].get('SCREEN_TIME_LIMIT', 0.5)
+        self.screen_policy = {
+            sql_checker.SCREEN_PARSE_ERROR: config['OTHERS'].get('SCREEN_PARSE_ERROR_POLICY', 'drop'),
+            sql_checker.SCREEN_TIMEOUT: config['OTHERS'].get('SCREEN_TIMEOUT_POLICY', 'rewrite'),
+            sql_checker.SCREEN_SLOW: config['OTHERS'].get('SCREEN_SLOW_POLICY', 'deprioritize'),
+            sql_checker.SCREEN_FAST: 'keep',
+        }
         self.semantic_fix_max_time = config['OTHERS']['SEMANTIC_FIX_MAX_TIME']
         self.times_to_structural_mutator = config['OTHERS']['TIMES_TO_STRUCTURAL_MUTATOR']
+        # 结构化变异每次LLM请求返回的变体个数上限（会根据格式错误率与token上限自适应调整），以及单次回复的补全token上限
+        self.structural_variant_count = config['OTHERS'].get('STRUCTURAL_VARIANT_COUNT', 1)
+        self.structural_max_completion_tokens = config['OTHERS'].get('STRUCTURAL_MAX_COMPLETION_TOKENS', 0)
         
         # 线程配置
         self.parser_thread_count = config['OTHERS'].get('PARSER_THREAD_COUNT', 1)
@@ -82,6 +139,43 @@ class ChiloFactory:
         self.parser_csv_path = config['CSV']['PARSER_CSV_PATH']
         self.main_csv_path = config['CSV']['MAIN_CSV_PATH']
         self.mutator_generator_csv_path = config['CSV']['MUTATOR_GENERATOR_CSV_PATH']
+        self.screener_csv_path = config['CSV'].get('SCREENER_CSV_PATH',
+                                                   os.path.join(os.path.dirname(self.main_csv_path), "screener.csv"))
+
+        # 多核FUZZ：由start_fuzz.py通过环境变量传入实例名与共享存储目录
+        self.instance_id = os.environ.get("CHILO_INSTANCE_ID", "")
+        for path_attr in ("main_log_path", "parser_log_path", "mutator_generator_log_path",
+                          "structural_mutator_log_path", "mutator_fixer_log_path", "llm_log_path",
+                          "parsed_sql_path", "generated_mutator_path", "structural_mutator_path",
+                          "mutator_fix_tmp_path", "mutator_fixer_csv_path", "structural_mutator_csv_path",
+                          "parser_csv_path", "main_csv_path", "mutator_generator_csv_path", "screener_csv_path"):
+            setattr(self, path_attr, _instance_path(getattr(self, path_attr), self.instance_id))
+        self.mutator_pool.file_path = self.generated_mutator_path
+        shared_store_path = os.environ.get("CHILO_SHARED_STORE", config['OTHERS'].get('SHARED_STORE_PATH', ""))
+        self.shared_store = shared_store.SharedStore(shared_store_path, self.instance_id or "main") \
+            if shared_store_path else None
+        self.shared_store_sync_interval = config['OTHERS'].get('SHARED_STORE_SYNC_INTERVAL', 10)
+        self.shared_store_claim_wait = config['OTHERS'].get('SHARED_STORE_CLAIM_WAIT', 120)
+
+        # 预热：启动时并发解析初始种子库中的全部种子（见warmup.py），目录为空时不预热
+        self.warmup_input_dir = os.environ.get("CHILO_WARMUP_DIR", config['OTHERS'].get('WARMUP_INPUT_DIR', ""))
+        self.warmup_concurrency = config['OTHERS'].get('WARMUP_CONCURRENCY', 8)
+        self.warmup_rate = config['OTHERS'].get('WARMUP_RATE', 2)     # 每秒最多开始解析的种子个数
+        self.warmup_generate = config['OTHERS'].get('WARMUP_GENERATE', False)     # 解析后是否预先生成变异器
+        self.warmup_status_path = config['CSV'].get('WARMUP_STATUS_PATH',
+                                                    os.path.join(os.path.dirname(self.main_csv_path), "warmup_status.json"))
+
+        # 实时指标：每隔 METRICS_INTERVAL 秒以Prometheus文本格式写入 METRICS_PATH（由ChiloDisco的/metrics读取），0表示不导出
+        self.metrics_path = _instance_path(config['CSV']['METRICS_PATH'], self.instance_id) \
+            if config['CSV'].get('METRICS_PATH') else os.path.join(os.path.dirname(self.main_csv_path), "metrics.prom")
+        self.metrics = metrics.FactoryMetrics(self.instance_id, self.metrics_path,
+                                              config['OTHERS'].get('METRICS_INTERVAL', 5))
+        # 种子生命周期追踪：按 TRACE_SAMPLE_RATE 比例采样种子，导出为Chrome trace JSON（见tracing.py），0表示不追踪
+        self.trace_path = _instance_path(config['CSV']['TRACE_PATH'], self.instance_id) \
+            if config['CSV'].get('TRACE_PATH') else os.path.join(os.path.dirname(self.main_csv_path), "trace.json")
+        self.tracer = tracing.Tracer(self.trace_path, config['OTHERS'].get('TRACE_SAMPLE_RATE', 0),
+                                     config['OTHERS'].get('TRACE_BUFFER_SIZE', 200000),
+                                     config['OTHERS'].get('TRACE_EXPORT_INTERVAL', 30))
 
         self.init_file_path()  # 初始化所有文件路径
 
@@ -91,27 +185,39 @@ class ChiloFactory:
         self.structural_mutator_logger = logger.setup_thread_logger("StructuralMutator", self.structural_mutator_log_path)
         self.mutator_fixer_logger = logger.setup_thread_logger("MutatorFixer", self.mutator_fixer_log_path)
         self.llm_logger = logger.setup_thread_logger("LLM", self.llm_log_path)
+        if self.screen_mode == 'all':
+            self.main_logger.warning(f"SCREEN_MODE为all：变异器输出在fuzz()中逐个筛查，"
+                                     f"每个测试用例最多{self.screen_time_limit}s，会降低执行速度")
 
         # 为三个不同的任务创建独立的LLM工具实例
         self.llm_tool_parser = llm_tool.LLMTool(
             config['LLM']['LLM_PARSER']['API_KEY'], 
             config['LLM']['LLM_PARSER']['MODEL'],
             config['LLM']['LLM_PARSER']['BASE_URL'], 
-            self.llm_logger
+            self.llm_logger,
+            "parser",
+            self.metrics,
+            self.tracer
         )
         
         self.llm_tool_mutator_generator = llm_tool.LLMTool(
             config['LLM']['LLM_MUTATOR_GENERATOR']['API_KEY'], 
             config['LLM']['LLM_MUTATOR_GENERATOR']['MODEL'],
             config['LLM']['LLM_MUTATOR_GENERATOR']['BASE_URL'], 
-            self.llm_logger
+            self.llm_logger,
+            "mutator_generator",
+            self.metrics,
+            self.tracer
         )
         
         self.llm_tool_structural_mutator = llm_tool.LLMTool(
             config['LLM']['LLM_STRUCTURAL_MUTATOR']['API_KEY'], 
             config['LLM']['LLM_STRUCTURAL_MUTATOR']['MODEL'],
             config['LLM']['LLM_STRUCTURAL_MUTATOR']['BASE_URL'], 
-            self.llm_logger
+            self.llm_logger,
+            "structural_mutator",
+            self.metrics,
+            self.tracer
         )
         
         # Fixer使用的LLM工具
@@ -119,7 +225,10 @@ class ChiloFactory:
             config['LLM']['LLM_FIXER']['API_KEY'],
             config['LLM']['LLM_FIXER']['MODEL'],
             config['LLM']['LLM_FIXER']['BASE_URL'],
-            self.llm_logger
+            self.llm_logger,
+            "fixer",
+            self.metrics,
+            self.tracer
         )
 
 
@@ -199,14 +308,16 @@ class ChiloFactory:
                              "semantic_random_error_count","semantic_error_count",
                              "semantic_error_llm_use_time",
                              "semantic_error_llm_count","semantic_llm_format_error",
-                             "semantic_up_token", "semantic_down_token","left_fix_queue_count", "at_last_is_all_correct"])
+                             "semantic_up_token", "semantic_down_token","left_fix_queue_count", "at_last_is_all_correct",
+                             "semantic_sql_error_count", "sql_valid_ratio"])
 
         with open(self.structural_mutator_csv_path, mode='a', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(["real_time", "relative_time", "seed_id", "new_seed_id",
                              "all_use_time", "llm_up_token", "llm_down_token", "llm_count",
                              "llm_format_error_count", "llm_use_time",
-                             "left_structural_mutate_queue_count"])
+                             "left_structural_mutate_queue_count",
+                             "requested_variant_count", "accepted_variant_count", "variant_seed_ids"])
 
         with open(self.main_csv_path, mode='a', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
@@ -214,12 +325,18 @@ class ChiloFactory:
                              "fuzz_seed_number", "is_by_ramdom", "fuzz_use_time","now_seed_id",
                              "real_fuzz_seed_id", "real_mutator_id","left_wait_exec_queue_count",
                              "ori_mutate_out_size", "real_mutate_out_size", "is_cut",
-                              "is_error_occur", "is_from_structural_mutator"])
+                              "is_error_occur", "is_from_structural_mutator", "arm", "cut_mode"])
         with open(self.mutator_generator_csv_path, mode='a', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(["real_time", "relative_time", "seed_id", "use_all_time", "llm_use_time",
                              "llm_up_token", "llm_down_token", "llm_count",
                              "llm_error_count", "left_mutator_generate_queue_count"])
+        if self.screen_mode != 'off':
+            with open(self.screener_csv_path, mode='a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(["real_time", "relative_time", "source", "seed_id", "mutator_id",
+                                 "verdict", "action", "vm_steps", "statement_count", "parse_error_count",
+                                 "screen_use_time", "ori_size", "out_size"])
     def write_mutator_generator_csv(self, real_time, seed_id,
                                     use_all_time, llm_use_time, llm_up_token, llm_down_token,
                                     llm_count, llm_error_count, left_mutator_generate_queue_count):
@@ -247,7 +364,8 @@ class ChiloFactory:
     def write_main_csv(self, real_time, fuzz_count_seed_number,
                        fuzz_seed_number, is_by_ramdom,fuzz_use_time, now_seed_id,
                        real_fuzz_seed_id, real_mutator_id,left_wait_exec_queue_count, ori_mutate_out_size,
-                       real_mutate_out_size, is_cut, is_error_occur, is_from_structural_mutator):
+                       real_mutate_out_size, is_cut, is_error_occur, is_from_structural_mutator, arm="chilo",
+                       cut_mode="none"):
         """
         向主CSV里面写入一行
         :param real_time: 插入的真实时间
@@ -264,8 +382,11 @@ class ChiloFactory:
         :param is_cut:  是否过长被截断
         :param is_error_occur: 变异器是否在最终出现了问题
         :param is_from_structural_mutator: 是否从结构化变异队列中取出的
+        :param arm: 产生本次测试用例的变异臂 chilo/squirrel
+        :param cut_mode: 截断方式 none/statement/byte（见mutator_runtime.fit_testcase）
         :return:
         """
+        self.metrics.observe_fuzz(fuzz_use_time, arm, is_by_ramdom, is_error_occur, is_cut, is_from_structural_mutator)
         with self.csv_lock:  # 加锁保护CSV写入
             with open(self.main_csv_path, mode='a', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
@@ -273,7 +394,8 @@ class ChiloFactory:
                                  fuzz_seed_number, is_by_ramdom, fuzz_use_time,
                                  now_seed_id, real_fuzz_seed_id, real_mutator_id, left_wait_exec_queue_count,
                                  ori_mutate_out_size,
-                                 real_mutate_out_size, is_cut, is_error_occur, is_from_structural_mutator])
+                                 real_mutate_out_size, is_cut, is_error_occur, is_from_structural_mutator, arm,
+                                 cut_mode])
 
     def write_parser_csv(self, real_time, seed_id, need_mutate_count, is_parsed, llm_time,
                          up_token, down_token,  llm_count,
@@ -310,7 +432,7 @@ class ChiloFactory:
                                 semantic_error_count,semantic_error_llm_use_time,
                                 semantic_error_llm_count,
                                 semantic_llm_format_error,semantic_up_token, semantic_down_token,left_fix_queue_count,
-                                at_last_is_all_correct):
+                                at_last_is_all_correct, semantic_sql_error_count=0, sql_valid_ratio=None):
         """
         向mutator_fixer的csv中写入一行
         :param need_mutate_count: 需要进行变异的次数
@@ -337,16 +459,19 @@ class ChiloFactory:
         :param semantic_up_token: 语义修复上传总token
         :param semantic_down_token: 语义修复补全总token
         :param at_last_is_all_correct : 最终是否完全正确
+        :param semantic_sql_error_count: 输出SQL可解析比例过低的次数
+        :param sql_valid_ratio: 最后一次检测中可被sqlite3解析的语句占比（未启用检测时为空）
         :return:
         """
         with self.csv_lock:  # 加锁保护CSV写入
             with open(self.mutator_fixer_csv_path, mode='a', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow([real_time, real_time-self.start_time, seed_id, mutator_id, need_mutate_count, all_use_time,  all_llm_count, syntax_use_time,syntax_error_count, syntax_format_error_time,syntax_llm_use_time,syntax_llm_count,syntax_up_token, syntax_down_token,sematic_use_time, semantic_mask_error_count, semantic_random_error_count, semantic_error_count, semantic_error_llm_use_time,semantic_error_llm_count,semantic_llm_format_error,semantic_up_token, semantic_down_token,left_fix_queue_count,at_last_is_all_correct])
+                writer.writerow([real_time, real_time-self.start_time, seed_id, mutator_id, need_mutate_count, all_use_time,  all_llm_count, syntax_use_time,syntax_error_count, syntax_format_error_time,syntax_llm_use_time,syntax_llm_count,syntax_up_token, syntax_down_token,sematic_use_time, semantic_mask_error_count, semantic_random_error_count, semantic_error_count, semantic_error_llm_use_time,semantic_error_llm_count,semantic_llm_format_error,semantic_up_token, semantic_down_token,left_fix_queue_count,at_last_is_all_correct, semantic_sql_error_count, sql_valid_ratio])
 
     def write_structural_mutator_csv(self, real_time, seed_id, new_seed_id,
                                      all_use_time, llm_up_token, llm_down_token, llm_count,
-                                     llm_format_error_count, llm_use_time,left_structural_mutate_queue_count):
+                                     llm_format_error_count, llm_use_time,left_structural_mutate_queue_count,
+                                     requested_variant_count=1, accepted_variant_count=1, variant_seed_ids=None):
         """
         向structural_mutator写入一行
         :param real_time: 数据插入时间
@@ -359,6 +484,9 @@ class ChiloFactory:
         :param llm_format_error_count: LLM生成格式错误
         :param llm_use_time: LLM调用所用时间
         :param left_structural_mutate_queue_count: 等待结构化变异的队列剩余个数
+        :param requested_variant_count: 本次请求LLM生成的变体个数
+        :param accepted_variant_count: 去重后实际加入队列的变体个数
+        :param variant_seed_ids: 所有变体的seed_id列表
         :return:
         """
         with self.csv_lock:  # 加锁保护CSV写入
@@ -367,42 +495,210 @@ class ChiloFactory:
                 writer.writerow([real_time, real_time-self.start_time, seed_id,
                                  new_seed_id, all_use_time, llm_up_token, llm_down_token,
                                  llm_count, llm_format_error_count, llm_use_time,
-                                 left_structural_mutate_queue_count])
+                                 left_structural_mutate_queue_count, requested_variant_count, accepted_variant_count,
+                                 "|".join(str(each) for each in (variant_seed_ids or [new_seed_id]))])
 
 
 
+    def write_screener_csv(self, real_time, source, seed_id, mutator_id, screen_result: sql_checker.ScreenResult,
+                           action, ori_size, out_size):
+        """
+        向筛查CSV中插入一行
+        :param real_time: 数据插入时间
+        :param source: 测试用例来源 structural/mutator
+        :param seed_id: 种子id
+        :param mutator_id: 变异器id，结构化变异为None
+        :param screen_result: 筛查结果
+        :param action: 最终的处理方式
+        :param ori_size: 筛查前的长度
+        :param out_size: 处理后的长度，丢弃时为0
+        :return: 无
+        """
+        with self.csv_lock:  # 加锁保护CSV写入
+            with open(self.screener_csv_path, mode='a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow([real_time, real_time-self.start_time, source, seed_id, mutator_id,
+                                 screen_result.verdict, action, screen_result.vm_steps,
+                                 screen_result.statement_count, screen_result.parse_error_count,
+                                 screen_result.use_time, ori_size, out_size])
+
+    def screen_testcase(self, source, seed_id, mutator_id, testcase):
+        """
+        在执行前用内存中的sqlite3筛查一个测试用例，并按配置的策略处理
+        :param source: 测试用例来源 structural/mutator
+        :param seed_id: 种子id
+        :param mutator_id: 变异器id
+        :param testcase: 测试用例
+        :return: (处理后的测试用例，丢弃时为None, 处理方式 keep/drop/rewrite/deprioritize)
+        """
+        screen_result = sql_checker.screen_sql(testcase, self.screen_max_steps, self.screen_slow_steps,
+                                               self.screen_time_limit)
+        action = self.screen_policy.get(screen_result.verdict, 'keep')
+        out_testcase = testcase
+        if action == 'drop':
+            out_testcase = None
+        elif action == 'rewrite':
+            if screen_result.verdict == sql_checker.SCREEN_TIMEOUT and screen_result.timeout_statement_index > 0:
+                out_testcase = sql_checker.truncate_before_statement(testcase, screen_result.timeout_statement_index)
+            elif screen_result.verdict == sql_checker.SCREEN_TIMEOUT:
+                action = 'drop'     # 第一条语句就超时，截断后没有剩余内容
+                out_testcase = None
+            else:
+                action = 'keep'
+        self.write_screener_csv(time.time(), source, seed_id, mutator_id, screen_result, action,
+                                len(testcase), len(out_testcase) if out_testcase is not None else 0)
+        return out_testcase, action
+
+    def defer_testcase(self, seed_id, mutator_id, testcase, is_from_structural_mutator):
+        """
+        将筛查后降低优先级的测试用例放入最低优先级队列，队列已满时直接丢弃
+        :return: 是否放入成功
+        """
+        try:
+            self.wait_exec_deferred_list.put_nowait({"seed_id": seed_id, "mutator_id": mutator_id,
+                                                     "mutate_content": testcase,
+                                                     "is_from_structural_mutator": is_from_structural_mutator})
+            return True
+        except queue.Full:
+            return False
+
+    def screen_mutator_outputs(self, mutator: ChiloMutator.ChiloMutator, outputs):
+        """
+        筛查一批变异器输出，返回可以立即执行的部分
+        全部被丢弃或降级时保留第一个原始输出，避免反复调用同一个变异器
+        """
+        if self.screen_mode != 'all':
+            return outputs
+        kept_outputs = []
+        for output in outputs:
+            out_testcase, action = self.screen_testcase("mutator", mutator.seed_id, mutator.mutator_id, output)
+            if action == 'deprioritize':
+                self.defer_testcase(mutator.seed_id, mutator.mutator_id, out_testcase, False)
+            elif out_testcase is not None:
+                kept_outputs.append(out_testcase)
+        if not kept_outputs:
+            self.main_logger.warning(
+                f"变异器输出全部未通过筛查，种子id:{mutator.seed_id}，变异器编号为：{mutator.mutator_id}，保留一个原始输出")
+            kept_outputs = outputs[:1]
+        return kept_outputs
+
+    def _publish_seed_mutators(self, seed_id, mutate_time):
+        """
+        把 mutate_time 个任务随机分给该种子现有的健康变异器
+        :return: 是否发布成功（该种子没有健康的变异器时返回False）
+        """
+        seed_mutators = self.mutator_pool.seed_mutators(seed_id)
+        if not seed_mutators:
+            return False
+        for each_mutator in random.choices(seed_mutators, k=mutate_time):
+            self.wait_exec_mutator_list.put(each_mutator)
+        return True
+
+    def claim_warmup_mutators(self, seed_id, mutate_time):
+        """
+        AFL选中一个预热时已经生成（或正在生成）变异器的种子时调用，代替第一次LLM生成：
+        变异器已就绪时直接把任务发布给它，仍在生成时把任务数记在种子上，由 finish_warmup_generate 发布
+        :return: 是否已经处理（为False时照常生成变异器）
+        """
+        target_seed = self.all_seed_list.seed_list[seed_id]
+        with target_seed.parse_lock:
+            if target_seed.is_warmup_generating:
+                target_seed.warmup_pending_mutate_time += mutate_time
+                return True
+            if not target_seed.is_warmup_ready:
+                return False
+            target_seed.is_warmup_ready = False
+        return self._publish_seed_mutators(seed_id, mutate_time)
+
+    def finish_warmup_generate(self, seed_id, is_success):
+        """
+        预热排队的变异器生成任务结束（成功或失败）时调用，发布期间积累的任务；
+        失败时把积累的任务重新放入生成队列，与没有预热时一样
+        """
+        target_seed = self.all_seed_list.seed_list[seed_id]
+        with target_seed.parse_lock:
+            if not target_seed.is_warmup_generating:
+                return
+            target_seed.is_warmup_generating = False
+            pending_mutate_time = target_seed.warmup_pending_mutate_time
+            target_seed.warmup_pending_mutate_time = 0
+            target_seed.is_warmup_ready = is_success and pending_mutate_time == 0
+        if not pending_mutate_time:
+            return
+        if not (is_success and self._publish_seed_mutators(seed_id, pending_mutate_time)):
+            generate_task = {"seed_id": seed_id, "mutate_time": pending_mutate_time}
+            self.tracer.enqueue(generate_task)
+            self.wait_mutator_generate_list.put(generate_task)
+
     def add_one_seed_to_parse_list(self, seed_buf, mutate_time):
         """
         添加一个种子到待解析列表中
         :param mutate_time: 要变异的次数
         :param seed_buf: 要加入的种子的buf
-        :return: 无返回值
+        :return: 该种子的id
         """
 
         #先将一个种子加入到总列表中，顺便看看是否重复
         is_already_in_list, seed_id = self.all_seed_list.add_seed_to_list(seed_buf)
         self.main_logger.info(f"已将该种子加入到总队列中，该种子的是否为新种子：{is_already_in_list}，该种子编号为：{seed_id}")
         self.all_seed_list.add_one_seed_chose_time_by_index(seed_id) #添加一次被选择次数
+        self.tracer.seed_chosen(seed_id)
         self.main_logger.info(
             f"种子编号：{seed_id} 被选择次数：{self.all_seed_list.seed_list[seed_id].chose_time}")
 
         if self.all_seed_list.seed_list[seed_id].chose_time % self.times_to_structural_mutator == 0:
             self.main_logger.info(f"种子编号：{seed_id} 达到结构化变异标准，进行结构化变异")
             #说明进行一次结构性变异
-            self.structural_mutator_list.put({"seed_id":seed_id , "mutate_time":mutate_time})
+            structural_task = {"seed_id":seed_id , "mutate_time":mutate_time}
+            self.tracer.enqueue(structural_task)
+            self.structural_mutator_list.put(structural_task)
             self.main_logger.info(f"种子编号：{seed_id} 已放入结构化变异队列等待变异，变异次数为{mutate_time}")
             
 
         self.main_logger.info(f"种子编号：{seed_id} 准备进入解析队列")
         #然后直接加入到待parse中
-        self.wait_parse_list.put({"seed_id":seed_id , "mutate_time":mutate_time})
+        parse_task = {"seed_id":seed_id , "mutate_time":mutate_time}
+        self.tracer.enqueue(parse_task)
+        self.wait_parse_list.put(parse_task)
         self.main_logger.info(f"种子编号：{seed_id} 已进入解析队列，变异次数为：{mutate_time}")
-        return 0
+        return seed_id
 
-    def mutate_once(self):
+    def mutate_batch_from_mutator(self, mutator: ChiloMutator.ChiloMutator, max_size=None):
+        """
+        调用一次变异器，批量获取 mutate_batch_size 个变异结果
+        变异器提供 mutate_batch(n) 时直接调用，否则退化为多次调用 mutate()
+        :param mutator: 变异器对象
+        :param max_size: 长度预算，变异器支持时传入
+        :return: 变异结果列表
+        """
+        if mutator.native is not None:
+            target = mutator.native
+        else:
+            if mutator.module is None:
+                mutator.module = mutator_runtime.load_mutator_module(mutator.file_name)
+            target = mutator.module
+        return mutator_runtime.call_mutate_batch(target, self.mutate_batch_size, max_size)
+
+    def _wait_healthy_task(self):
+        """
+        阻塞等待待执行队列中的任务，跳过正在退避或已被禁用的变异器的任务
+        等待期间若有变异器退避结束，则直接改为从变异器池中随机选择
+        :return: 健康的变异器
+        """
+        while True:
+            mutator = self.wait_exec_mutator_list.get()
+            if self.mutator_pool.is_healthy(mutator):
+                return mutator
+            self.mutator_pool.skipped_task_count += 1
+            mutator = self.mutator_pool.random_select_mutator()
+            if mutator is not None:
+                return mutator
+
+    def mutate_once(self, max_size=None):
         """
         在fuzz中调用这个函数，用于返回一个待执行的变异器。
         优先从待执行队列中获取；若队列为空，则从变异器池中随机选择一个。
+        :param max_size: 长度预算，传给支持 max_size 参数的变异器
         :return: 变异器对象或队列中的任务；若两者都不可用则返回None
         是否为随机选择的
         """
@@ -425,9 +721,20 @@ class ChiloFactory:
                     is_first_time = False
                 try:
                     mutator = self.wait_exec_mutator_list.get_nowait()
+                    if not self.mutator_pool.is_healthy(mutator):
+                        # 变异器正在退避或已被禁用，跳过它的任务
+                        self.mutator_pool.skipped_task_count += 1
+                        continue
                     self.main_logger.info("从任务列表中获取任务成功！")
                     is_by_random = False
                 except queue.Empty:
+                    # 任务队列为空，先执行筛查时被降低优先级的测试用例
+                    try:
+                        mutator = self.wait_exec_deferred_list.get_nowait()
+                        self.main_logger.info("从降低优先级的队列中获取测试用例成功！")
+                        break
+                    except queue.Empty:
+                        pass
                     # 队列为空，改为从变异器池中随机选择一个
                     self.main_logger.info("从任务列表为空，准备从变异池随机选择")
                     mutator = self.mutator_pool.random_select_mutator()
@@ -436,7 +743,7 @@ class ChiloFactory:
                 if mutator is not None:
                     break
                 self.main_logger.warning("变异池与任务列表均为空！进入等待！！")
-                mutator = self.wait_exec_mutator_list.get()
+                mutator = self._wait_healthy_task()
                 break
 
         assert mutator is not None
@@ -445,44 +752,50 @@ class ChiloFactory:
             self.main_logger.info(f"从结构化变异队列中取出的变异好的测试用例，种子id：{mutator['seed_id']}")
             return bytearray(mutator['mutate_content'], "utf-8", errors="ignore"), False,\
              mutator['seed_id'], None, None, is_from_structural_mutator
+        if isinstance(mutator, dict):
+            #说明是筛查后被降低优先级的测试用例
+            self.main_logger.info(f"执行降低优先级的测试用例，种子id：{mutator['seed_id']}")
+            return bytearray(mutator['mutate_content'], "utf-8", errors="ignore"), False,\
+             mutator['seed_id'], mutator['mutator_id'], None, mutator['is_from_structural_mutator']
         
         self.main_logger.info(f"变异器任务加载完毕，变异的目标种子id:{mutator.seed_id}，变异器编号为：{mutator.mutator_id}")
-        #下一步就要根据mutator去加载模块，并调用启动了
-        def call_mutate_from_file(filepath):
-            """动态加载指定的Python文件并调用 mutate() 函数"""
-            filepath = os.path.abspath(filepath)
-            module_name = os.path.splitext(os.path.basename(filepath))[0]  # 例如 mu_1_1
-
-            spec = importlib.util.spec_from_file_location(module_name, filepath)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)  # 执行文件内容，加载为模块对象
-
-            if hasattr(module, "mutate"):
-                return module.mutate()  # 调用 mutate 函数并返回结果
-            else:
-                raise AttributeError(f"错误码：1203 {filepath} 中未找到 mutate() 函数")
-
+        #下一步就要根据mutator去加载模块（只加载一次），并调用启动了
         is_mutator_error_occur = False
         while True:
             self.main_logger.info(
                 f"正在等待调用 变异的目标种子id:{mutator.seed_id}，变异器编号为：{mutator.mutator_id}")
             try:
-                mutate_testcase = call_mutate_from_file(mutator.file_name)
+                if not mutator.batch_cache:
+                    mutate_start_time = time.time()
+                    mutator.batch_cache = self.screen_mutator_outputs(mutator, self.mutate_batch_from_mutator(mutator, max_size))
+                    mutator.mutate_use_time += time.time() - mutate_start_time
+                    self.tracer.complete("mutate_batch", mutate_start_time, mutator.seed_id, mutator.mutator_id,
+                                         cat="fuzz")
+                    if mutator.last_error_count:
+                        self.mutator_pool.mark_success(mutator)
+                mutate_testcase = mutator.batch_cache.pop()
                 break
             except:
                 #这里出现问题，那是致命的！将会导致fuzz直接停止
-                #一旦出现问题，那我们就需要立即处理，随机选择其他的变异器
+                #一旦出现问题，那我们就需要立即处理，把它移出健康集合，随机选择其他的变异器
                 self.main_logger.error(
                     f"调用的目标种子id:{mutator.seed_id}，变异器编号为：{mutator.mutator_id} 出现错误，正在随机挑选其他变异器")
                 is_mutator_error_occur = True
-                self.mutator_pool.mutator_list[mutator.mutator_index].is_error = True
-                self.mutator_pool.mutator_list[mutator.mutator_index].last_error_count += 1
+                self.mutator_pool.mark_error(mutator)
+                self.mutator_pool.error_fallback_count += 1
+                self.main_logger.warning(f"变异器池状态：{self.mutator_pool.stats()}")
                 #然后随机选择一个
                 mutator = self.mutator_pool.random_select_mutator()
+                if mutator is None:
+                    self.main_logger.warning("变异池中没有健康的变异器！等待新的变异任务！！")
+                    mutator = self._wait_healthy_task()
                 self.main_logger.warning(
                     f"随机挑选的新的调用的目标种子id:{mutator.seed_id}，变异器编号为：{mutator.mutator_id}")
 
+        mutator.exec_count += 1
         self.all_seed_list.seed_list[mutator.seed_id].mutate_time += 1
+        if self.all_seed_list.seed_list[mutator.seed_id].mutate_time == 1:
+            self.tracer.first_exec(mutator.seed_id, mutator.mutator_id)
         self.main_logger.info(
             f"调用变异完成，为该种子的第{self.all_seed_list.seed_list[mutator.seed_id].mutate_time}次变异 变异的目标种子id:{mutator.seed_id}，变异器编号为：{mutator.mutator_id}")
         return bytearray(mutate_testcase, "utf-8", errors="ignore"), is_by_random, mutator.seed_id, mutator.mutator_id, is_mutator_error_occur, is_from_structural_mutator
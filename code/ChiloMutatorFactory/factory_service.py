@@ -0,0 +1,286 @@
+"""
+通过Unix域套接字对外提供工厂服务
+
+工厂作为独立的守护进程运行（见 chilo_daemon.py），多个AFL实例中的 ChiloMutate 只作为轻量的客户端：
+    fuzz_count  同步地把种子交给工厂，返回种子id
+    fetch       一次取回多个变异好的测试用例（客户端本地预取）
+    report      批量回传执行记录，由守护进程统一写入main.csv
+    credit      AFL把某个变异器产生的测试用例加入了队列，计入该变异器的发现次数
+    open_ring   建立共享内存环形缓冲区（见shm_ring.py），之后测试用例由守护进程直接写入共享内存，
+                不再经过套接字
+    fetch_overflow  取回一个超过环槽位容量的测试用例（环中只有标记为溢出的槽位头）
+
+消息格式：4字节大端长度 + pickle 序列化的字典。套接字文件权限为0600，只允许同一用户的进程连接。
+"""
+import itertools
+import os
+import pickle
+import queue
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+from . import shm_ring
+
+_HEADER = struct.Struct(">I")
+_ring_counter = itertools.count()
+
+
+def send_message(sock: socket.socket, message):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("对端关闭了连接")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket):
+    size, = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return pickle.loads(_recv_exact(sock, size))
+
+
+class FactoryServer:
+    def __init__(self, chilo_factory, socket_path):
+        """
+        :param chilo_factory: 已经启动了后台线程的工厂对象
+        :param socket_path: Unix域套接字路径
+        """
+        self.chilo_factory = chilo_factory
+        self.socket_path = socket_path
+        self.fuzz_count_number = 0
+        self.fuzz_number = 0
+        self.counter_lock = threading.Lock()
+
+    def _mutate_once(self, max_size):
+        """
+        每个客户端一个线程，mutate_once 中变异器的批量缓存、种子列表与变异器池都不是线程安全的，
+        并发调用会让正常的变异器被误判为出错，因此用工厂的 mutate_lock 串行化
+        """
+        with self.chilo_factory.mutate_lock:
+            return self.chilo_factory.mutate_once(max_size)
+
+    def _ring_producer(self, ring: shm_ring.ShmRing, stop_event: threading.Event, max_size, overflow: queue.Queue):
+        """
+        共享内存环的生产者线程：不断调用 mutate_once 并写入环中，直到客户端断开
+        长度预算与套接字传输一样是AFL的max_size，超过槽位容量的测试用例放入 overflow，由客户端通过 fetch_overflow 取回。
+        环由生产者线程自己关闭并删除，客户端断开时它可能正在写入槽位
+        """
+        try:
+            while not stop_event.is_set():
+                mutated_out, is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator = \
+                    self._mutate_once(max_size)
+                is_overflow = len(mutated_out) > ring.capacity
+                if is_overflow:
+                    overflow.put(bytes(mutated_out))
+                if not ring.put(mutated_out, seed_id, mutator_id, is_random, is_error_occur,
+                                is_from_structural_mutator, stop_event=stop_event, overflow=is_overflow):
+                    break
+        finally:
+            ring.close(unlink=True)
+
+    def _handle_open_ring(self, request, state):
+        ring_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        ring_path = os.path.join(ring_dir, f"chilo_ring_{os.getpid()}_{next(_ring_counter)}")
+        ring = shm_ring.ShmRing(ring_path, request["slot_count"], request["slot_size"], create=True)
+        stop_event = threading.Event()
+        state["overflow"] = queue.Queue()
+        producer = threading.Thread(target=self._ring_producer,
+                                    args=(ring, stop_event, request.get("max_size"), state["overflow"]), daemon=True)
+        producer.start()
+        state["rings"].append((stop_event, producer))
+        self.chilo_factory.main_logger.info(f"工厂服务：共享内存环已建立：{ring_path}")
+        return {"ring_path": ring_path}
+
+    def _handle_fuzz_count(self, request, state):
+        with self.counter_lock:
+            self.fuzz_count_number += 1
+        seed_id = self.chilo_factory.add_one_seed_to_parse_list(request["buf"], request["mutate_time"])
+        return {"seed_id": seed_id}
+
+    def _handle_fetch(self, request, state):
+        items = []
+        for _ in range(request["count"]):
+            mutated_out, is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator = \
+                self._mutate_once(request.get("max_size"))
+            items.append((bytes(mutated_out), is_random, seed_id, mutator_id, is_error_occur,
+                          is_from_structural_mutator))
+        return {"items": items, "left_wait_exec_queue_count": self.chilo_factory.wait_exec_mutator_list.qsize()}
+
+    def _handle_fetch_overflow(self, request, state):
+        # 生产者先放入 overflow 再发布槽位，客户端读到溢出槽位时内容一定已经在队列中
+        return {"testcase": state["overflow"].get(timeout=60)}
+
+    def _handle_report(self, request, state):
+        for row in request["rows"]:
+            with self.counter_lock:
+                self.fuzz_number += 1
+                fuzz_number = self.fuzz_number
+                fuzz_count_number = self.fuzz_count_number
+            real_time, is_random, fuzz_use_time, now_seed_id, seed_id, mutator_id, left_queue_count, \
+                ori_size, real_size, is_cut, is_error_occur, is_from_structural_mutator, arm, cut_mode = row
+            self.chilo_factory.write_main_csv(real_time, fuzz_count_number, fuzz_number, is_random, fuzz_use_time,
+                                              now_seed_id, seed_id, mutator_id, left_queue_count, ori_size,
+                                              real_size, is_cut, is_error_occur, is_from_structural_mutator, arm,
+                                              cut_mode)
+        return {"ok": True}
+
+    def _handle_credit(self, request, state):
+        self.chilo_factory.mutator_pool.credit_find(request["seed_id"], request["mutator_id"])
+        return {"ok": True}
+
+    def _serve_client(self, conn: socket.socket):
+        handlers = {"fuzz_count": self._handle_fuzz_count, "fetch": self._handle_fetch,
+                    "report": self._handle_report, "open_ring": self._handle_open_ring,
+                    "credit": self._handle_credit, "fetch_overflow": self._handle_fetch_overflow}
+        state = {"rings": []}
+        self.chilo_factory.main_logger.info("工厂服务：新的AFL客户端已连接")
+        try:
+            while True:
+                request = recv_message(conn)
+                try:
+                    response = handlers[request["op"]](request, state)
+                except Exception as e:
+                    self.chilo_factory.main_logger.error(f"工厂服务：处理请求 {request.get('op')} 失败：{e}")
+                    response = {"error": str(e)}
+                send_message(conn, response)
+        except (ConnectionError, OSError):
+            self.chilo_factory.main_logger.info("工厂服务：AFL客户端已断开")
+        finally:
+            conn.close()
+            for stop_event, producer in state["rings"]:
+                stop_event.set()    # 生产者退出时自己关闭并删除环
+                producer.join(5)
+
+    def serve_forever(self):
+        """
+        监听套接字，每个客户端连接由一个线程处理
+        """
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        server.listen()
+        self.chilo_factory.main_logger.info(f"工厂服务已启动，监听：{self.socket_path}")
+        try:
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class FactoryClient:
+    def __init__(self, socket_path, prefetch_count=32, report_batch_size=64, connect_timeout=300):
+        """
+        AFL进程中使用的客户端
+        :param socket_path: 守护进程的套接字路径
+        :param prefetch_count: 每次从守护进程取回的测试用例个数
+        :param report_batch_size: 攒够多少条执行记录回传一次
+        :param connect_timeout: 等待守护进程启动的最长时间（秒）
+        """
+        self.prefetch_count = prefetch_count
+        self.report_batch_size = report_batch_size
+        self.prefetched = []
+        self.pending_rows = []
+        self.ring = None
+        self.ring_config = None
+        self.left_wait_exec_queue_count = 0
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = time.time() + connect_timeout
+        while True:
+            try:
+                self.sock.connect(socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(1)
+
+    def _call(self, request):
+        send_message(self.sock, request)
+        response = recv_message(self.sock)
+        if "error" in response:
+            raise RuntimeError(f"工厂守护进程返回错误：{response['error']}")
+        return response
+
+    def fuzz_count(self, buf, mutate_time):
+        """
+        同步地把种子交给工厂
+        :return: 工厂中的种子id
+        """
+        return self._call({"op": "fuzz_count", "buf": bytes(buf), "mutate_time": mutate_time})["seed_id"]
+
+    def next_testcase(self, max_size=None):
+        """
+        取一个测试用例，本地预取的用完时一次性再取 prefetch_count 个
+        :param max_size: 长度预算，随取回请求一起传给守护进程中的变异器
+        :return: (测试用例, is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator)
+        """
+        if not self.prefetched:
+            response = self._call({"op": "fetch", "count": self.prefetch_count, "max_size": max_size})
+            self.prefetched = response["items"][::-1]
+            self.left_wait_exec_queue_count = response["left_wait_exec_queue_count"]
+        return self.prefetched.pop()
+
+    def open_ring(self, slot_count=256, slot_size=65536):
+        """
+        切换到共享内存传输：之后用 next_testcase_from_ring 读取
+        环在第一次取测试用例时才真正建立，这样守护进程可以用AFL的max_size作为长度预算
+        """
+        self.ring_config = (slot_count, slot_size)
+
+    def next_testcase_from_ring(self, max_size):
+        """
+        从共享内存环中取一个测试用例，只复制前 max_size 个字节，超过槽位容量的测试用例通过套接字取回
+        :return: (测试用例, 原始长度, is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator)
+        """
+        if self.ring is None:
+            slot_count, slot_size = self.ring_config
+            ring_path = self._call({"op": "open_ring", "slot_count": slot_count, "slot_size": slot_size,
+                                    "max_size": max_size})["ring_path"]
+            self.ring = shm_ring.ShmRing(ring_path, slot_count, slot_size)
+        testcase, ori_size, seed_id, mutator_id, is_random, is_error_occur, is_from_structural_mutator = \
+            self.ring.get(max_size)
+        if testcase is None:
+            testcase = bytearray(self._call({"op": "fetch_overflow"})["testcase"][:max_size])
+        return testcase, ori_size, is_random, seed_id, mutator_id, is_error_occur, is_from_structural_mutator
+
+    def report(self, row):
+        """
+        记录一条执行记录，攒够一批后回传
+        """
+        self.pending_rows.append(row)
+        if len(self.pending_rows) >= self.report_batch_size:
+            self.flush()
+
+    def credit(self, seed_id, mutator_id):
+        """
+        上一个测试用例被AFL加入了队列，通知守护进程计入产生它的变异器
+        """
+        self._call({"op": "credit", "seed_id": seed_id, "mutator_id": mutator_id})
+
+    def flush(self):
+        if self.pending_rows:
+            self._call({"op": "report", "rows": self.pending_rows})
+            self.pending_rows = []
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.ring is not None:
+                self.ring.close()
+            self.sock.close()
@@ -12,17 +12,23 @@ class LLMTool:
     _global_request_count = 0
     _global_count_lock = threading.Lock()
     
-    def __init__(self, llm_api_key, llm_model, base_url, logger:logging.Logger):
+    def __init__(self, llm_api_key, llm_model, base_url, logger:logging.Logger, stage="", metrics=None, tracer=None):
         """
         初始化函数
         :param llm_api_key: LLM的APIKey
         :param llm_model: 选择的LLM模型
         :param base_url: LLM的baseURL
+        :param stage: 使用该工具的阶段名，作为指标的标签
+        :param metrics: 工厂的 metrics.FactoryMetrics，为None时不记录指标
+        :param tracer: 工厂的 tracing.Tracer，为None时不记录追踪事件
         """
         self.llm_api_key = llm_api_key
         self.llm_model = llm_model
         self.base_url = base_url
         self.logger = logger
+        self.stage = stage
+        self.metrics = metrics
+        self.tracer = tracer
         
         # 复用 OpenAI client 实例，提高性能
         self.client = OpenAI(
@@ -54,8 +60,17 @@ class LLMTool:
                     ]
                 )
                 self.logger.info(f"LLM工具已实例化，第{count_now}次请求成功并结束，用时：{time.time()-start_time:.2f}s")
+                if self.metrics is not None:
+                    self.metrics.observe_llm(self.stage, time.time() - start_time, response.usage.prompt_tokens,
+                                             response.usage.completion_tokens)
+                if self.tracer is not None:
+                    self.tracer.complete(f"llm:{self.stage}", start_time, *self.tracer.context(), cat="llm",
+                                         up_token=response.usage.prompt_tokens,
+                                         down_token=response.usage.completion_tokens)
                 return response.choices[0].message.content, response.usage.prompt_tokens, response.usage.completion_tokens
             except Exception as e:
+                if self.metrics is not None:
+                    self.metrics.llm_retry_total.inc(self.stage)
                 self.logger.info(f"LLM工具已实例化，第{count_now}次请求失败！错误信息：{e}")
                 self.logger.info(f"正在重试第{count_now}次请求")
                 continue
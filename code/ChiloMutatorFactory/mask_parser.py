@@ -0,0 +1,145 @@
+"""
+解析LLMParser输出的带掩码SQL
+
+将形如 [CONSTANT, number:1, type:integer, ori:10] 的掩码标注拆分为
+字面量片段列表 segments 与掩码表 masks，满足：
+segments[0] + value(masks[0]) + segments[1] + ... + segments[-1] 即为完整SQL
+
+MaskedSQL 在此基础上再记录语句边界，解析阶段只构建一次，保存在种子上并序列化到 ParsedSQL/{seed_id}.json，
+后续阶段可以直接使用而无需再次用正则扫描
+"""
+import bisect
+import json
+import re
+from typing import List
+
+from . import sql_checker
+
+MASK_PATTERN = re.compile(
+    r"\[\s*(?P<kind>CONSTANT|OPERATOR|FUNCTION|KEYWORD)\s*,\s*number\s*:\s*(?P<number>\d+)\s*,"
+    r"\s*(?P<attr_name>type|category|context)\s*:\s*(?P<attr>[^\]]*?)\s*,\s*ori\s*:\s*"
+    r"(?P<ori>'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|[^\]]*?)\s*\]"
+)
+
+
+class Mask:
+    def __init__(self, kind, number, attr_name, attr, ori, statement_index=0):
+        """
+        一个掩码
+        :param kind: 掩码种类 CONSTANT/OPERATOR/FUNCTION/KEYWORD
+        :param number: LLM标注的编号
+        :param attr_name: 属性名 type/category/context
+        :param attr: 属性值，例如 integer、comparison、constraint
+        :param ori: 原始值
+        :param statement_index: 掩码所在语句的下标
+        """
+        self.kind = kind
+        self.number = number
+        self.attr_name = attr_name
+        self.attr = attr
+        self.ori = ori
+        self.statement_index = statement_index
+
+
+def parse_masked_sql(masked_sql: str):
+    """
+    将带掩码的SQL拆分为字面量片段与掩码表
+    :param masked_sql: LLMParser输出的带掩码SQL
+    :return: (segments, masks)，len(segments) == len(masks) + 1
+    """
+    segments: List[str] = []
+    masks: List[Mask] = []
+    last_end = 0
+    for m in MASK_PATTERN.finditer(masked_sql):
+        segments.append(masked_sql[last_end:m.start()])
+        masks.append(Mask(m.group("kind"), int(m.group("number")), m.group("attr_name"),
+                          m.group("attr").strip(), m.group("ori").strip()))
+        last_end = m.end()
+    segments.append(masked_sql[last_end:])
+    return segments, masks
+
+
+class MaskedSQL:
+    def __init__(self, segments: List[str], masks: List[Mask], statements: List[List[int]]):
+        """
+        带索引的掩码SQL
+        :param segments: 字面量片段，len(segments) == len(masks) + 1
+        :param masks: 掩码表
+        :param statements: 语句边界，每项为 [第一个掩码下标, 最后一个掩码下标+1, 结尾所在片段下标, 结尾在片段中的偏移]
+        """
+        self.segments = segments
+        self.masks = masks
+        self.statements = statements
+
+    @property
+    def mask_count(self):
+        return len(self.masks)
+
+    @property
+    def statement_count(self):
+        return len(self.statements)
+
+    def masks_of_statement(self, statement_index) -> List[Mask]:
+        """
+        获取某条语句中的所有掩码
+        """
+        first_mask, end_mask = self.statements[statement_index][:2]
+        return self.masks[first_mask:end_mask]
+
+    def to_dict(self):
+        return {
+            "segments": self.segments,
+            "masks": [[m.kind, m.number, m.attr_name, m.attr, m.ori, m.statement_index] for m in self.masks],
+            "statements": self.statements,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["segments"], [Mask(*each) for each in data["masks"]], data["statements"])
+
+    def save(self, file_path):
+        """
+        将索引序列化为紧凑的json文件
+        """
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def build_masked_sql(masked_sql: str) -> MaskedSQL:
+    """
+    解析带掩码的SQL并建立语句边界索引
+    语句边界在"用占位值替换掉所有掩码"后的骨架SQL上计算，这样字符串常量中的分号不会干扰拆分
+    :param masked_sql: LLMParser输出的带掩码SQL
+    :return: MaskedSQL对象
+    """
+    segments, masks = parse_masked_sql(masked_sql)
+    placeholder = "0"
+    segment_starts = []
+    mask_positions = []
+    skeleton_length = 0
+    for index, segment in enumerate(segments):
+        segment_starts.append(skeleton_length)
+        skeleton_length += len(segment)
+        if index < len(masks):
+            mask_positions.append(skeleton_length)
+            skeleton_length += len(placeholder)
+    skeleton = placeholder.join(segments)
+    ends = sql_checker.statement_end_offsets(skeleton)
+    if skeleton[ends[-1] if ends else 0:].strip():
+        ends.append(len(skeleton))  # 最后一条不以分号结尾的语句
+
+    for mask, position in zip(masks, mask_positions):
+        mask.statement_index = min(bisect.bisect_right(ends, position), max(len(ends) - 1, 0))
+    statements = []
+    first_mask = 0
+    for statement_index, end in enumerate(ends):
+        end_mask = bisect.bisect_left(mask_positions, end, lo=first_mask)
+        segment_index = bisect.bisect_right(segment_starts, end) - 1
+        statements.append([first_mask, end_mask, segment_index, end - segment_starts[segment_index]])
+        first_mask = end_mask
+    return MaskedSQL(segments, masks, statements)
@@ -0,0 +1,193 @@
+"""
+工厂的实时指标（计数器与直方图），定期以Prometheus文本格式写入 metrics_path，由ChiloDisco的 /metrics 读取
+
+写入方（fuzz、LLM调用等）每个指标各用一把自己的小锁，不使用工厂中任何已有的锁；
+导出线程只复制各指标的字典，队列长度与变异器池状态直接读取属性（len(queue.queue)），不获取队列或变异器池的锁。
+"""
+import os
+import threading
+import time
+
+FUZZ_SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+LLM_SECONDS_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+LLM_TOKENS_BUCKETS = (100, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+
+# 工厂的全部队列：指标中的名字 -> ChiloFactory上的属性名
+QUEUE_ATTRS = {
+    "parse": "wait_parse_list",
+    "generate": "wait_mutator_generate_list",
+    "structural": "structural_mutator_list",
+    "fix": "fix_mutator_list",
+    "exec": "wait_exec_mutator_list",
+    "exec_structural": "wait_exec_structural_list",
+    "exec_deferred": "wait_exec_deferred_list",
+}
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f"{k}=\"{v}\"" for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}    # 标签值元组 -> 计数
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self, base_labels):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(dict(self.values).items()):
+            labels = _format_labels(("instance",) + self.label_names, base_labels + label_values)
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self.values = {}    # 标签值元组 -> [各桶计数..., 总和, 总个数]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self, base_labels):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, counts in sorted(dict(self.values).items()):
+            counts = list(counts)
+            names = ("instance",) + self.label_names
+            values = base_labels + label_values
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, values, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, values, ('le', '+Inf'))} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(names, values)} {counts[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(names, values)} {counts[-1]}")
+        return lines
+
+
+class FactoryMetrics:
+    def __init__(self, instance_id, metrics_path, interval):
+        """
+        :param instance_id: 实例名，作为每个指标的 instance 标签
+        :param metrics_path: 指标文件路径
+        :param interval: 导出间隔（秒），不大于0时不导出
+        """
+        self.instance_id = instance_id or "main"
+        self.metrics_path = metrics_path
+        self.interval = interval
+        self.fuzz_seconds = Histogram("chilo_fuzz_seconds", "fuzz() latency per testcase",
+                                      FUZZ_SECONDS_BUCKETS, ("arm",))
+        self.fuzz_total = Counter("chilo_fuzz_total", "testcases returned to AFL", ("arm",))
+        self.fuzz_fallback_total = Counter("chilo_fuzz_fallback_total",
+                                           "fuzz() fallbacks by reason: random pool pick, mutator error, size cut, structural queue", ("reason",))
+        self.llm_seconds = Histogram("chilo_llm_seconds", "LLM request latency including retries",
+                                     LLM_SECONDS_BUCKETS, ("stage",))
+        self.llm_tokens = Histogram("chilo_llm_tokens", "LLM tokens per request", LLM_TOKENS_BUCKETS,
+                                    ("stage", "direction"))
+        self.llm_retry_total = Counter("chilo_llm_retry_total", "failed LLM requests that were retried", ("stage",))
+        self.started_at = time.time()
+
+    def observe_fuzz(self, fuzz_use_time, arm, is_by_random, is_error_occur, is_cut, is_from_structural_mutator):
+        self.fuzz_seconds.observe(fuzz_use_time, arm)
+        self.fuzz_total.inc(arm)
+        if is_by_random:
+            self.fuzz_fallback_total.inc("random_pool")
+        if is_error_occur:
+            self.fuzz_fallback_total.inc("mutator_error")
+        if is_cut:
+            self.fuzz_fallback_total.inc("cut")
+        if is_from_structural_mutator:
+            self.fuzz_fallback_total.inc("structural")
+
+    def observe_llm(self, stage, use_time, up_token, down_token):
+        self.llm_seconds.observe(use_time, stage)
+        self.llm_tokens.observe(up_token, stage, "up")
+        self.llm_tokens.observe(down_token, stage, "down")
+
+    def _gauge_lines(self, name, help_text, metric_type, samples):
+        """
+        :param samples: [(标签名元组, 标签值元组, 值)]
+        """
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        for label_names, label_values, value in samples:
+            lines.append(f"{name}{_format_labels(('instance',) + label_names, (self.instance_id,) + label_values)} {value}")
+        return lines
+
+    def render(self, chilo_factory):
+        """
+        :return: Prometheus文本格式的全部指标
+        """
+        base_labels = (self.instance_id,)
+        lines = []
+        for metric in (self.fuzz_seconds, self.fuzz_total, self.fuzz_fallback_total, self.llm_seconds,
+                       self.llm_tokens, self.llm_retry_total):
+            lines += metric.render(base_labels)
+        lines += self._gauge_lines("chilo_queue_depth", "items waiting in each factory queue", "gauge",
+                                   [(("queue",), (name,), len(getattr(chilo_factory, attr).queue))
+                                    for name, attr in QUEUE_ATTRS.items()])
+        pool = chilo_factory.mutator_pool
+        lines += self._gauge_lines("chilo_mutator_pool", "mutator pool size and health", "gauge", [
+            (("state",), ("created",), pool.next_mutator_index),
+            (("state",), ("live",), pool.live_count),
+            (("state",), ("healthy",), len(pool.healthy_list)),
+            (("state",), ("backoff",), len(pool.retry_heap)),
+            (("state",), ("disabled",), pool.disabled_count),
+            (("state",), ("evicted",), pool.evicted_count),
+        ])
+        lines += self._gauge_lines("chilo_mutator_pool_events_total", "mutator pool fallback and retry events",
+                                   "counter", [
+            (("event",), ("error_fallback",), pool.error_fallback_count),
+            (("event",), ("skipped_task",), pool.skipped_task_count),
+            (("event",), ("retry",), pool.retry_count),
+        ])
+        lines += self._gauge_lines("chilo_seed_count", "seeds known to the factory", "gauge",
+                                   [((), (), len(chilo_factory.all_seed_list.seed_list))])
+        lines += self._gauge_lines("chilo_uptime_seconds", "seconds since the factory started", "gauge",
+                                   [((), (), time.time() - self.started_at)])
+        return "\n".join(lines) + "\n"
+
+    def write(self, chilo_factory):
+        tmp_path = f"{self.metrics_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render(chilo_factory))
+        os.replace(tmp_path, self.metrics_path)
+
+
+def export_metrics(chilo_factory):
+    """
+    指标导出线程入口：每隔 interval 秒重写一次指标文件
+    """
+    metrics: FactoryMetrics = chilo_factory.metrics
+    chilo_factory.main_logger.info(f"指标导出线程启动成功，文件：{metrics.metrics_path}，间隔：{metrics.interval}s")
+    while True:
+        try:
+            metrics.write(chilo_factory)
+        except Exception as e:
+            chilo_factory.main_logger.warning(f"指标写入失败：{e}")
+        time.sleep(metrics.interval)
@@ -1,10 +1,11 @@
-import importlib.util
 import os
 import time
 import traceback
 from typing import List
 
 from . import chilo_factory
+from . import mutator_runner
+from . import sql_checker
 from .ChiloMutator import ChiloMutator
 
 
@@ -53,10 +54,11 @@ INSERT INTO t1 VALUES ([CONSTANT, number:1, type:smallint(4), ori:9410], [CONSTA
 ---
 ### Possible Semantic Issues
 You should fix the following **semantic errors**, rather than rewriting the entire code:
-1. **Mask not properly replaced** – the generated SQL still contains `[CONSTANT, ...]` placeholders;
+1. **Mask not properly replaced** – the generated SQL still contains `[CONSTANT, ...]`, `[OPERATOR, ...]`, `[FUNCTION, ...]` or `[KEYWORD, ...]` placeholders;
 2. **Insufficient randomness** – more than 25% of the generated SQL statements are too similar or identical;
 3. **Random logic bias** – the number of selected masks per mutation round is constant or unevenly distributed;
-4. **Minor logical issues** – such as missing type handling or incorrect string concatenation.
+4. **Minor logical issues** – such as missing type handling or incorrect string concatenation;
+5. **Malformed SQL** – most generated statements cannot be parsed (e.g., broken quoting, missing separators).
 ---
 ### Repair Objectives
 - Modify only the necessary logic to correct semantic errors;
@@ -84,20 +86,6 @@ Do not include explanations, comments, or any non-code text inside the code bloc
 Do not rewrite the entire program — fix only the semantic errors while keeping the existing structure.
 """
     return prompt
-def call_mutate_from_file(filepath):
-    """动态加载指定的Python文件并调用 mutate() 函数"""
-    filepath = os.path.abspath(filepath)
-    module_name = os.path.splitext(os.path.basename(filepath))[0]  # 例如 mu_1_1
-
-    spec = importlib.util.spec_from_file_location(module_name, filepath)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)  # 执行文件内容，加载为模块对象
-
-    if hasattr(module, "mutate"):
-        return module.mutate()  # 调用 mutate 函数并返回结果
-    else:
-        raise AttributeError(f"错误码：1203 该变异器中未找到 mutate() 函数")
-
 def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
     """
     用于修复变异器的线程方法
@@ -111,10 +99,7 @@ def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
     # 3. 多次生成的结果不同，具有随机性
     # 4. 每有一个条件不满足，就要从新的修复
     my_chilo_factory.mutator_fixer_logger.info(f"变异器修复器[线程{thread_id}]已启动~")
-    
-    # 为每个线程创建独立的临时文件路径
-    thread_tmp_path = my_chilo_factory.mutator_fix_tmp_path.replace(".py", f"_thread{thread_id}.py")
-    
+
     while True: #每次循环处理一个
         all_start_time = time.time()
         syntax_fix_use_time_all = 0
@@ -134,39 +119,48 @@ def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
         semantic_llm_format_error = 0
         semantic_up_token_all = 0
         semantic_down_token_all = 0
+        semantic_sql_error_count = 0
+        sql_valid_ratio = None
         at_last_is_all_correct = True
         my_chilo_factory.mutator_fixer_logger.info(f"[线程{thread_id}]等待接收变异器修复任务")
         need_fix = my_chilo_factory.fix_mutator_list.get()  #先从队列中取一个用来修复
+        my_chilo_factory.tracer.dequeue("fix", need_fix)
         fix_seed_id = need_fix["seed_id"]
         fix_mutate_time = need_fix["mutate_time"]
         fix_mutator_code = need_fix["mutator_code"]
         my_chilo_factory.mutator_fixer_logger.info(f"[线程{thread_id}]接收到变异器修复任务，seed_id：{fix_seed_id}，变异次数：{fix_mutate_time}")
         while True: #用于检测修复的循环
-            # 先保存到临时文件（使用线程独立的临时文件）
-            my_chilo_factory.mutator_fixer_logger.info(
-                f"[线程{thread_id}]seed_id：{fix_seed_id}，等待写入临时文件")
-            with open(thread_tmp_path, "w", encoding="utf-8") as f:
-                f.write(fix_mutator_code)  # 保存到文件
-            my_chilo_factory.mutator_fixer_logger.info(
-                f"[线程{thread_id}]seed_id：{fix_seed_id}，已写入至临时文件")
-            # 准备调用运行一下
+            # 准备调用运行一下（在内存中编译一次，并在隔离的子进程中并行试运行）
             fix_reason = []
             try:
                 my_chilo_factory.mutator_fixer_logger.info(
                     f"[线程{thread_id}]seed_id：{fix_seed_id}，准备试运行")
-                mutate_result = [call_mutate_from_file(thread_tmp_path) for _ in range(my_chilo_factory.fix_mutator_try_time)]
+                validate_start_time = time.time()
+                trial_result = mutator_runner.run_mutator_trials(fix_mutator_code,
+                                                                 my_chilo_factory.fix_mutator_try_time,
+                                                                 my_chilo_factory.fix_validate_timeout,
+                                                                 my_chilo_factory.fix_validate_memory_limit_mb,
+                                                                 my_chilo_factory.fix_validate_worker_count)
+                my_chilo_factory.tracer.complete("validate", validate_start_time, fix_seed_id,
+                                                 timed_out=trial_result['timed_out'])
+                my_chilo_factory.mutator_fixer_logger.info(
+                    f"[线程{thread_id}]seed_id：{fix_seed_id}，试运行结束，用时：{trial_result['use_time']:.2f}s，是否超时：{trial_result['timed_out']}")
+                if trial_result["traceback"] is not None:
+                    raise mutator_runner.MutatorTrialError(trial_result["traceback"])
+                mutate_result = trial_result["outputs"]
                 # 这里证明至少语法没问题，那就检测并修复修复语义
                 sematic_fix_start_time = time.time()
                 my_chilo_factory.mutator_fixer_logger.info(
                     f"seed_id：{fix_seed_id}，试运行成功，语法正确，准备检验语义正确性")
-                is_semantics_correct: List[None | bool] = [None, None]
+                is_semantics_correct: List[None | bool] = [None, None, True]
                 #语义判断
-                #首先是判断，输出的东西中不能含有掩码
+                #首先是判断，输出的东西中不能含有任何一种掩码
                 my_chilo_factory.mutator_fixer_logger.info(
                     f"seed_id：{fix_seed_id}，正在进行掩码输出语义检测")
                 for each_mutate_result in mutate_result:
-                    if "CONSTANT" in each_mutate_result:
-                        fix_reason.append("The generated mutated SQL statement still includes mask placeholders.")
+                    leaked_mask_kinds = sql_checker.find_mask_leaks(each_mutate_result)
+                    if leaked_mask_kinds:
+                        fix_reason.append(f"The generated mutated SQL statement still includes mask placeholders: {', '.join(sorted(leaked_mask_kinds))}.")
                         is_semantics_correct[0] = False
                         sematic_mask_error_count += 1
                         break
@@ -184,6 +178,19 @@ def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
                 else:
                     is_semantics_correct[1] = True
 
+                #可选：借助sqlite3解析器检测输出SQL的格式是否良好
+                if my_chilo_factory.fix_sql_check_enable:
+                    my_chilo_factory.mutator_fixer_logger.info(
+                        f"seed_id：{fix_seed_id}，正在进行SQL格式良好性检测")
+                    sql_valid_count, sql_all_count = sql_checker.count_well_formed_statements(mutate_result)
+                    sql_valid_ratio = sql_valid_count / sql_all_count if sql_all_count else 0.0
+                    my_chilo_factory.mutator_fixer_logger.info(
+                        f"seed_id：{fix_seed_id}，可被解析的语句占比：{sql_valid_ratio:.2%}（{sql_valid_count}/{sql_all_count}）")
+                    if sql_valid_ratio < my_chilo_factory.fix_sql_valid_min_ratio:
+                        is_semantics_correct[2] = False
+                        semantic_sql_error_count += 1
+                        fix_reason.append(f"Only {sql_valid_ratio:.0%} of the generated SQL statements can be parsed by {my_chilo_factory.target_dbms}; most mutations produce syntax errors.")
+
                 my_chilo_factory.mutator_fixer_logger.info(
                     f"seed_id：{fix_seed_id}，语义检测结果为：{is_semantics_correct}")
                 if all(is_semantics_correct) or semantic_error_count >= my_chilo_factory.semantic_fix_max_time:
@@ -240,6 +247,8 @@ def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
                     my_chilo_factory.mutator_fixer_logger.error(
                         f"[线程{thread_id}]seed_id：{fix_seed_id}，语法错误修复次数超过上限{my_chilo_factory.syntax_error_max_retry}，放弃该变异器")
                     # 记录CSV后直接跳过该任务
+                    if need_fix.get("is_warmup"):
+                        my_chilo_factory.finish_warmup_generate(fix_seed_id, False)
                     all_end_time = time.time()
                     my_chilo_factory.write_mutator_fixer_csv(all_end_time, fix_seed_id, all_end_time-all_start_time,
                                                       -1, fix_mutate_time, llm_use_count, syntax_fix_use_time_all,
@@ -248,12 +257,16 @@ def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
                                                       sematic_fix_use_time_all, sematic_mask_error_count, sematic_random_error_count,
                                                       semantic_error_count, semantic_error_llm_use_time, semantic_error_llm_count,
                                                       semantic_llm_format_error, semantic_up_token_all, semantic_down_token_all, 
-                                                      my_chilo_factory.fix_mutator_list.qsize(), False)
+                                                      my_chilo_factory.fix_mutator_list.qsize(), False,
+                                                      semantic_sql_error_count, sql_valid_ratio)
                     continue  # 跳过任务发布，直接处理下一个变异器
                 
                 my_chilo_factory.mutator_fixer_logger.info(
                     f"[线程{thread_id}]seed_id：{fix_seed_id}，试运行失败，出现语法错误，准备进行第 {syntax_error_count} 次语法修复")
-                error_trace = traceback.format_exc()
+                if isinstance(e, mutator_runner.MutatorTrialError):
+                    error_trace = e.trace_text
+                else:
+                    error_trace = traceback.format_exc()
                 # 出问题那就是语法有问题，调用LLM修复
                 fix_syntax_prompt = get_fix_syntax_prompt(fix_mutator_code, error_trace)
                 while True:
@@ -313,12 +326,15 @@ def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
             f.write(fix_mutator_code)  # 保存到文件
         my_chilo_factory.mutator_fixer_logger.info(
             f"[线程{thread_id}]seed_id：{fix_seed_id}，mutator_id：{now_mutator_id} 已保存到文件")
+        if my_chilo_factory.shared_store is not None:
+            fix_seed = my_chilo_factory.all_seed_list.seed_list[fix_seed_id]
+            my_chilo_factory.shared_store.publish_mutator(fix_seed.seed_sha, fix_seed.seed_buf, fix_mutator_code)
+            my_chilo_factory.mutator_fixer_logger.info(
+                f"[线程{thread_id}]seed_id：{fix_seed_id}，mutator_id：{now_mutator_id} 已发布到共享存储")
 
         # 构建一个变异器（使用锁保护mutator_pool操作）
         with my_chilo_factory.mutator_pool_lock:
-            mutator_index = my_chilo_factory.mutator_pool.add_mutator(fix_seed_id, now_mutator_id)
-        
-        mutator_add_in_exec = my_chilo_factory.mutator_pool.mutator_list[mutator_index]
+            mutator_add_in_exec = my_chilo_factory.mutator_pool.add_mutator(fix_seed_id, now_mutator_id)
         my_chilo_factory.mutator_fixer_logger.info(
             f"[线程{thread_id}]seed_id：{fix_seed_id}，mutator_id：{now_mutator_id} 变异器构造完成")
 
@@ -326,14 +342,19 @@ def fix_mutator(my_chilo_factory: chilo_factory.ChiloFactory, thread_id=0):
             my_chilo_factory.wait_exec_mutator_list.put(mutator_add_in_exec)    #构建待执行任务
         my_chilo_factory.mutator_fixer_logger.info(
             f"[线程{thread_id}]seed_id：{fix_seed_id}，mutator_id：{now_mutator_id} 任务发布成功，变异次数：{fix_mutate_time}")
+        if need_fix.get("is_warmup"):
+            # 预热生成的变异器就绪，发布生成期间AFL选中该种子积累的任务
+            my_chilo_factory.finish_warmup_generate(fix_seed_id, True)
         my_chilo_factory.mutator_fixer_logger.info(
             f"[线程{thread_id}]"+"-"*10)
         left_fix_queue_size = my_chilo_factory.fix_mutator_list.qsize()
         all_end_time = time.time()
+        my_chilo_factory.tracer.complete("fix", all_start_time, fix_seed_id, now_mutator_id, end_time=all_end_time)
         my_chilo_factory.write_mutator_fixer_csv(all_end_time, fix_seed_id, all_end_time-all_start_time,
                                           now_mutator_id, fix_mutate_time, llm_use_count, syntax_fix_use_time_all,
                                           syntax_error_count, syntax_llm_format_error_count, syntax_fix_use_time_llm,
                                           syntax_llm_count, syntax_fix_up_token_all, syntax_fix_down_token_all,
                                           sematic_fix_use_time_all, sematic_mask_error_count, sematic_random_error_count,
                                           semantic_error_count, semantic_error_llm_use_time, semantic_error_llm_count,
-                                          semantic_llm_format_error, semantic_up_token_all, semantic_down_token_all, left_fix_queue_size, at_last_is_all_correct)
+                                          semantic_llm_format_error, semantic_up_token_all, semantic_down_token_all, left_fix_queue_size, at_last_is_all_correct,
+                                          semantic_sql_error_count, sql_valid_ratio)
@@ -0,0 +1,162 @@
+"""
+在独立子进程中试运行变异器代码
+
+变异器代码在内存中编译（不经过临时文件），然后由 forkserver 启动若干子进程并行执行多次 mutate()，
+每个子进程有时间与内存上限，所有输出和 traceback 通过一条消息一次性返回。
+这样 LLM 生成的代码即使死循环、爆内存或崩溃，也不会影响 AFL 所在的进程。
+
+不能直接从AFL进程 fork：那时解析、生成、修复等线程都在运行，若某个线程恰好持有锁，
+子进程会在该锁上死锁，表现为超时并被当作变异器的错误交给LLM修复。
+forkserver 是一个只预加载了本模块的单线程进程，子进程都从它 fork 出来，源码传给子进程再编译。
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+import types
+
+from . import mutator_runtime
+
+
+class MutatorTrialError(Exception):
+    """
+    变异器试运行失败，trace_text 为子进程中捕获的完整错误信息
+    """
+    def __init__(self, trace_text):
+        super().__init__(trace_text)
+        self.trace_text = trace_text
+
+
+def compile_mutator(mutator_code, file_name="<chilo_mutator>"):
+    """
+    在内存中编译变异器代码，不经过临时文件
+    :param mutator_code: 变异器的python源码
+    :param file_name: 出错时traceback中显示的文件名
+    :return: 编译后的code对象，出现语法错误时抛出SyntaxError
+    """
+    return compile(mutator_code, file_name, "exec")
+
+
+def _vm_size_bytes():
+    """
+    读取当前进程已使用的虚拟内存大小，读取失败返回0
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+
+_trial_context = None
+
+
+def _python_executable():
+    """
+    嵌入在afl-fuzz中运行时 sys.executable 可能不是python解释器，启动forkserver需要真正的解释器
+    """
+    if os.path.basename(sys.executable).startswith("python"):
+        return sys.executable
+    return os.path.join(sys.exec_prefix, "bin", f"python{sys.version_info.major}.{sys.version_info.minor}")
+
+
+def _get_trial_context():
+    """
+    :return: 试运行使用的 forkserver 上下文，第一次调用时设置解释器路径与预加载模块
+    """
+    global _trial_context
+    if _trial_context is None:
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_executable(_python_executable())
+        ctx.set_forkserver_preload([__name__])
+        _trial_context = ctx
+    return _trial_context
+
+
+def _trial_worker(mutator_code, trial_count, memory_limit_mb, conn):
+    """
+    子进程入口：编译并执行变异器，获取 trial_count 个变异结果（优先使用 mutate_batch）
+    :param mutator_code: 变异器的python源码（code对象不能跨进程传递，在子进程中重新编译）
+    :param trial_count: 本子进程需要调用mutate()的次数
+    :param memory_limit_mb: 相对于子进程启动时额外允许使用的内存（MB），<=0表示不限制
+    :param conn: 用于回传结果的管道
+    """
+    try:
+        if memory_limit_mb > 0:
+            limit = _vm_size_bytes() + memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        module = types.ModuleType("chilo_mutator_trial")
+        sys.modules[module.__name__] = module
+        exec(compile_mutator(mutator_code), module.__dict__)
+        if not callable(getattr(module, "mutate", None)):
+            raise AttributeError("错误码：1203 该变异器中未找到 mutate() 函数")
+        outputs = mutator_runtime.call_mutate_batch(module, trial_count)
+        conn.send({"outputs": outputs, "traceback": None})
+    except BaseException:
+        try:
+            conn.send({"outputs": [], "traceback": traceback.format_exc()})
+        except Exception:
+            pass
+    finally:
+        conn.close()
+
+
+def run_mutator_trials(mutator_code, trial_count, timeout=30, memory_limit_mb=2048, worker_count=1):
+    """
+    先在本进程编译一次变异器代码检查语法，再在隔离的子进程中并行调用 trial_count 次 mutate()
+    :param mutator_code: 变异器的python源码
+    :param trial_count: 总共需要调用mutate()的次数
+    :param timeout: 所有子进程的总超时时间（秒）
+    :param memory_limit_mb: 每个子进程额外允许使用的内存（MB）
+    :param worker_count: 并行的子进程个数
+    :return: 字典 {"outputs": 所有输出, "traceback": 错误信息或None, "timed_out": 是否超时, "use_time": 用时}
+    """
+    start_time = time.time()
+    try:
+        compile_mutator(mutator_code)
+    except Exception:
+        return {"outputs": [], "traceback": traceback.format_exc(), "timed_out": False,
+                "use_time": time.time() - start_time}
+
+    worker_count = max(1, min(worker_count, trial_count))
+    shares = [trial_count // worker_count + (1 if i < trial_count % worker_count else 0)
+              for i in range(worker_count)]
+    ctx = _get_trial_context()
+    workers = []
+    for share in shares:
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=_trial_worker, args=(mutator_code, share, memory_limit_mb, child_conn), daemon=True)
+        p.start()
+        child_conn.close()
+        workers.append((p, parent_conn))
+
+    deadline = start_time + timeout
+    outputs = []
+    error_trace = None
+    timed_out = False
+    for p, conn in workers:
+        if error_trace is not None:
+            break
+        try:
+            if not conn.poll(max(0.0, deadline - time.time())):
+                timed_out = True
+                error_trace = f"TimeoutError: mutate() 在 {timeout}s 内未能完成 {trial_count} 次调用（可能存在死循环或过慢的变异逻辑）"
+                break
+            result = conn.recv()
+        except (EOFError, OSError):
+            p.join(1)
+            error_trace = f"RuntimeError: 试运行子进程异常退出，exitcode={p.exitcode}（可能超出内存上限或发生崩溃）"
+            break
+        if result["traceback"] is not None:
+            error_trace = result["traceback"]
+        outputs.extend(result["outputs"])
+
+    for p, conn in workers:
+        conn.close()
+        if p.is_alive():
+            p.kill()
+        p.join()
+    return {"outputs": outputs if error_trace is None else [], "traceback": error_trace,
+            "timed_out": timed_out, "use_time": time.time() - start_time}
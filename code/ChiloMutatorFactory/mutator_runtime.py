@@ -0,0 +1,159 @@
+"""
+变异器运行时的公共工具
+
+1. 加载变异器模块（每个变异器只加载一次）
+2. 批量调用约定：变异器可以可选地提供 mutate_batch(n)，一次返回n个变异结果；
+   没有提供时透明地退化为调用n次 mutate()
+3. 批量变异的辅助函数：一次性为n个输出抽取所有随机决策，并基于预先切分好的片段拼接结果
+4. 长度预算：mutate()/mutate_batch() 可以可选地接受 max_size 参数，仍然超长的测试用例在最后一个完整语句处截断
+"""
+import importlib.util
+import inspect
+import os
+import random
+import weakref
+from typing import List
+
+from . import sql_checker
+
+# 测试用例的截断方式（写入main.csv的cut_mode列）
+CUT_NONE = "none"           # 没有超出长度预算
+CUT_STATEMENT = "statement"  # 在最后一个完整语句的结尾处截断
+CUT_BYTE = "byte"           # 预算内没有完整语句，只能按字节截断
+
+_accepts_max_size_cache = weakref.WeakKeyDictionary()   # 函数 -> 是否接受 max_size 参数
+
+
+def load_mutator_module(file_path):
+    """
+    动态加载指定的Python文件，返回模块对象
+    :param file_path: 变异器文件路径
+    :return: 模块对象
+    :exception: 错误码1203 文件中没有 mutate() 函数
+    """
+    file_path = os.path.abspath(file_path)
+    module_name = os.path.splitext(os.path.basename(file_path))[0]  # 例如 mu_1_1
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # 执行文件内容，加载为模块对象
+    if not callable(getattr(module, "mutate", None)):
+        raise AttributeError(f"错误码：1203 {file_path} 中未找到 mutate() 函数")
+    return module
+
+
+def _accepts_max_size(func) -> bool:
+    """
+    判断变异器函数是否接受 max_size 参数（旧的变异器只有无参的 mutate()）
+    """
+    # 绑定方法按其底层函数缓存，避免缓存持有变异器对象；弱引用缓存不会让被淘汰的变异器模块中的函数无法释放
+    func = getattr(func, "__func__", func)
+    try:
+        return _accepts_max_size_cache[func]
+    except (KeyError, TypeError):
+        pass
+    try:
+        parameters = inspect.signature(func).parameters.values()
+        accepts = any(p.name == "max_size" or p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters)
+    except (TypeError, ValueError):
+        accepts = False
+    try:
+        _accepts_max_size_cache[func] = accepts
+    except TypeError:
+        pass    # 不支持弱引用的可调用对象（如内置函数）不缓存
+    return accepts
+
+
+def call_mutate_batch(mutator, n, max_size=None) -> List[str]:
+    """
+    从变异器（模块或对象）中获取n个变异结果，优先调用 mutate_batch(n)
+    :param mutator: 具有 mutate()，可选具有 mutate_batch(n) 的模块或对象
+    :param n: 需要的结果个数
+    :param max_size: 长度预算，变异器接受 max_size 参数时传入
+    :return: 变异结果列表
+    :exception: TypeError 返回值不是由str组成的列表
+    """
+    mutate_batch = getattr(mutator, "mutate_batch", None)
+    if callable(mutate_batch):
+        if max_size is not None and _accepts_max_size(mutate_batch):
+            outputs = mutate_batch(n, max_size=max_size)
+        else:
+            outputs = mutate_batch(n)
+        if not isinstance(outputs, (list, tuple)) or not outputs:
+            raise TypeError(f"mutate_batch() 的返回值必须为非空的 list，实际为 {type(outputs).__name__}")
+        outputs = list(outputs)
+    elif max_size is not None and _accepts_max_size(mutator.mutate):
+        outputs = [mutator.mutate(max_size=max_size) for _ in range(n)]
+    else:
+        outputs = [mutator.mutate() for _ in range(n)]
+    for each_output in outputs:
+        if not isinstance(each_output, str):
+            raise TypeError(f"mutate() 的返回值必须为 str，实际为 {type(each_output).__name__}")
+    return outputs
+
+
+def batch_choice(table, n):
+    """
+    从候选表中一次性有放回地抽取n个值
+    """
+    return random.choices(table, k=n)
+
+
+def batch_select_masks(mask_count, n, low_ratio=0.3, high_ratio=0.7):
+    """
+    一次性为n个输出决定各自要变异哪些掩码
+    :param mask_count: 掩码个数
+    :param n: 输出个数
+    :param low_ratio: 每个输出至少变异的掩码比例
+    :param high_ratio: 每个输出至多变异的掩码比例
+    :return: 按掩码组织的列表，第j项为需要变异第j个掩码的输出下标列表
+    """
+    low = max(1, int(mask_count * low_ratio))
+    high = max(low, int(mask_count * high_ratio))
+    rows_by_mask: List[List[int]] = [[] for _ in range(mask_count)]
+    all_masks = range(mask_count)
+    for row, k in enumerate(random.choices(range(low, high + 1), k=n)):
+        for mask_index in random.sample(all_masks, k):
+            rows_by_mask[mask_index].append(row)
+    return rows_by_mask
+
+
+def assemble_batch(segments: List[str], columns: List[List[str]]) -> List[str]:
+    """
+    根据预先切分好的字面量片段与按掩码组织的取值列，拼接出所有输出
+    :param segments: 字面量片段，len(segments) == len(columns) + 1
+    :param columns: 第j列为第j个掩码在各个输出中的取值
+    :return: 拼接好的输出列表
+    """
+    if not columns:
+        return [segments[0]]
+    outputs = []
+    tail_segments = segments[1:]
+    for values in zip(*columns):
+        parts = [segments[0]]
+        for value, segment in zip(values, tail_segments):
+            parts.append(value)
+            parts.append(segment)
+        outputs.append("".join(parts))
+    return outputs
+
+
+def fit_testcase(testcase: bytearray, max_size, ori_size=None):
+    """
+    原地把测试用例截断到 max_size 以内，尽量在最后一个完整语句的结尾处截断，避免留下无法解析的半条语句
+    :param testcase: 测试用例（可能已经只是原始内容的前缀，例如从共享内存环中只复制了前max_size个字节）
+    :param max_size: 长度上限
+    :param ori_size: 测试用例的原始长度，默认为 len(testcase)
+    :return: 截断方式 CUT_NONE / CUT_STATEMENT / CUT_BYTE
+    """
+    if ori_size is None:
+        ori_size = len(testcase)
+    if ori_size <= max_size and len(testcase) >= ori_size:
+        return CUT_NONE
+    limit = min(max_size, len(testcase))
+    # latin-1 与字节一一对应，UTF-8多字节字符中不会出现分号与引号，因此得到的位置就是字节位置
+    ends = sql_checker.statement_end_offsets(testcase[:limit].decode("latin-1"))
+    if ends:
+        del testcase[ends[-1]:]
+        return CUT_STATEMENT
+    del testcase[limit:]
+    return CUT_BYTE
@@ -0,0 +1,157 @@
+"""
+按需启动的采样分析器，用于查看fuzz()热路径与工厂线程的时间花在哪里
+
+平时只有一个每秒检查一次控制文件的守护线程，不影响fuzz()；触发后在 duration 秒内每隔 interval 秒
+采样一次 sys._current_frames() 中所有线程的调用栈，结束后写入 <output_dir>/<name>_<pid>_<时间>.folded
+（折叠栈格式，每行 "线程名;外层函数;...;内层函数 次数"，可直接交给 flamegraph.pl 或在 speedscope 中打开）。
+触发方式：
+    kill -USR2 <pid>                      （只在主线程中安装信号处理函数时可用）
+    echo 60 > <output_dir>/profile.request （修改时间变化即触发，内容为可选的采样秒数；所有进程都会各自采样一次）
+"""
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+
+CONTROL_FILE_NAME = "profile.request"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, thread_name):
+    """
+    :return: 折叠栈字符串，根在前
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir, name, interval=0.005, duration=30, logger=None):
+        """
+        :param output_dir: 折叠栈文件的输出目录
+        :param name: 文件名前缀（如 afl_main、daemon）
+        :param interval: 采样间隔（秒）
+        :param duration: 默认的采样时长（秒）
+        :param logger: 日志对象，为None时不记录日志
+        """
+        self.output_dir = output_dir
+        self.name = name
+        self.interval = interval
+        self.duration = duration
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.sampler_thread = None
+        self.helper_idents = set()  # 采样线程与控制文件监视线程本身不采样
+
+    def _log(self, message):
+        if self.logger is not None:
+            self.logger.info(message)
+
+    def is_running(self):
+        return self.sampler_thread is not None and self.sampler_thread.is_alive()
+
+    def start(self, duration=None):
+        """
+        开始一次采样，已经在采样时忽略
+        :return: 是否开始了新的采样
+        """
+        with self.lock:
+            if self.is_running():
+                return False
+            self.sampler_thread = threading.Thread(target=self._sample, args=(duration or self.duration,),
+                                                   name="ChiloProfiler", daemon=True)
+            self.sampler_thread.start()
+            return True
+
+    def _sample(self, duration):
+        self.helper_idents.add(threading.get_ident())
+        self._log(f"采样分析开始，时长：{duration}s，间隔：{self.interval}s")
+        stacks = collections.Counter()
+        sample_count = 0
+        start_time = time.time()
+        end_time = start_time + duration
+        while time.time() < end_time:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in self.helper_idents:
+                    continue
+                stacks[collapse_stack(frame, thread_names.get(ident, f"thread-{ident}"))] += 1
+            sample_count += 1
+            time.sleep(self.interval)
+        try:
+            path = self.write(stacks, start_time)
+        except OSError as e:
+            self._log(f"采样结果写入失败：{e}")
+            return
+        self._log(f"采样分析结束，共采样{sample_count}次，结果：{path}")
+        for label, count in self.top_self_frames(stacks, 10):
+            self._log(f"    {count / max(1, sample_count):8.2%}  {label}")
+
+    def write(self, stacks, start_time):
+        os.makedirs(self.output_dir, exist_ok=True)
+        time_str = time.strftime("%Y%m%d-%H%M%S", time.localtime(start_time))
+        path = os.path.join(self.output_dir, f"{self.name}_{os.getpid()}_{time_str}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    @staticmethod
+    def top_self_frames(stacks, n):
+        """
+        :return: 自身耗时（栈顶）最多的 n 个函数 [(函数, 次数)]
+        """
+        self_count = collections.Counter()
+        for stack, count in stacks.items():
+            self_count[stack.rsplit(";", 1)[-1]] += count
+        return self_count.most_common(n)
+
+    def install_signal(self, signum=signal.SIGUSR2):
+        """
+        收到信号时开始一次采样，不在主线程中时无法安装，返回False
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, lambda *_: self.start())
+        return True
+
+    def watch_control_file(self, poll_interval=1.0):
+        """
+        启动监视控制文件的守护线程，控制文件的修改时间变化时开始一次采样
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        control_path = os.path.join(self.output_dir, CONTROL_FILE_NAME)
+
+        def _watch():
+            self.helper_idents.add(threading.get_ident())
+            last_mtime = os.path.getmtime(control_path) if os.path.exists(control_path) else None
+            while True:
+                time.sleep(poll_interval)
+                try:
+                    mtime = os.path.getmtime(control_path)
+                except OSError:
+                    continue
+                if mtime == last_mtime:
+                    continue
+                last_mtime = mtime
+                try:
+                    with open(control_path, "r", encoding="utf-8") as f:
+                        content = f.read().strip()
+                    duration = float(content) if content else None
+                except (OSError, ValueError):
+                    duration = None
+                self.start(duration)
+
+        watcher = threading.Thread(target=_watch, name="ChiloProfilerWatcher", daemon=True)
+        watcher.start()
+        return watcher
@@ -1,4 +1,5 @@
 import hashlib
+import threading
 from typing import List
 
 
@@ -17,7 +18,14 @@ class AFLSeed:
         self.mutate_time = 0    # 该种子被变异的次数（调用fuzz）
         self.is_parsed = False      # 表明该种子是否已经被解析了
         self.parser_content = None  # 该种子的解析结果
+        self.parsed_index = None    # 解析结果的结构化索引（mask_parser.MaskedSQL对象）
         self.next_mutator_id = 0
+        self.generate_round = 0    # 该种子进入变异器生成阶段的次数（多实例FUZZ时用于分配生成任务）
+        self.template_mutator = None    # 由解析结果本地编译出的模板变异器（ChiloMutator对象）
+        self.parse_lock = threading.Lock()  # 保证同一个种子只被解析一次（解析线程与预热线程可能同时处理它）
+        self.is_warmup_generating = False   # 预热线程已为该种子排队生成LLM变异器，尚未完成
+        self.is_warmup_ready = False        # 预热生成的变异器已就绪，还没有被AFL第一次选中使用
+        self.warmup_pending_mutate_time = 0     # 预热生成完成前AFL选中该种子积累的任务数，生成完成后发布
 
 
 class AFLSeedList:
@@ -25,6 +33,7 @@ class AFLSeedList:
         self.seed_list: List[AFLSeed] = []
         self.seed_sha_map = {}   # 用于快速查找：sha1 -> index
         self.next_seed_id = 0    # 下一个种子id，下一个id-1就是当前最大的id
+        self.lock = threading.Lock()    # AFL线程与预热线程都会添加种子
 
     def add_seed_to_list(self, seed_buf):
         """
@@ -33,18 +42,19 @@ class AFLSeedList:
         :return: 添加的这个种子的下标，以及是否为新种子
         """
         tmp_seed_sha = hashlib.sha1(seed_buf).hexdigest()
-        seed_index = self.seed_sha_map.get(tmp_seed_sha, -1)
+        with self.lock:
+            seed_index = self.seed_sha_map.get(tmp_seed_sha, -1)
 
-        if seed_index == -1:
-            # 说明是一个新的种子，需要重新添加
-            new_seed = AFLSeed(self.next_seed_id, seed_buf)
-            self.seed_sha_map[new_seed.seed_sha] = len(self.seed_list)
-            self.seed_list.append(new_seed)
-            self.next_seed_id += 1
-            return False, new_seed.seed_id
-        else:
-            # 说明是个已经存在的种子，直接返回下标即可
-            return True, seed_index
+            if seed_index == -1:
+                # 说明是一个新的种子，需要重新添加
+                new_seed = AFLSeed(self.next_seed_id, seed_buf)
+                self.seed_sha_map[new_seed.seed_sha] = len(self.seed_list)
+                self.seed_list.append(new_seed)
+                self.next_seed_id += 1
+                return False, new_seed.seed_id
+            else:
+                # 说明是个已经存在的种子，直接返回下标即可
+                return True, seed_index
 
     def index_of_seed_buf(self, seed_buf):
         """
@@ -0,0 +1,202 @@
+"""
+多个AFL实例共享的磁盘存储
+
+多核FUZZ时每个AFL实例都有自己的工厂，但解析结果和生成的变异器写入同一个目录，
+这样LLM的开销只需要付出一次，所有实例都能使用所有的变异器。
+
+目录结构：
+    seeds/{seed_sha}.sql         种子的原始字节（与AFL队列项完全相同，seed_sha就是它的sha1）
+    parsed/{seed_sha}.txt        解析结果
+    mutators/{instance}_{seed_sha}_{n}.py  变异器代码
+    claims/{kind}_{key}          抢占标记（O_EXCL创建，谁创建成功谁负责）
+    manifest.jsonl               发布记录，每行一个json，只追加
+
+所有文件都先写到临时文件再 os.replace，读者不会看到写了一半的内容。
+"""
+import fcntl
+import json
+import os
+import random
+import time
+
+
+class SharedStore:
+    def __init__(self, root_path, instance_id):
+        """
+        :param root_path: 共享存储根目录
+        :param instance_id: 当前AFL实例的名字（与 -M/-S 的名字一致）
+        """
+        self.root_path = root_path
+        self.instance_id = instance_id
+        self.manifest_path = os.path.join(root_path, "manifest.jsonl")
+        self.manifest_offset = 0    # 已经读过的manifest字节数
+        self.mutator_count = 0
+        for sub_dir in ("seeds", "parsed", "mutators", "claims"):
+            os.makedirs(os.path.join(root_path, sub_dir), exist_ok=True)
+
+    def _atomic_write(self, relative_path, content):
+        """
+        原子地写入一个文件：先写临时文件，再用 os.replace 替换
+        :param content: 字符串按utf-8写入，bytes/bytearray按原样写入
+        :return: 文件的绝对路径
+        """
+        file_path = os.path.join(self.root_path, relative_path)
+        tmp_path = f"{file_path}.{self.instance_id}.{os.getpid()}.tmp"
+        if isinstance(content, (bytes, bytearray)):
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+        os.replace(tmp_path, file_path)
+        return os.path.abspath(file_path)
+
+    def _append_manifest(self, record):
+        """
+        追加一条发布记录，使用文件锁保证多进程追加时每行完整
+        """
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_claim(self, kind, key):
+        """
+        尝试抢占一项工作（例如解析某个种子），同一个kind+key只有一个实例能抢占成功
+        :return: 是否抢占成功
+        """
+        claim_path = os.path.join(self.root_path, "claims", f"{kind}_{key}")
+        try:
+            fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self.instance_id)
+        return True
+
+    def load_parsed(self, seed_sha):
+        """
+        读取已经发布的解析结果
+        :return: 解析结果，尚未发布时返回None
+        """
+        try:
+            with open(os.path.join(self.root_path, "parsed", f"{seed_sha}.txt"), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def fetch_or_claim_parsed(self, seed_sha, wait_timeout=120, poll_interval=1):
+        """
+        获取其他实例的解析结果；没有时尝试抢占解析工作
+        抢占失败说明其他实例正在解析，最多等待 wait_timeout 秒
+        :return: 解析结果；返回None表示需要当前实例自己解析
+        """
+        parsed_content = self.load_parsed(seed_sha)
+        if parsed_content is not None or self.try_claim("parse", seed_sha):
+            return parsed_content
+        deadline = time.time() + wait_timeout
+        while time.time() < deadline:
+            time.sleep(poll_interval)
+            parsed_content = self.load_parsed(seed_sha)
+            if parsed_content is not None:
+                return parsed_content
+        return None
+
+    def publish_parsed(self, seed_sha, seed_buf, parsed_content):
+        """
+        发布一个种子的解析结果
+        :param seed_buf: 种子的原始字节，其他实例同步时按原样加入种子列表，保证sha1一致
+        """
+        self._atomic_write(os.path.join("seeds", f"{seed_sha}.sql"), bytes(seed_buf))
+        self._atomic_write(os.path.join("parsed", f"{seed_sha}.txt"), parsed_content)
+        self._append_manifest({"type": "parsed", "seed_sha": seed_sha, "instance": self.instance_id,
+                               "time": time.time()})
+
+    def publish_mutator(self, seed_sha, seed_buf, mutator_code):
+        """
+        发布一个修复完成的变异器
+        :param seed_buf: 种子的原始字节
+        :return: 变异器在共享存储中的路径
+        """
+        self.mutator_count += 1
+        self._atomic_write(os.path.join("seeds", f"{seed_sha}.sql"), bytes(seed_buf))
+        file_name = f"{self.instance_id}_{seed_sha}_{self.mutator_count}.py"
+        file_path = self._atomic_write(os.path.join("mutators", file_name), mutator_code)
+        self._append_manifest({"type": "mutator", "seed_sha": seed_sha, "file": file_name,
+                               "instance": self.instance_id, "time": time.time()})
+        return file_path
+
+    def read_new_records(self):
+        """
+        读取manifest中新追加的完整记录（不包含最后一行尚未写完的部分）
+        :return: 记录列表
+        """
+        try:
+            with open(self.manifest_path, "rb") as f:
+                f.seek(self.manifest_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b"\n") + 1
+        self.manifest_offset += end
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def load_seed(self, seed_sha):
+        """
+        :return: 种子的原始字节
+        """
+        with open(os.path.join(self.root_path, "seeds", f"{seed_sha}.sql"), "rb") as f:
+            return f.read()
+
+    def mutator_file_path(self, file_name):
+        return os.path.abspath(os.path.join(self.root_path, "mutators", file_name))
+
+
+def shared_mutator_sync(chilo_factory):
+    """
+    同步线程：定期读取manifest，把其他实例发布的变异器加入本地变异器池
+    :param chilo_factory: ChiloFactory对象
+    """
+    store: SharedStore = chilo_factory.shared_store
+    chilo_factory.main_logger.info(f"共享存储同步线程启动成功，实例：{store.instance_id}，目录：{store.root_path}")
+    while True:
+        for record in store.read_new_records():
+            if record.get("type") != "mutator" or record.get("instance") == store.instance_id:
+                continue
+            try:
+                seed_buf = store.load_seed(record["seed_sha"])
+            except OSError as e:
+                chilo_factory.main_logger.warning(f"共享变异器 {record['file']} 对应的种子读取失败：{e}")
+                continue
+            # 按原始字节加入，sha1与发布者的seed_sha一致，变异器挂在AFL实际会选中的种子上
+            _, seed_id = chilo_factory.all_seed_list.add_seed_to_list(seed_buf)
+            with chilo_factory.mutator_id_lock:
+                mutator_id = chilo_factory.all_seed_list.seed_list[seed_id].next_mutator_id
+                chilo_factory.all_seed_list.seed_list[seed_id].next_mutator_id += 1
+            with chilo_factory.mutator_pool_lock:
+                chilo_factory.mutator_pool.add_mutator(seed_id, mutator_id,
+                                                       file_name=store.mutator_file_path(record["file"]))
+            chilo_factory.main_logger.info(
+                f"已同步实例 {record['instance']} 发布的变异器 {record['file']}，本地seed_id：{seed_id}，mutator_id：{mutator_id}")
+        time.sleep(chilo_factory.shared_store_sync_interval)
+
+
+def pick_shared_mutators(chilo_factory, seed_id, count):
+    """
+    从本地变异器池中随机挑选 count 个属于该种子的变异器（包含同步来的变异器）
+    :return: 变异器列表，没有时返回空列表
+    """
+    candidates = chilo_factory.mutator_pool.seed_live_mutators(seed_id)
+    if not candidates:
+        return []
+    return random.choices(candidates, k=count)
@@ -0,0 +1,135 @@
+"""
+基于共享内存（mmap）的单生产者/单消费者环形缓冲区
+
+工厂守护进程（生产者）把变异好的测试用例直接写入槽位，AFL进程（消费者）从槽位中读取，
+避免每个测试用例都经过一次pickle序列化和套接字收发。
+
+内存布局：
+    [0, 8)          write_seq  生产者已经写完的槽位总数
+    [64, 72)        read_seq   消费者已经读完的槽位总数（与write_seq分开在不同缓存行）
+    [128, ...)      slot_count 个槽位，每个槽位 slot_size 字节：
+                    槽位头 + 测试用例内容（超过容量的部分被截断，原始长度记录在头中）
+                    以 overflow=True 写入时只写槽位头，内容长度为 OVERFLOW_LENGTH，内容由生产者通过其他途径（套接字）交给消费者
+
+只有生产者写 write_seq、只有消费者写 read_seq，先写槽位内容再推进序号，因此不需要锁。
+"""
+import mmap
+import os
+import struct
+import time
+
+_SEQ = struct.Struct("<Q")
+_WRITE_SEQ_OFFSET = 0
+_READ_SEQ_OFFSET = 64
+_SLOTS_OFFSET = 128
+# 槽位头：内容长度、原始长度、seed_id、mutator_id、is_random、is_error_occur、is_from_structural_mutator
+_SLOT_HEADER = struct.Struct("<IIqqbbb")
+
+# 槽位中的内容长度为该值表示测试用例超过了槽位容量，内容不在槽位中
+OVERFLOW_LENGTH = 0xFFFFFFFF
+# 三态布尔值（True/False/None）的编码
+_NONE = 2
+# 等待时先只让出CPU（sleep(0)）这么多次，仍然等不到再按 poll_interval 休眠
+_SPIN_COUNT = 200
+
+
+def _encode_flag(value):
+    return _NONE if value is None else int(bool(value))
+
+
+def _decode_flag(value):
+    return None if value == _NONE else bool(value)
+
+
+class ShmRing:
+    def __init__(self, file_path, slot_count=256, slot_size=65536, create=False):
+        """
+        :param file_path: 共享内存文件路径（建议放在 /dev/shm 下）
+        :param slot_count: 槽位个数
+        :param slot_size: 每个槽位的字节数（包含槽位头）
+        :param create: 是否由当前进程创建文件（生产者创建，消费者打开）
+        """
+        self.file_path = file_path
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.capacity = slot_size - _SLOT_HEADER.size
+        total_size = _SLOTS_OFFSET + slot_count * slot_size
+        if create:
+            fd = os.open(file_path, os.O_CREAT | os.O_TRUNC | os.O_RDWR, 0o600)
+            os.ftruncate(fd, total_size)
+        else:
+            fd = os.open(file_path, os.O_RDWR)
+        try:
+            self.mm = mmap.mmap(fd, total_size)
+        finally:
+            os.close(fd)
+        self.buf = memoryview(self.mm)
+
+    def _get_seq(self, offset):
+        return _SEQ.unpack_from(self.buf, offset)[0]
+
+    def _slot_offset(self, seq):
+        return _SLOTS_OFFSET + (seq % self.slot_count) * self.slot_size
+
+    def free_slots(self):
+        return self.slot_count - (self._get_seq(_WRITE_SEQ_OFFSET) - self._get_seq(_READ_SEQ_OFFSET))
+
+    def put(self, testcase, seed_id, mutator_id, is_random, is_error_occur, is_from_structural_mutator,
+            poll_interval=0.0005, stop_event=None, overflow=False):
+        """
+        生产者：写入一个测试用例，环满时等待
+        :param overflow: 只写槽位头并标记为溢出，测试用例内容由调用者另行传递
+        :return: 是否写入成功（stop_event被设置时返回False）
+        """
+        write_seq = self._get_seq(_WRITE_SEQ_OFFSET)
+        spin = 0
+        while write_seq - self._get_seq(_READ_SEQ_OFFSET) >= self.slot_count:
+            if stop_event is not None and stop_event.is_set():
+                return False
+            spin += 1
+            time.sleep(0 if spin < _SPIN_COUNT else poll_interval)
+        offset = self._slot_offset(write_seq)
+        length = 0 if overflow else min(len(testcase), self.capacity)
+        _SLOT_HEADER.pack_into(self.buf, offset, OVERFLOW_LENGTH if overflow else length, len(testcase), seed_id,
+                               -1 if mutator_id is None else mutator_id, _encode_flag(is_random),
+                               _encode_flag(is_error_occur), _encode_flag(is_from_structural_mutator))
+        body_offset = offset + _SLOT_HEADER.size
+        self.buf[body_offset:body_offset + length] = testcase[:length]
+        _SEQ.pack_into(self.buf, _WRITE_SEQ_OFFSET, write_seq + 1)  # 内容写完后再发布
+        return True
+
+    def get(self, max_size=None, poll_interval=0.0005, timeout=None):
+        """
+        消费者：读取一个测试用例，环空时等待
+        :param max_size: 只复制前max_size个字节
+        :param timeout: 最长等待时间，超时返回None
+        :return: (测试用例bytearray, 原始长度, seed_id, mutator_id, is_random, is_error_occur, is_from_structural_mutator)
+                 溢出的槽位返回的测试用例为None
+        """
+        read_seq = self._get_seq(_READ_SEQ_OFFSET)
+        deadline = None if timeout is None else time.time() + timeout
+        spin = 0
+        while self._get_seq(_WRITE_SEQ_OFFSET) == read_seq:
+            if deadline is not None and time.time() > deadline:
+                return None
+            spin += 1
+            time.sleep(0 if spin < _SPIN_COUNT else poll_interval)
+        offset = self._slot_offset(read_seq)
+        length, ori_length, seed_id, mutator_id, is_random, is_error_occur, is_from_structural_mutator = \
+            _SLOT_HEADER.unpack_from(self.buf, offset)
+        if length == OVERFLOW_LENGTH:
+            testcase = None
+        else:
+            if max_size is not None:
+                length = min(length, max_size)
+            body_offset = offset + _SLOT_HEADER.size
+            testcase = bytearray(self.buf[body_offset:body_offset + length])
+        _SEQ.pack_into(self.buf, _READ_SEQ_OFFSET, read_seq + 1)    # 复制完后再释放槽位
+        return (testcase, ori_length, seed_id, None if mutator_id == -1 else mutator_id, _decode_flag(is_random),
+                _decode_flag(is_error_occur), _decode_flag(is_from_structural_mutator))
+
+    def close(self, unlink=False):
+        self.buf.release()
+        self.mm.close()
+        if unlink and os.path.exists(self.file_path):
+            os.unlink(self.file_path)
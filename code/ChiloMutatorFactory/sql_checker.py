@@ -0,0 +1,213 @@
+"""
+对变异器生成的SQL进行检查的工具函数
+
+1. 掩码泄露检测：四种掩码（CONSTANT/OPERATOR/FUNCTION/KEYWORD）任意一种出现在输出中都视为泄露
+2. 语法完整性检测：借助python自带的sqlite3前端解析器，判断每条语句能否被正确解析
+3. 执行前筛查：在内存数据库中真正执行一遍测试用例，用进度回调限制虚拟机步数，
+   将其分类为 parse_error / fast / slow / timeout
+"""
+import re
+import sqlite3
+import time
+from typing import List
+
+# 匹配形如 [CONSTANT, number:1, ...] / [OPERATOR, ...] 等掩码的开头部分
+MASK_LEAK_PATTERN = re.compile(
+    r"\[\s*(?P<kind>CONSTANT|OPERATOR|FUNCTION|KEYWORD)\s*,\s*(?:number|type|category|context|ori)\s*:"
+)
+
+# 筛查结论
+SCREEN_PARSE_ERROR = "parse_error"
+SCREEN_FAST = "fast"
+SCREEN_SLOW = "slow"
+SCREEN_TIMEOUT = "timeout"
+
+# 每执行多少条虚拟机指令回调一次进度函数
+_PROGRESS_INTERVAL = 1000
+
+# sqlite3 报错信息中表示"解析失败"的关键字，其余错误（如no such table）说明语句本身能被解析
+_PARSE_ERROR_HINTS = ("syntax error", "incomplete input", "unrecognized token",
+                      "one statement at a time", "null character")
+
+
+def find_mask_leaks(sql: str):
+    """
+    找出SQL中泄露的掩码种类
+    :param sql: 变异器输出的SQL
+    :return: 泄露的掩码种类集合，为空表示没有泄露
+    """
+    return {m.group("kind") for m in MASK_LEAK_PATTERN.finditer(sql)}
+
+
+def statement_end_offsets(sql: str) -> List[int]:
+    """
+    找出每条完整语句结尾分号之后的位置，借助 sqlite3.complete_statement 跳过字符串、注释和触发器体中的分号
+    :param sql: 完整的SQL文本
+    :return: 结束位置列表（不包含最后不以分号结尾的残缺语句）
+    """
+    ends = []
+    start = 0
+    pos = sql.find(";")
+    while pos != -1:
+        if sqlite3.complete_statement(sql[start:pos + 1]):
+            ends.append(pos + 1)
+            start = pos + 1
+        pos = sql.find(";", pos + 1)
+    return ends
+
+
+def split_sql_statements(sql: str) -> List[str]:
+    """
+    按分号将SQL拆分为多条语句
+    :param sql: 完整的SQL文本
+    :return: 语句列表，最后一条可能是不以分号结尾的残缺语句
+    """
+    statements = []
+    start = 0
+    for end in statement_end_offsets(sql):
+        candidate = sql[start:end].strip()
+        if candidate != ";":
+            statements.append(candidate)
+        start = end
+    tail = sql[start:].strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+def is_statement_well_formed(conn: sqlite3.Connection, statement: str) -> bool:
+    """
+    通过 EXPLAIN 让sqlite3只做解析与编译而不真正执行，判断一条语句是否格式良好
+    :param conn: 临时的内存数据库连接
+    :param statement: 单条SQL语句
+    :return: 能被解析返回True
+    """
+    if not sqlite3.complete_statement(statement if statement.rstrip().endswith(";") else statement + ";"):
+        return False
+    if statement.lstrip()[:7].upper() == "EXPLAIN":
+        explain_sql = statement
+    else:
+        explain_sql = "EXPLAIN " + statement
+    try:
+        conn.execute(explain_sql)
+        return True
+    except sqlite3.Error as e:
+        msg = str(e).lower()
+        return not any(hint in msg for hint in _PARSE_ERROR_HINTS)
+    except Exception:
+        return False
+
+
+def count_well_formed_statements(sql_list: List[str]):
+    """
+    统计一组SQL中能被sqlite3正确解析的语句个数
+    :param sql_list: 多个变异结果
+    :return: (格式良好的语句数, 总语句数)
+    """
+    valid_count = 0
+    all_count = 0
+    conn = sqlite3.connect(":memory:")
+    try:
+        for sql in sql_list:
+            for statement in split_sql_statements(sql):
+                all_count += 1
+                if is_statement_well_formed(conn, statement):
+                    valid_count += 1
+    finally:
+        conn.close()
+    return valid_count, all_count
+
+
+class ScreenResult:
+    def __init__(self, verdict, vm_steps, statement_count, parse_error_count, timeout_statement_index, use_time):
+        """
+        一次筛查的结果
+        :param verdict: 筛查结论 parse_error/fast/slow/timeout
+        :param vm_steps: 执行的虚拟机指令数（以 _PROGRESS_INTERVAL 为粒度）
+        :param statement_count: 语句总数
+        :param parse_error_count: 无法解析的语句数
+        :param timeout_statement_index: 超时发生在第几条语句，未超时为-1
+        :param use_time: 筛查用时（秒）
+        """
+        self.verdict = verdict
+        self.vm_steps = vm_steps
+        self.statement_count = statement_count
+        self.parse_error_count = parse_error_count
+        self.timeout_statement_index = timeout_statement_index
+        self.use_time = use_time
+
+
+def _deny_attach(action, arg1, arg2, db_name, trigger_name):
+    """
+    授权回调：禁止ATTACH/DETACH，防止测试用例在筛查时读写磁盘上的数据库文件
+    """
+    if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+def screen_sql(sql: str, max_steps=2000000, slow_steps=200000, time_limit=0.5, max_length=1000000):
+    """
+    在全新的内存数据库中逐条执行测试用例，根据虚拟机步数对其进行分类
+    只有全部语句都无法解析时才判定为 parse_error，运行时错误（如no such table）不影响结论
+    :param sql: 待筛查的测试用例
+    :param max_steps: 虚拟机指令数上限，超过即中断并判定为 timeout
+    :param slow_steps: 超过该指令数判定为 slow
+    :param time_limit: 墙钟时间上限（秒），超过同样判定为 timeout
+    :param max_length: 单个字符串/BLOB的长度上限，防止 randomblob 等在筛查时耗尽内存
+                       （Connection.setlimit 需要Python 3.11，更低版本只能检查测试用例本身的长度，
+                       超过上限时不执行并判定为 slow，执行中产生的大字符串只受进度回调的时间限制约束）
+    :return: ScreenResult对象
+    """
+    start_time = time.time()
+    deadline = start_time + time_limit
+    steps = [0]
+
+    def _on_progress():
+        steps[0] += _PROGRESS_INTERVAL
+        return steps[0] > max_steps or time.time() > deadline
+
+    statements = split_sql_statements(sql)
+    if len(sql) > max_length:
+        return ScreenResult(SCREEN_SLOW, 0, len(statements), 0, -1, time.time() - start_time)
+    parse_error_count = 0
+    timeout_statement_index = -1
+    conn = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+    try:
+        conn.set_authorizer(_deny_attach)
+        if hasattr(conn, "setlimit"):
+            conn.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, max_length)
+        conn.set_progress_handler(_on_progress, _PROGRESS_INTERVAL)
+        for index, statement in enumerate(statements):
+            try:
+                for _ in conn.execute(statement):
+                    pass
+            except sqlite3.Error as e:
+                msg = str(e).lower()
+                if "interrupted" in msg:
+                    timeout_statement_index = index
+                    break
+                if any(hint in msg for hint in _PARSE_ERROR_HINTS):
+                    parse_error_count += 1
+            except Exception:
+                parse_error_count += 1
+    finally:
+        conn.close()
+
+    if timeout_statement_index != -1:
+        verdict = SCREEN_TIMEOUT
+    elif statements and parse_error_count == len(statements):
+        verdict = SCREEN_PARSE_ERROR
+    elif steps[0] > slow_steps:
+        verdict = SCREEN_SLOW
+    else:
+        verdict = SCREEN_FAST
+    return ScreenResult(verdict, steps[0], len(statements), parse_error_count, timeout_statement_index,
+                        time.time() - start_time)
+
+
+def truncate_before_statement(sql: str, statement_index: int) -> str:
+    """
+    只保留前 statement_index 条语句，用于改写超时的测试用例
+    """
+    return "\n".join(split_sql_statements(sql)[:statement_index])
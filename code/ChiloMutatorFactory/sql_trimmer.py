@@ -0,0 +1,266 @@
+"""
+按SQL结构剪裁队列中的测试用例（供AFL++自定义变异器的 init_trim/trim/post_trim 使用）
+
+LLM生成的测试用例往往有数KB的CREATE/INSERT，AFL自带的按字节块剪裁几乎总是破坏语法而失败。
+这里由粗到细分三个阶段依次尝试，每次只做一处改动，由AFL执行后判断覆盖率是否不变：
+    1. 语句：从后往前删除整条语句；被后面语句引用的CREATE（表/视图/索引/触发器）暂不删除
+    2. 子句：删除 WHERE/GROUP BY/ORDER BY/LIMIT/UNION... 等子句，以及括号内列表中的单个元素、多行VALUES中的一行
+    3. 字面量：删除注释，把字符串/BLOB减半，把多位数字换成1
+删除成功后在新的文本上重新生成候选，失败则尝试下一个候选，总步数不超过 max_steps。
+"""
+import re
+
+from . import sql_checker
+
+PHASE_STATEMENT = 0
+PHASE_CLAUSE = 1
+PHASE_LITERAL = 2
+_PHASES = (PHASE_STATEMENT, PHASE_CLAUSE, PHASE_LITERAL)
+
+_TOKEN_PATTERN = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+    | (?P<blob>[xX]'[0-9a-fA-F]*')
+    | (?P<string>'(?:[^']|'')*'?)
+    | (?P<ident>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+    | (?P<number>0[xX][0-9a-fA-F]+|\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][\w$]*)
+    | (?P<punct>.)
+""", re.X | re.S)
+
+# 可以整体删除的子句开头关键字（GROUP/ORDER 需要后面紧跟BY）
+_CLAUSE_KEYWORDS = {"where", "having", "limit", "offset", "window", "returning", "union", "intersect", "except"}
+_CLAUSE_KEYWORDS_WITH_BY = {"group", "order"}
+_CREATE_OBJECT_TYPES = {"table", "view", "index", "trigger"}
+_CREATE_MODIFIERS = {"temp", "temporary", "unique", "virtual"}
+
+
+def tokenize(sql: str):
+    """
+    :return: [(类型, 文本, 开始位置, 结束位置), ...]
+    """
+    return [(m.lastgroup, m.group(), m.start(), m.end()) for m in _TOKEN_PATTERN.finditer(sql)]
+
+
+def _normalize_name(text):
+    if text[:1] in "\"`[":
+        text = text[1:-1] if len(text) > 1 else ""
+    return text.lower()
+
+
+def _statement_spans(sql: str):
+    """
+    :return: 每条语句（连同前面的空白）在文本中的 (开始, 结束) 位置
+    """
+    spans = []
+    start = 0
+    for end in sql_checker.statement_end_offsets(sql):
+        spans.append((start, end))
+        start = end
+    if sql[start:].strip():
+        spans.append((start, len(sql)))
+    return spans
+
+
+def _defined_name(tokens):
+    """
+    :return: CREATE语句定义的对象名，不是CREATE语句时返回None
+    """
+    words = [(kind, text) for kind, text, _, _ in tokens if kind not in ("ws", "comment")]
+    if not words or words[0][1].lower() != "create":
+        return None
+    i = 1
+    while i < len(words) and words[i][1].lower() in _CREATE_MODIFIERS:
+        i += 1
+    if i >= len(words) or words[i][1].lower() not in _CREATE_OBJECT_TYPES:
+        return None
+    i += 1
+    if i + 2 < len(words) and [w[1].lower() for w in words[i:i + 3]] == ["if", "not", "exists"]:
+        i += 3
+    if i >= len(words):
+        return None
+    name = words[i][1]
+    if i + 2 < len(words) and words[i + 1][1] == ".":
+        name = words[i + 2][1]
+    return _normalize_name(name)
+
+
+def _referenced_names(tokens):
+    return {_normalize_name(text) for kind, text, _, _ in tokens if kind in ("word", "ident", "string")}
+
+
+def statement_candidates(sql: str):
+    """
+    语句阶段的候选：从后往前删除整条语句，跳过被后面语句引用的CREATE，至少保留一条语句
+    """
+    spans = _statement_spans(sql)
+    if len(spans) < 2:
+        return []
+    token_lists = [tokenize(sql[start:end]) for start, end in spans]
+    later_names = set()
+    candidates = []
+    for (start, end), tokens in zip(reversed(spans), reversed(token_lists)):
+        defined_name = _defined_name(tokens)
+        if defined_name is None or defined_name not in later_names:
+            candidates.append((start, end, ""))
+        later_names |= _referenced_names(tokens)
+    return candidates
+
+
+def clause_candidates(sql: str):
+    """
+    子句阶段的候选：同一层括号内，子句从其关键字开始，到同层的下一个子句关键字、右括号或分号为止；
+    括号内以逗号分隔的列表（列定义、参数、IN列表、VALUES中的值）逐个删除元素；多行VALUES逐行删除
+    """
+    tokens = [t for t in tokenize(sql) if t[0] not in ("ws", "comment")]
+    candidates = []
+    open_clause = {}        # 层数 -> 当前子句开始位置
+    group_stack = []        # [(左括号在tokens中的下标, 该括号内逗号的位置列表)]
+    close_of = {}           # 左括号下标 -> 右括号下标
+    depth = 0
+
+    def close_clause(level, end):
+        start = open_clause.pop(level, None)
+        if start is not None and end > start:
+            candidates.append((start, end, ""))
+
+    for i, (kind, text, start, end) in enumerate(tokens):
+        lower = text.lower()
+        if kind == "word" and (lower in _CLAUSE_KEYWORDS or (
+                lower in _CLAUSE_KEYWORDS_WITH_BY and i + 1 < len(tokens) and tokens[i + 1][1].lower() == "by")):
+            close_clause(depth, start)
+            open_clause[depth] = start
+        elif text == "(":
+            depth += 1
+            group_stack.append((i, []))
+        elif text == ")" and group_stack:
+            close_clause(depth, start)
+            open_index, commas = group_stack.pop()
+            close_of[open_index] = i
+            depth -= 1
+            if commas:
+                item_starts = [tokens[open_index][3]] + commas
+                item_ends = commas + [start]
+                for k, (item_start, item_end) in enumerate(zip(item_starts, item_ends)):
+                    if k == 0:
+                        candidates.append((item_start, item_end + 1, ""))    # 连同后面的逗号
+                    else:
+                        candidates.append((item_start, item_end, ""))        # 从前面的逗号开始
+        elif text == "," and group_stack:
+            group_stack[-1][1].append(start)
+        elif text == ";":
+            close_clause(depth, start)
+    for level in list(open_clause):
+        close_clause(level, len(sql))
+
+    # 多行VALUES：形如 ),( 的逗号连同后面整个括号一起删除
+    for i in range(1, len(tokens) - 1):
+        if tokens[i][1] == "," and tokens[i - 1][1] == ")" and tokens[i + 1][1] == "(" and i + 1 in close_of:
+            candidates.append((tokens[i][2], tokens[close_of[i + 1]][3], ""))
+    candidates.sort(key=lambda c: (c[0], -c[1]))
+    return candidates
+
+
+def literal_candidates(sql: str):
+    """
+    字面量阶段的候选：删除注释、字符串与BLOB减半、多位数字换成1
+    """
+    candidates = []
+    for kind, text, start, end in tokenize(sql):
+        if kind == "comment":
+            candidates.append((start, end, " "))
+        elif kind == "string" and len(text) >= 4 and text.endswith("'"):
+            body = text[1:-1]
+            half = body[:len(body) // 2]
+            if half.endswith("'") and not half.endswith("''"):
+                half = half[:-1]    # 不拆开转义的单引号
+            candidates.append((start, end, f"'{half}'"))
+        elif kind == "blob" and len(text) >= 7:
+            hex_len = (len(text) - 3) // 4 * 2
+            candidates.append((start, end, f"{text[:2]}{text[2:2 + hex_len]}'"))
+        elif kind == "number" and len(text) >= 2:
+            candidates.append((start, end, "1"))
+    return candidates
+
+
+_CANDIDATE_FUNCTIONS = {
+    PHASE_STATEMENT: statement_candidates,
+    PHASE_CLAUSE: clause_candidates,
+    PHASE_LITERAL: literal_candidates,
+}
+
+
+class SqlTrimmer:
+    def __init__(self, max_steps=128):
+        """
+        :param max_steps: 每个队列项最多尝试的剪裁步数
+        """
+        self.max_steps = max_steps
+        self.text = ""
+        self.ori_size = 0
+        self.phase_index = 0
+        self.cursor = 0
+        self.candidates = []
+        self.current = None
+        self.step = 0
+        self.success_count = 0
+
+    def _load_candidates(self):
+        self.candidates = _CANDIDATE_FUNCTIONS[_PHASES[self.phase_index]](self.text)
+
+    def _advance(self):
+        """
+        定位到下一个可用的候选
+        :return: 是否还有候选
+        """
+        while self.cursor >= len(self.candidates):
+            self.phase_index += 1
+            if self.phase_index >= len(_PHASES):
+                return False
+            self.cursor = 0
+            self._load_candidates()
+        return True
+
+    def init(self, buf) -> int:
+        """
+        开始剪裁一个队列项
+        :return: 剪裁步数上限（0表示不剪裁）
+        """
+        # latin-1 与字节一一对应，剪裁结果与原始字节完全一致
+        self.text = bytes(buf).decode("latin-1")
+        self.ori_size = len(buf)
+        self.phase_index = 0
+        self.cursor = 0
+        self.step = 0
+        self.success_count = 0
+        self._load_candidates()
+        return self.max_steps if self._advance() else 0
+
+    def trim(self) -> bytearray:
+        """
+        :return: 应用当前候选后的测试用例
+        """
+        start, end, replacement = self.candidates[self.cursor]
+        self.current = self.text[:start] + replacement + self.text[end:]
+        return bytearray(self.current.encode("latin-1"))
+
+    def post_trim(self, success) -> int:
+        """
+        :param success: AFL执行剪裁结果后覆盖率是否不变
+        :return: 下一步的序号，等于 max_steps 时AFL结束剪裁
+        """
+        self.step += 1
+        if success:
+            # 保留剪裁结果，在新文本上重新生成本阶段的候选；被删掉的候选位置由后面的候选补上，游标不动
+            self.success_count += 1
+            self.text = self.current
+            self._load_candidates()
+        else:
+            self.cursor += 1
+        if self.step >= self.max_steps or not self._advance():
+            return self.max_steps
+        return self.step
+
+    @property
+    def size(self):
+        return len(self.text)
@@ -0,0 +1,117 @@
+"""
+把Squirrel作为Chilo调度器中的一个变异臂
+
+原先 start_fuzz.py 通过 AFL_CUSTOM_MUTATOR_LIBRARY 让AFL在Squirrel与Chilo之间固定交替，工厂看不到Squirrel的贡献。
+这里直接用ctypes加载 libsqlite_mutator.so，按AFL++自定义变异器的C接口调用：
+    void  *afl_custom_init(afl_state_t *afl, unsigned int seed)
+    size_t afl_custom_fuzz(void *data, u8 *buf, size_t buf_size, u8 **out_buf,
+                           u8 *add_buf, size_t add_buf_size, size_t max_size)
+    u8     afl_custom_queue_new_entry(void *data, const u8 *filename_new_queue, const u8 *filename_orig_queue)
+    void   afl_custom_deinit(void *data)
+Squirrel只在初始化时保存afl指针而不使用它，因此传入NULL。
+
+ArmScheduler 按各个臂实测的产出率（新增队列项 / 执行次数）分配执行预算。
+"""
+import ctypes
+import os
+import random
+
+ARM_CHILO = "chilo"
+ARM_SQUIRREL = "squirrel"
+
+
+class SquirrelMutator:
+    def __init__(self, lib_path, config_path, seed=0):
+        """
+        :param lib_path: libsqlite_mutator.so 路径
+        :param config_path: Squirrel配置文件路径（通过 SQUIRREL_CONFIG 环境变量传给Squirrel）
+        :param seed: 随机种子
+        """
+        os.environ["SQUIRREL_CONFIG"] = config_path
+        self.lib = ctypes.CDLL(os.path.abspath(lib_path), mode=ctypes.RTLD_GLOBAL)
+        self.lib.afl_custom_init.restype = ctypes.c_void_p
+        self.lib.afl_custom_init.argtypes = [ctypes.c_void_p, ctypes.c_uint]
+        self.lib.afl_custom_fuzz.restype = ctypes.c_size_t
+        self.lib.afl_custom_fuzz.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t,
+                                             ctypes.POINTER(ctypes.POINTER(ctypes.c_ubyte)),
+                                             ctypes.c_char_p, ctypes.c_size_t, ctypes.c_size_t]
+        self.lib.afl_custom_queue_new_entry.restype = ctypes.c_ubyte
+        self.lib.afl_custom_queue_new_entry.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        self.lib.afl_custom_deinit.restype = None
+        self.lib.afl_custom_deinit.argtypes = [ctypes.c_void_p]
+        self.data = self.lib.afl_custom_init(None, seed & 0xffffffff)
+        if not self.data:
+            raise RuntimeError(f"Squirrel初始化失败：{lib_path}，配置文件：{config_path}")
+        self.out_buf = ctypes.POINTER(ctypes.c_ubyte)()
+
+    def fuzz(self, buf, max_size):
+        """
+        调用一次Squirrel变异
+        :return: 变异结果（输出缓冲区归Squirrel所有，这里复制一份）
+        """
+        buf = bytes(buf)
+        out_size = self.lib.afl_custom_fuzz(self.data, buf, len(buf), ctypes.byref(self.out_buf), None, 0, max_size)
+        if not out_size or not self.out_buf:
+            return bytearray(buf[:max_size])
+        return bytearray(ctypes.string_at(self.out_buf, min(out_size, max_size)))
+
+    def queue_new_entry(self, filename_new_queue, filename_orig_queue):
+        """
+        把新的队列项交给Squirrel，使其加入自己的语句库
+        """
+        return self.lib.afl_custom_queue_new_entry(
+            self.data, os.fsencode(filename_new_queue),
+            os.fsencode(filename_orig_queue) if filename_orig_queue else None)
+
+    def deinit(self):
+        if self.data:
+            self.lib.afl_custom_deinit(self.data)
+            self.data = None
+
+
+class ArmScheduler:
+    def __init__(self, arm_names, min_share=0.05, decay=0.999):
+        """
+        按产出率分配执行预算的多臂调度器（Thompson采样）
+        :param arm_names: 臂的名字列表
+        :param min_share: 每个臂至少获得的执行比例，保证持续探索
+        :param decay: 每次执行后旧统计量的衰减系数，使调度能跟上FUZZ不同阶段的变化
+        """
+        self.arm_names = list(arm_names)
+        self.min_share = min_share
+        self.decay = decay
+        self.execs = {name: 0.0 for name in self.arm_names}
+        self.finds = {name: 0.0 for name in self.arm_names}
+        self.total_execs = {name: 0 for name in self.arm_names}
+        self.total_finds = {name: 0 for name in self.arm_names}
+        self.last_arm = None
+
+    def choose(self):
+        """
+        选择本次执行使用的臂
+        """
+        if random.random() < self.min_share * len(self.arm_names):
+            arm = random.choice(self.arm_names)
+        else:
+            arm = max(self.arm_names, key=lambda name: random.betavariate(
+                1 + self.finds[name], 1 + max(0.0, self.execs[name] - self.finds[name])))
+        for name in self.arm_names:
+            self.execs[name] *= self.decay
+            self.finds[name] *= self.decay
+        self.execs[arm] += 1
+        self.total_execs[arm] += 1
+        self.last_arm = arm
+        return arm
+
+    def credit_last(self):
+        """
+        AFL发现新的队列项、且其内容就是上一个测试用例时调用，把这次发现记在产生它的臂上
+        :return: 被记功的臂
+        """
+        if self.last_arm is not None:
+            self.finds[self.last_arm] += 1
+            self.total_finds[self.last_arm] += 1
+        return self.last_arm
+
+    def summary(self):
+        return {name: {"execs": self.total_execs[name], "finds": self.total_finds[name]} for name in self.arm_names}
@@ -0,0 +1,410 @@
+"""
+本地模板变异器编译器
+
+直接将LLMParser输出的带掩码SQL编译为一个可调用 mutate() 的变异器对象，无需再调用LLM生成变异器代码。
+每个掩码在编译时就确定好候选值表（按 CONSTANT 的值类型、OPERATOR/FUNCTION 的类别、KEYWORD 的上下文），
+变异时只做随机选择、AFL风格的数值变异以及字符串拼接。
+"""
+import math
+import random
+import re
+import struct
+from typing import List
+
+from . import mask_parser
+from . import mutator_runtime
+
+INTERESTING_8 = [-128, -1, 0, 1, 16, 32, 64, 100, 127]
+INTERESTING_16 = [-32768, -129, 128, 255, 256, 512, 1000, 1024, 4096, 32767]
+INTERESTING_32 = [-2147483648, -100663046, -32769, 32768, 65535, 65536, 100663045, 2147483647]
+INTERESTING_64 = [-9223372036854775808, -9223372036854775807, 4294967295, 4294967296, 9223372036854775807]
+INTERESTING_ALL = INTERESTING_8 + INTERESTING_16 + INTERESTING_32 + INTERESTING_64
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+# CONSTANT 按值类型划分的候选表
+CONSTANT_CANDIDATES = {
+    "integer": [str(v) for v in INTERESTING_ALL] + ["9223372036854775808", "-9223372036854775809", "NULL"],
+    "real": ["0.0", "-0.0", "0.1", "1e308", "-1e308", "1e-308", "4.9e-324", "9e999", "-9e999",
+             "3.4028234663852886e38", "NULL"],
+    "string": ["''", "' '", "'a'", "'" + "a" * 1024 + "'", "'%s%s%s%n'", "'%999999999d'", "'\\'",
+               "'ÿ�'", "char(0)", "'0'", "'-1'", "'1e308'", "NULL"],
+    "blob": ["x''", "x'00'", "x'FF'", "x'00FF00FF'", "zeroblob(1024)", "randomblob(64)", "NULL"],
+    "null": ["NULL", "0", "''", "x''"],
+}
+
+# OPERATOR 按类别划分的候选表
+OPERATOR_CANDIDATES = {
+    "arithmetic": ["+", "-", "*", "/", "%"],
+    "comparison": ["=", "==", "!=", "<>", "<", "<=", ">", ">=", "IS", "IS NOT"],
+    "logical": ["AND", "OR"],
+    "bitwise": ["&", "|", "<<", ">>"],
+    "string": ["||"],
+}
+
+# FUNCTION 按类别划分的候选表（尽量选择参数个数相近的函数）
+FUNCTION_CANDIDATES = {
+    "aggregate": ["SUM", "AVG", "COUNT", "MAX", "MIN", "TOTAL", "GROUP_CONCAT"],
+    "numeric": ["ABS", "ROUND", "TYPEOF", "HEX", "QUOTE", "LIKELY", "UNLIKELY", "UNICODE", "LENGTH"],
+    "string": ["UPPER", "LOWER", "LENGTH", "TRIM", "LTRIM", "RTRIM", "HEX", "QUOTE", "TYPEOF", "UNICODE"],
+    "datetime": ["DATE", "TIME", "DATETIME", "JULIANDAY"],
+}
+
+# KEYWORD 按上下文划分的候选表，空字符串表示删除该关键字
+KEYWORD_CANDIDATES = {
+    "constraint": ["NOT NULL", "UNIQUE", "PRIMARY KEY", ""],
+    "conflict": ["OR REPLACE", "OR IGNORE", "OR FAIL", "OR ABORT", "OR ROLLBACK", ""],
+    "modifier": ["DISTINCT", "ALL", ""],
+    "join": ["INNER", "LEFT", "LEFT OUTER", "CROSS", "NATURAL", ""],
+    "order": ["ASC", "DESC", ""],
+    "existence": ["IF EXISTS", "IF NOT EXISTS", ""],
+    "temp": ["TEMP", "TEMPORARY", ""],
+    "transaction": ["DEFERRED", "IMMEDIATE", "EXCLUSIVE", ""],
+    "trigger": ["BEFORE", "AFTER", "INSTEAD OF"],
+    "action": ["CASCADE", "SET NULL", "SET DEFAULT", "RESTRICT", "NO ACTION"],
+    "collat": ["COLLATE BINARY", "COLLATE NOCASE", "COLLATE RTRIM", ""],
+}
+
+_ALL_OPERATORS = [op for ops in OPERATOR_CANDIDATES.values() for op in ops]
+_ALL_FUNCTIONS = sorted({f for fs in FUNCTION_CANDIDATES.values() for f in fs})
+_ALL_KEYWORDS = sorted({k for ks in KEYWORD_CANDIDATES.values() for k in ks})
+_ALL_CONSTANTS = [c for cs in CONSTANT_CANDIDATES.values() for c in cs]
+
+_BLOB_PATTERN = re.compile(r"^[xX]'([0-9a-fA-F]*)'$")
+_EXPRESSION_PATTERN = re.compile(r"^(?:[A-Za-z_][A-Za-z0-9_]*\s*\(.*\)|CURRENT_(?:DATE|TIME|TIMESTAMP))$", re.DOTALL | re.IGNORECASE)
+# 三种变异方式：同类候选 / AFL风格变异 / 跨类别随机，对应权重 40% / 40% / 20%
+_MODES = (0, 1, 2)
+_MODE_WEIGHTS = (4, 4, 2)
+_STRING_SPECIAL = ["%", "''", "\\", "ÿ", "�", "\U0001f600", "%n", "*", "?", "_"]
+
+
+def _lookup_table(tables, key, default):
+    """
+    按类别/上下文名称查候选表，LLM给出的名称不一定规范，因此支持子串匹配
+    """
+    key = key.lower()
+    if key in tables:
+        return tables[key]
+    for name, table in tables.items():
+        if name in key:
+            return table
+    return default
+
+
+def _value_class(mask: mask_parser.Mask):
+    """
+    推断CONSTANT掩码的值类型：integer/real/string/blob/null
+    优先根据原始值的字面形式判断，无法判断时再参考标注的type
+    """
+    ori = mask.ori
+    if ori.upper() == "NULL":
+        return "null"
+    if _BLOB_PATTERN.match(ori):
+        return "blob"
+    if _is_quoted(ori):
+        return "string"
+    number = _parse_number(ori, "integer")
+    if number is not None:
+        return "integer"
+    number = _parse_number(ori, "real")
+    if number is not None:
+        return "real"
+    declared = mask.attr.lower()
+    if "blob" in declared:
+        return "blob"
+    if any(t in declared for t in ("real", "float", "double", "numeric", "decimal")):
+        return "real"
+    if "int" in declared:
+        return "integer"
+    return "string"
+
+
+def _parse_number(text: str, value_class):
+    """
+    按值类型解析数值，整数支持 0x10 等带前缀的写法
+    :return: 数值，无法解析时返回None
+    """
+    text = text.strip()
+    try:
+        if value_class == "integer":
+            try:
+                return int(text)
+            except ValueError:
+                return int(text, 0)
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _is_quoted(text: str) -> bool:
+    return len(text) >= 2 and text[0] == text[-1] and text[0] in "'\""
+
+
+def _quote(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _unquote(text: str) -> str:
+    if _is_quoted(text):
+        return text[1:-1].replace(text[0] * 2, text[0])
+    return text
+
+
+def _render_original(mask: mask_parser.Mask, value_class):
+    """
+    渲染掩码的原始值。LLM标注的字符串原始值可能不带引号（如 ori:hello），此时需要补上；
+    函数调用与 CURRENT_TIME 等表达式保持原样
+    """
+    if value_class == "string" and not _is_quoted(mask.ori) and not _EXPRESSION_PATTERN.match(mask.ori):
+        return _quote(mask.ori)
+    return mask.ori
+
+
+def _render_real(value: float) -> str:
+    if math.isnan(value):
+        return "NULL"
+    if math.isinf(value):
+        return "9e999" if value > 0 else "-9e999"
+    return repr(value)
+
+
+def afl_mutate_integer(value: int) -> str:
+    """
+    AFL风格的整数变异：位翻转、加减运算、有趣值替换、取反、放大、字节翻转
+    """
+    op = random.randrange(6)
+    if op == 0:
+        value ^= 1 << random.randrange(64)
+    elif op == 1:
+        value += random.choice((-1, 1)) * random.randint(1, 35)
+    elif op == 2:
+        return str(random.choice(INTERESTING_ALL))
+    elif op == 3:
+        value = -value
+    elif op == 4:
+        value *= random.choice((2, 10, 256, 65536, 4294967296))
+    else:
+        value ^= 0xFF << (8 * random.randrange(8))
+    if not (INT64_MIN <= value <= INT64_MAX) and random.random() >= 0.1:
+        # 大部分情况下回绕到有符号64位范围内，少量保留溢出值让DBMS做类型转换
+        value = (value - INT64_MIN) % (1 << 64) + INT64_MIN
+    return str(value)
+
+
+def afl_mutate_real(value: float) -> str:
+    """
+    AFL风格的浮点数变异：IEEE754位翻转、数量级缩放、取反、加微小量
+    """
+    op = random.randrange(4)
+    if op == 0:
+        bits = struct.unpack("<Q", struct.pack("<d", value))[0] ^ (1 << random.randrange(64))
+        value = struct.unpack("<d", struct.pack("<Q", bits))[0]
+    elif op == 1:
+        value *= 10.0 ** random.randint(-30, 30)
+    elif op == 2:
+        value = -value
+    else:
+        value += random.choice((1e-9, -1e-9, 0.5, -0.5, 1.0, -1.0))
+    return _render_real(value)
+
+
+def afl_mutate_string(text: str) -> str:
+    """
+    对字符串内容做变异：重复、截断、插入特殊字符、翻转字符、清空
+    """
+    op = random.randrange(5)
+    if op == 0 and text:
+        text = text * random.choice((2, 16, 256))
+        text = text[:4096]
+    elif op == 1 and text:
+        text = text[:random.randrange(len(text))]
+    elif op == 2:
+        pos = random.randint(0, len(text))
+        text = text[:pos] + random.choice(_STRING_SPECIAL) + text[pos:]
+    elif op == 3 and text:
+        pos = random.randrange(len(text))
+        flipped = chr((ord(text[pos]) ^ (1 << random.randrange(7))) or 0x20)
+        text = text[:pos] + flipped + text[pos + 1:]
+    else:
+        text = ""
+    return _quote(text.replace("\x00", ""))
+
+
+def afl_mutate_blob(text: str) -> str:
+    """
+    对blob做变异：随机生成一段十六进制，或翻转原blob中的一个半字节
+    """
+    m = _BLOB_PATTERN.match(text)
+    hex_body = m.group(1) if m else ""
+    if hex_body and random.random() < 0.5:
+        pos = random.randrange(len(hex_body))
+        nibble = int(hex_body[pos], 16) ^ (1 << random.randrange(4))
+        hex_body = hex_body[:pos] + format(nibble, "X") + hex_body[pos + 1:]
+    else:
+        hex_body = "".join(random.choice("0123456789ABCDEF") for _ in range(2 * random.randint(0, 64)))
+    return f"x'{hex_body}'"
+
+
+class _MaskPlan:
+    def __init__(self, mask: mask_parser.Mask):
+        """
+        编译时为单个掩码预先确定好的变异方案
+        """
+        self.kind = mask.kind
+        self.value_class = _value_class(mask) if mask.kind == "CONSTANT" else None
+        self.original = _render_original(mask, self.value_class)
+        self.number_value = None
+        if self.value_class in ("integer", "real"):
+            self.number_value = _parse_number(mask.ori, self.value_class)
+            if self.number_value is None:
+                # LLM把 'abc' 这样无法解析为数值的值标注为INTEGER/REAL，按字符串变异，原始值保持原样
+                self.value_class = "string"
+        if mask.kind == "CONSTANT":
+            self.candidates = CONSTANT_CANDIDATES[self.value_class]
+            self.cross_candidates = _ALL_CONSTANTS
+        elif mask.kind == "OPERATOR":
+            self.candidates = _lookup_table(OPERATOR_CANDIDATES, mask.attr, _ALL_OPERATORS)
+            self.cross_candidates = _ALL_OPERATORS
+        elif mask.kind == "FUNCTION":
+            self.candidates = _lookup_table(FUNCTION_CANDIDATES, mask.attr, _ALL_FUNCTIONS)
+            self.cross_candidates = _ALL_FUNCTIONS
+        else:
+            self.candidates = _lookup_table(KEYWORD_CANDIDATES, mask.attr, [mask.ori, ""])
+            self.cross_candidates = _ALL_KEYWORDS
+
+    def mutate(self) -> str:
+        """
+        40% 取同类候选值，40% AFL风格变异（非CONSTANT时退化为同类候选），20% 跨类别随机
+        """
+        r = random.random()
+        if r < 0.4:
+            return random.choice(self.candidates)
+        if r < 0.8:
+            return self.afl_mutate()
+        return random.choice(self.cross_candidates)
+
+    def mutate_many(self, k) -> List[str]:
+        """
+        一次性生成k个变异值，变异方式与候选值都批量抽取
+        """
+        modes = random.choices(_MODES, weights=_MODE_WEIGHTS, k=k)
+        picks = iter(mutator_runtime.batch_choice(self.candidates, modes.count(0)))
+        cross_picks = iter(mutator_runtime.batch_choice(self.cross_candidates, modes.count(2)))
+        return [next(picks) if mode == 0 else next(cross_picks) if mode == 2 else self.afl_mutate()
+                for mode in modes]
+
+    def afl_mutate(self) -> str:
+        """
+        按值类型做AFL风格变异，非CONSTANT掩码退化为取同类候选值
+        """
+        if self.value_class == "integer":
+            return afl_mutate_integer(self.number_value)
+        if self.value_class == "real":
+            return afl_mutate_real(self.number_value)
+        if self.value_class == "string":
+            return afl_mutate_string(_unquote(self.original))
+        if self.value_class == "blob":
+            return afl_mutate_blob(self.original)
+        return random.choice(self.candidates)
+
+
+class TemplateMutator:
+    def __init__(self, segments: List[str], masks: List[mask_parser.Mask]):
+        """
+        由字面量片段与掩码表构造的本地变异器
+        :param segments: 字面量片段，len(segments) == len(masks) + 1
+        :param masks: 掩码表
+        """
+        self.segments = segments
+        self.masks = masks
+        self.plans = [_MaskPlan(mask) for mask in masks]
+        self.original_values = [plan.original for plan in self.plans]
+        self.mask_count = len(masks)
+        self.segment_size = sum(len(segment) for segment in segments)
+
+    def assemble(self, values: List[str]) -> str:
+        """
+        将各掩码的取值与字面量片段拼接为完整SQL
+        """
+        parts = [self.segments[0]]
+        for value, segment in zip(values, self.segments[1:]):
+            parts.append(value)
+            parts.append(segment)
+        return "".join(parts)
+
+    def _fit_values(self, values: List[str], size, max_size):
+        """
+        总长度超出预算时，从变长最多的掩码开始恢复原值，直到不超过 max_size（原始SQL本身超长时尽力而为）
+        :param size: 当前取值拼接后的总长度
+        """
+        growths = sorted(((len(value) - len(original), index) for index, (value, original)
+                          in enumerate(zip(values, self.original_values))), reverse=True)
+        for growth, index in growths:
+            if size <= max_size or growth <= 0:
+                break
+            values[index] = self.original_values[index]
+            size -= growth
+
+    def mutate(self, max_size=None) -> str:
+        """
+        随机选择 30%~70%（至少1个）的掩码进行变异，其余掩码保持原值
+        :param max_size: 长度预算，超出时把变长最多的掩码恢复为原值
+        """
+        values = list(self.original_values)
+        low = max(1, int(self.mask_count * 0.3))
+        high = max(low, int(self.mask_count * 0.7))
+        for index in random.sample(range(self.mask_count), random.randint(low, high)):
+            values[index] = self.plans[index].mutate()
+        if max_size is not None:
+            size = self.segment_size + sum(len(value) for value in values)
+            if size > max_size:
+                self._fit_values(values, size, max_size)
+        return self.assemble(values)
+
+    def mutate_batch(self, n, max_size=None) -> List[str]:
+        """
+        一次生成n个变异结果：先为所有输出统一抽取要变异的掩码，再按掩码批量生成取值，最后按片段拼接
+        :param max_size: 长度预算，只对超出预算的输出逐个调整
+        """
+        columns = [[original] * n for original in self.original_values]
+        for mask_index, rows in enumerate(mutator_runtime.batch_select_masks(self.mask_count, n)):
+            if rows:
+                column = columns[mask_index]
+                for row, value in zip(rows, self.plans[mask_index].mutate_many(len(rows))):
+                    column[row] = value
+        if max_size is not None:
+            sizes = [self.segment_size] * n
+            for column in columns:
+                for row, value in enumerate(column):
+                    sizes[row] += len(value)
+            for row, size in enumerate(sizes):
+                if size > max_size:
+                    values = [column[row] for column in columns]
+                    self._fit_values(values, size, max_size)
+                    for column, value in zip(columns, values):
+                        column[row] = value
+        return mutator_runtime.assemble_batch(self.segments, columns)
+
+
+def compile_parsed_index(parsed_index: mask_parser.MaskedSQL):
+    """
+    由解析阶段建立好的索引直接构造本地变异器，无需再次扫描带掩码的SQL
+    :param parsed_index: MaskedSQL对象
+    :return: TemplateMutator对象；没有任何掩码时返回None
+    """
+    if not parsed_index.masks:
+        return None
+    return TemplateMutator(parsed_index.segments, parsed_index.masks)
+
+
+def compile_masked_sql(masked_sql: str):
+    """
+    将带掩码的SQL编译为本地变异器
+    :param masked_sql: LLMParser输出的带掩码SQL
+    :return: TemplateMutator对象；SQL中没有任何可识别的掩码时返回None
+    """
+    segments, masks = mask_parser.parse_masked_sql(masked_sql)
+    if not masks:
+        return None
+    return TemplateMutator(segments, masks)
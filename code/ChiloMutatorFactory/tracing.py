@@ -0,0 +1,150 @@
+"""
+种子生命周期追踪，导出为Chrome trace JSON（可在 Perfetto / chrome://tracing 中打开）
+
+记录的事件（args 中带 seed_id / mutator_id）：
+    wait:<队列名>        任务在队列中的等待时间（异步事件，入队时在任务字典上记录时间）
+    parse / generate / fix / structural   各线程处理一个任务的完整用时
+    llm:<阶段>           一次LLM调用（含失败重试），归属于当前线程正在处理的种子
+    validate             修复器在隔离子进程中试运行变异器
+    mutate_batch         fuzz路径上调用一次变异器批量生成
+    seed_to_first_exec   种子第一次被AFL选中到第一个测试用例被执行（异步事件）
+按 seed_id 采样（同一个种子的全部事件要么都记录要么都不记录），事件保存在定长的环形缓冲区中，
+导出线程每隔 export_interval 秒把缓冲区整体重写到 trace_path。采样率为0时所有记录函数立即返回。
+"""
+import collections
+import itertools
+import json
+import os
+import threading
+import time
+
+_HASH_MULTIPLIER = 2654435761   # Knuth乘法散列，使采样与seed_id的分配顺序无关
+
+
+class Tracer:
+    def __init__(self, trace_path, sample_rate=0.0, buffer_size=200000, export_interval=30):
+        """
+        :param trace_path: 导出的JSON文件路径
+        :param sample_rate: 采样的种子比例（0~1），为0时不追踪
+        :param buffer_size: 环形缓冲区保存的事件个数上限，写满后丢弃最早的事件
+        :param export_interval: 导出间隔（秒）
+        """
+        self.trace_path = trace_path
+        self.sample_rate = sample_rate
+        self.enabled = sample_rate > 0
+        self.export_interval = export_interval
+        self.events = collections.deque(maxlen=buffer_size)
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.seed_chosen_time = {}  # 种子id -> 第一次被选中的时间
+        self.first_exec_seeds = set()
+        self.async_ids = itertools.count(1)
+
+    def sampled(self, seed_id):
+        if not self.enabled or seed_id is None:
+            return False
+        return (seed_id * _HASH_MULTIPLIER) % 2 ** 32 < self.sample_rate * 2 ** 32
+
+    def set_context(self, seed_id, mutator_id=None):
+        """
+        设置当前线程正在处理的种子，之后该线程中的LLM调用事件归属于它
+        """
+        if self.enabled:
+            self.local.context = (seed_id, mutator_id)
+
+    def context(self):
+        return getattr(self.local, "context", (None, None))
+
+    @staticmethod
+    def _args(seed_id, mutator_id, extra):
+        args = {"seed_id": seed_id}
+        if mutator_id is not None:
+            args["mutator_id"] = mutator_id
+        if extra:
+            args.update(extra)
+        return args
+
+    def complete(self, name, start_time, seed_id, mutator_id=None, cat="stage", end_time=None, **extra):
+        """
+        记录一个从 start_time 到现在（或 end_time）的完整事件，归属于当前线程
+        """
+        if not self.sampled(seed_id):
+            return
+        end_time = time.time() if end_time is None else end_time
+        self.events.append({"name": name, "cat": cat, "ph": "X", "ts": start_time * 1e6,
+                            "dur": (end_time - start_time) * 1e6, "pid": self.pid, "tid": threading.get_ident(),
+                            "args": self._args(seed_id, mutator_id, extra)})
+
+    def _async_span(self, name, cat, start_time, end_time, seed_id, mutator_id=None, **extra):
+        span_id = next(self.async_ids)
+        args = self._args(seed_id, mutator_id, extra)
+        self.events.append({"name": name, "cat": cat, "ph": "b", "id": span_id, "ts": start_time * 1e6,
+                            "pid": self.pid, "tid": 0, "args": args})
+        self.events.append({"name": name, "cat": cat, "ph": "e", "id": span_id, "ts": end_time * 1e6,
+                            "pid": self.pid, "tid": 0})
+
+    def enqueue(self, task: dict):
+        """
+        任务放入队列前调用，在任务字典上记录入队时间
+        """
+        if self.sampled(task.get("seed_id")):
+            task["trace_enqueued_at"] = time.time()
+
+    def dequeue(self, queue_name, task: dict):
+        """
+        任务从队列中取出后调用，记录等待事件并把当前线程的上下文设为该任务的种子
+        """
+        self.set_context(task.get("seed_id"))
+        enqueued_at = task.pop("trace_enqueued_at", None) if self.enabled else None
+        if enqueued_at is not None:
+            self._async_span(f"wait:{queue_name}", "queue", enqueued_at, time.time(), task.get("seed_id"))
+
+    def seed_chosen(self, seed_id):
+        """
+        AFL通过 fuzz_count 选中一个种子
+        """
+        if self.sampled(seed_id):
+            self.seed_chosen_time.setdefault(seed_id, time.time())
+
+    def first_exec(self, seed_id, mutator_id):
+        """
+        该种子的第一个测试用例交给了AFL执行
+        """
+        if not self.sampled(seed_id) or seed_id in self.first_exec_seeds:
+            return
+        self.first_exec_seeds.add(seed_id)
+        chosen_time = self.seed_chosen_time.get(seed_id)
+        if chosen_time is not None:
+            self._async_span("seed_to_first_exec", "seed", chosen_time, time.time(), seed_id, mutator_id)
+
+    def to_chrome_trace(self):
+        """
+        :return: Chrome trace格式的字典
+        """
+        events = list(self.events.copy())
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                     "args": {"name": thread_names.get(tid, str(tid)) if tid else "queues"}}
+                    for tid in sorted({e["tid"] for e in events})]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def write(self):
+        tmp_path = f"{self.trace_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+        os.replace(tmp_path, self.trace_path)
+
+
+def export_trace(chilo_factory):
+    """
+    追踪导出线程入口：每隔 export_interval 秒重写一次trace文件
+    """
+    tracer: Tracer = chilo_factory.tracer
+    chilo_factory.main_logger.info(
+        f"追踪导出线程启动成功，文件：{tracer.trace_path}，采样率：{tracer.sample_rate}，间隔：{tracer.export_interval}s")
+    while True:
+        time.sleep(tracer.export_interval)
+        try:
+            tracer.write()
+        except Exception as e:
+            chilo_factory.main_logger.warning(f"追踪写入失败：{e}")
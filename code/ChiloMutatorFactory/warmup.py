@@ -0,0 +1,144 @@
+"""
+预热：在AFL校准初始种子的同时，并发解析初始种子库中的全部种子
+
+原先种子只有在被AFL通过 fuzz_count 选中时才逐个进入解析队列，FUZZ开始后的很长时间都在串行等待LLM。
+预热线程启动后：
+    1. 枚举初始种子目录，把每个种子登记到 AFLSeedList（不增加被选择次数）
+    2. 以 warmup_concurrency 个线程并发调用 LLMParser.parse_seed，每秒最多开始 warmup_rate 个
+    3. 可选地预先编译模板变异器 / 生成LLM变异器（只放入变异器池，不发布执行任务）；
+       AFL第一次选中该种子时直接把任务发布给预先准备的变异器，仍在生成时等生成完成后发布，不再重复调用LLM
+进度写入主日志，并以JSON写入 warmup_status_path，is_warm 为 true 表示全部种子已经解析完成。
+AFL选中一个正在预热的种子时，解析线程会在 parse_seed 中等待预热完成并直接使用结果。
+"""
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+from .chilo_factory import ChiloFactory
+from . import LLMParser
+
+
+class _RateLimiter:
+    def __init__(self, rate):
+        """
+        :param rate: 每秒允许通过的次数，不大于0时不限速
+        """
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class WarmupStatus:
+    def __init__(self, status_path):
+        self.status_path = status_path
+        self.lock = threading.Lock()
+        self.state = {"total": 0, "parsed": 0, "already_parsed": 0, "failed": 0, "in_flight": 0,
+                      "generated": 0, "llm_use_time": 0.0, "up_token": 0, "down_token": 0,
+                      "started_at": time.time(), "finished_at": None, "is_warm": False}
+
+    def add(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.state[key] += value
+            self._save()
+
+    def set(self, **values):
+        with self.lock:
+            self.state.update(values)
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.status_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.status_path)
+
+
+def register_input_seeds(chilo_factory: ChiloFactory, input_dir):
+    """
+    把初始种子目录中的全部种子登记到种子总列表
+    :return: 种子id列表（已去重）
+    """
+    seed_ids = []
+    for file_name in sorted(os.listdir(input_dir)):
+        file_path = os.path.join(input_dir, file_name)
+        if file_name.startswith(".") or not os.path.isfile(file_path):
+            continue
+        with open(file_path, "rb") as f:
+            seed_buf = f.read()
+        if not seed_buf:
+            continue
+        _, seed_id = chilo_factory.all_seed_list.add_seed_to_list(seed_buf)
+        if seed_id not in seed_ids:
+            seed_ids.append(seed_id)
+    return seed_ids
+
+
+def _warm_one_seed(chilo_factory: ChiloFactory, seed_id, rate_limiter: _RateLimiter, status: WarmupStatus):
+    rate_limiter.wait()
+    status.add(in_flight=1)
+    chilo_factory.tracer.set_context(seed_id)
+    try:
+        parse_stats = LLMParser.parse_seed(chilo_factory, seed_id)
+    except Exception as e:
+        chilo_factory.parser_logger.error(f"预热：seed_id:{seed_id} 解析失败：{e}")
+        status.add(in_flight=-1, failed=1)
+        return
+    if parse_stats is None:
+        status.add(in_flight=-1, already_parsed=1)
+        return
+    llm_use_time, up_token, down_token, _, _ = parse_stats
+    status.add(in_flight=-1, parsed=1, llm_use_time=llm_use_time, up_token=up_token, down_token=down_token)
+    if chilo_factory.warmup_generate:
+        # 只准备变异器，不发布执行任务（mutate_time为0），等AFL选中该种子时再发布
+        try:
+            if chilo_factory.template_mutator_mode == 'default':
+                is_generated = LLMParser._publish_template_mutator(chilo_factory, seed_id, 0)
+            else:
+                target_seed = chilo_factory.all_seed_list.seed_list[seed_id]
+                with target_seed.parse_lock:
+                    target_seed.is_warmup_generating = True
+                chilo_factory.wait_mutator_generate_list.put({"seed_id": seed_id, "mutate_time": 0, "is_warmup": True})
+                is_generated = True
+        except Exception as e:
+            chilo_factory.parser_logger.error(f"预热：seed_id:{seed_id} 准备变异器失败：{e}")
+            return
+        if is_generated:
+            status.add(generated=1)
+
+
+def warm_up(chilo_factory: ChiloFactory):
+    """
+    预热线程入口
+    """
+    input_dir = chilo_factory.warmup_input_dir
+    if not os.path.isdir(input_dir):
+        chilo_factory.main_logger.error(f"预热：初始种子目录不存在：{input_dir}")
+        return
+    status = WarmupStatus(chilo_factory.warmup_status_path)
+    seed_ids = register_input_seeds(chilo_factory, input_dir)
+    status.set(total=len(seed_ids))
+    chilo_factory.main_logger.info(f"预热：已登记{len(seed_ids)}个初始种子，开始并发解析"
+                                   f"（并发数：{chilo_factory.warmup_concurrency}，速率上限：{chilo_factory.warmup_rate}个/秒）")
+    rate_limiter = _RateLimiter(chilo_factory.warmup_rate)
+    report_every = max(1, len(seed_ids) // 20)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=chilo_factory.warmup_concurrency) as executor:
+        futures = [executor.submit(_warm_one_seed, chilo_factory, seed_id, rate_limiter, status)
+                   for seed_id in seed_ids]
+        for done_count, _ in enumerate(concurrent.futures.as_completed(futures), 1):
+            if done_count % report_every == 0 or done_count == len(seed_ids):
+                chilo_factory.main_logger.info(
+                    f"预热进度：{done_count}/{len(seed_ids)}，"
+                    f"用时：{time.time() - status.state['started_at']:.1f}s，失败：{status.state['failed']}")
+    status.set(finished_at=time.time(), is_warm=True)
+    chilo_factory.main_logger.info(f"预热完成：{status.state}")
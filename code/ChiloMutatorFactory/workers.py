@@ -0,0 +1,84 @@
+"""
+启动工厂的所有后台线程
+
+无论工厂嵌入在AFL进程中（ChiloMutate.init），还是作为独立的守护进程运行（chilo_daemon.py），
+都通过这里启动解析器、变异器生成器、结构化变异器、修复器、共享存储同步线程、预热线程以及指标与追踪导出线程。
+"""
+import threading
+
+from .chilo_factory import ChiloFactory
+from . import LLMParser, LLMMutatorGenerater, LLMStructuralMutator, mutator_fixer, shared_store, warmup, metrics, tracing
+
+
+def start_workers(chilo_factory: ChiloFactory):
+    """
+    按配置的线程数启动工厂的全部后台线程
+    :param chilo_factory: 工厂对象
+    :return: 启动的线程列表
+    """
+    # 计算总线程数
+    total_threads = (chilo_factory.parser_thread_count +
+                    chilo_factory.mutator_generator_thread_count +
+                    chilo_factory.structural_mutator_thread_count +
+                    chilo_factory.fixer_thread_count)
+    chilo_factory.main_logger.info(f"Chilo工厂准备启动{total_threads}个子线程")
+    threads = []
+
+    # 启动多个Parser线程
+    chilo_factory.main_logger.info(f"Chilo工厂启动解析器中~（共{chilo_factory.parser_thread_count}个线程）")
+    for i in range(chilo_factory.parser_thread_count):
+        parser_t = threading.Thread(target=LLMParser.chilo_parser, args=(chilo_factory,))
+        parser_t.start()
+        threads.append(parser_t)
+        chilo_factory.main_logger.info(f"解析器[线程{i}]启动成功")
+
+    # 启动多个Mutator Generator线程
+    chilo_factory.main_logger.info(f"Chilo工厂启动变异器生成器中~（共{chilo_factory.mutator_generator_thread_count}个线程）")
+    for i in range(chilo_factory.mutator_generator_thread_count):
+        generator_t = threading.Thread(target=LLMMutatorGenerater.chilo_mutator_generator, args=(chilo_factory,))
+        generator_t.start()
+        threads.append(generator_t)
+        chilo_factory.main_logger.info(f"变异器生成器[线程{i}]启动成功")
+
+    # 启动多个Structural Mutator线程
+    chilo_factory.main_logger.info(f"Chilo工厂启动结构化变异器中~（共{chilo_factory.structural_mutator_thread_count}个线程）")
+    for i in range(chilo_factory.structural_mutator_thread_count):
+        structural_t = threading.Thread(target=LLMStructuralMutator.structural_mutator, args=(chilo_factory,))
+        structural_t.start()
+        threads.append(structural_t)
+        chilo_factory.main_logger.info(f"结构化变异器[线程{i}]启动成功")
+
+    # 启动多个Fixer线程
+    chilo_factory.main_logger.info(f"Chilo工厂启动变异器修复器中~（共{chilo_factory.fixer_thread_count}个线程）")
+    for i in range(chilo_factory.fixer_thread_count):
+        fixer_t = threading.Thread(target=mutator_fixer.fix_mutator, args=(chilo_factory, i))
+        fixer_t.start()
+        threads.append(fixer_t)
+        chilo_factory.main_logger.info(f"变异器修复器[线程{i}]启动成功")
+
+    # 多核FUZZ时启动共享存储同步线程，使用其他实例发布的变异器
+    if chilo_factory.shared_store is not None:
+        sync_t = threading.Thread(target=shared_store.shared_mutator_sync, args=(chilo_factory,), daemon=True)
+        sync_t.start()
+        threads.append(sync_t)
+        chilo_factory.main_logger.info(f"共享存储同步线程启动成功（实例：{chilo_factory.instance_id}）")
+
+    # 配置了初始种子目录时启动预热线程，与AFL的校准阶段并行解析全部初始种子
+    if chilo_factory.warmup_input_dir:
+        warmup_t = threading.Thread(target=warmup.warm_up, args=(chilo_factory,), daemon=True)
+        warmup_t.start()
+        threads.append(warmup_t)
+        chilo_factory.main_logger.info(f"预热线程启动成功（初始种子目录：{chilo_factory.warmup_input_dir}）")
+
+    # 定期把实时指标写入指标文件
+    if chilo_factory.metrics.interval > 0:
+        metrics_t = threading.Thread(target=metrics.export_metrics, args=(chilo_factory,), daemon=True)
+        metrics_t.start()
+        threads.append(metrics_t)
+
+    # 启用追踪时定期导出Chrome trace
+    if chilo_factory.tracer.enabled:
+        trace_t = threading.Thread(target=tracing.export_trace, args=(chilo_factory,), daemon=True)
+        trace_t.start()
+        threads.append(trace_t)
+    return threads
@@ -0,0 +1,85 @@
+"""
+对比工厂守护进程两种测试用例传输方式的吞吐：套接字（pickle消息，可预取）与共享内存环
+
+守护进程中的工厂用一个只返回固定SQL的假工厂代替，因此测到的是纯传输开销：
+    python bench_transport.py --count 200000 --size 2048
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from ChiloMutatorFactory import factory_service
+
+
+class _FakeQueue:
+    def qsize(self):
+        return 0
+
+
+class _FakeFactory:
+    def __init__(self, testcase_size):
+        self.testcase = bytearray(b"S" * testcase_size)
+        self.main_logger = logging.getLogger("bench_transport")
+        self.wait_exec_mutator_list = _FakeQueue()
+        self.mutate_lock = threading.Lock()
+
+    def add_one_seed_to_parse_list(self, seed_buf, mutate_time):
+        return 0
+
+    def mutate_once(self, max_size=None):
+        return self.testcase, False, 0, 0, False, False
+
+    def write_main_csv(self, *args):
+        pass
+
+
+def _run_server(socket_path, testcase_size):
+    factory_service.FactoryServer(_FakeFactory(testcase_size), socket_path).serve_forever()
+
+
+def _bench(socket_path, count, max_size, prefetch_count=1, use_ring=False):
+    client = factory_service.FactoryClient(socket_path, prefetch_count=prefetch_count, connect_timeout=10)
+    if use_ring:
+        client.open_ring()
+    start_time = time.perf_counter()
+    for _ in range(count):
+        if use_ring:
+            client.next_testcase_from_ring(max_size)
+        else:
+            testcase = client.next_testcase()[0]
+            bytearray(testcase[:max_size])
+    use_time = time.perf_counter() - start_time
+    client.close()
+    time.sleep(0.2)     # 等待守护进程回收共享内存环
+    return use_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="socket vs shared-memory transport benchmark")
+    parser.add_argument("--count", type=int, default=100000, help="传输的测试用例个数")
+    parser.add_argument("--size", type=int, default=2048, help="每个测试用例的字节数")
+    parser.add_argument("--max-size", type=int, default=1048576, help="模拟AFL传入的max_size")
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.gettempdir(), f"chilo_bench_{os.getpid()}.sock")
+    server = multiprocessing.Process(target=_run_server, args=(socket_path, args.size), daemon=True)
+    server.start()
+    try:
+        cases = [("socket, prefetch=1", dict(prefetch_count=1)),
+                 ("socket, prefetch=32", dict(prefetch_count=32)),
+                 ("shm ring", dict(use_ring=True))]
+        print(f"{'transport':<22}{'total(s)':>10}{'us/case':>10}{'cases/s':>12}")
+        for name, kwargs in cases:
+            use_time = _bench(socket_path, args.count, args.max_size, **kwargs)
+            print(f"{name:<22}{use_time:>10.3f}{use_time / args.count * 1e6:>10.2f}{args.count / use_time:>12.0f}")
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+以独立守护进程的方式运行Chilo工厂
+
+守护进程持有全部LLM客户端、后台线程与队列，多个AFL实例中的 ChiloMutate 通过Unix域套接字连接：
+    python chilo_daemon.py --config ./config.yaml --socket ./chilo_factory.sock
+然后在启动afl-fuzz前设置环境变量 CHILO_FACTORY_SOCKET 为同一个套接字路径。
+"""
+import argparse
+import os
+
+from ChiloMutatorFactory import chilo_factory as cf
+from ChiloMutatorFactory import factory_service, workers, profiler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chilo factory daemon")
+    parser.add_argument("--config", default="./config.yaml", help="工厂配置文件路径")
+    parser.add_argument("--socket", default="./chilo_factory.sock", help="Unix域套接字路径")
+    args = parser.parse_args()
+
+    chilo_factory = cf.ChiloFactory(args.config)
+    chilo_factory.main_logger.info("Chilo工厂守护进程初始化成功！")
+    workers.start_workers(chilo_factory)
+    profile_dir = os.environ.get("CHILO_PROFILE_DIR")
+    if profile_dir:
+        daemon_profiler = profiler.SamplingProfiler(profile_dir, "daemon",
+                                                    float(os.environ.get("CHILO_PROFILE_INTERVAL", 0.005)),
+                                                    float(os.environ.get("CHILO_PROFILE_DURATION", 30)),
+                                                    chilo_factory.main_logger)
+        daemon_profiler.install_signal()
+        daemon_profiler.watch_control_file()
+    factory_service.FactoryServer(chilo_factory, args.socket).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+对AFL输出目录中的崩溃样例做自动分诊
+
+1. 扫描 OUTPUT_DIR/*/crashes 下尚未处理过的崩溃文件（增量：已经在索引中的文件直接跳过）
+2. 在进程池中把每个崩溃文件重新喂给被测程序（建议使用ASAN版本），每次执行都有超时限制
+3. 从ASAN报告中取出符号化后的前N个栈帧（跳过sanitizer运行时自身的栈帧），按错误类型+函数名分桶，
+   每个桶保留体积最小的崩溃文件作为代表
+4. 根据崩溃文件名中的 time: 字段与 fuzzer_stats 中的 start_time 算出崩溃发生的时刻，
+   在该实例的 main.csv 中找到此前最后一次 fuzz 调用，得到产生它的种子、变异器与变异臂
+5. 结果写入 OUTPUT_DIR/triage/index.json（ChiloDisco 通过 /api/triage 展示），
+   每个桶代表样例的完整报告写入 OUTPUT_DIR/triage/reports/<bucket>.txt
+
+    python crash_triage.py --harness /home/ossfuzz_asan --jobs 8
+"""
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import yaml
+
+INDEX_VERSION = 1
+# ASAN/UBSAN 报告中的栈帧：    #3 0x55d0c1a2b3c4 in sqlite3VdbeExec /home/sqlite3/sqlite3.c:93544:7
+_FRAME_RE = re.compile(r"^\s*#(\d+)\s+0x[0-9a-fA-F]+\s+in\s+(\S+)(?:\s+(\S+))?")
+_ERROR_RE = re.compile(r"ERROR: (\w+Sanitizer): ([\w-]+)")
+_UBSAN_RE = re.compile(r"runtime error: (.*)")
+# 属于sanitizer运行时或libc异常路径的栈帧，不参与分桶
+_SKIP_FRAME_PREFIXES = ("__asan", "__sanitizer", "__interceptor", "__ubsan", "__lsan", "__msan",
+                        "__GI_", "__libc_", "__assert", "raise", "abort", "gsignal", "___interceptor")
+_STATUS_CRASH = "crash"
+_STATUS_TIMEOUT = "timeout"
+_STATUS_NO_REPRO = "no_repro"
+
+
+def parse_afl_filename(file_name):
+    """
+    解析AFL++崩溃文件名，例如 id:000003,sig:11,src:000120,time:86420,execs:51234,op:python
+    :return: 字段字典（值均为字符串）
+    """
+    fields = {}
+    for part in file_name.split(","):
+        if ":" in part:
+            key, value = part.split(":", 1)
+            fields[key] = value
+    return fields
+
+
+def parse_sanitizer_report(report, top_n):
+    """
+    从sanitizer输出中提取错误类型与前top_n个有意义的栈帧
+    :return: (错误类型, [(函数名, 位置), ...])
+    """
+    kind = ""
+    match = _ERROR_RE.search(report)
+    if match:
+        kind = f"{match.group(1)}:{match.group(2)}"
+    else:
+        match = _UBSAN_RE.search(report)
+        if match:
+            kind = "UndefinedBehaviorSanitizer:" + re.sub(r"\d+", "N", match.group(1).strip())[:80]
+    frames = []
+    last_index = -1
+    for line in report.splitlines():
+        match = _FRAME_RE.match(line)
+        if not match:
+            continue
+        frame_index = int(match.group(1))
+        if frame_index <= last_index:
+            # 只取第一个调用栈（后面的是分配/释放位置的栈）
+            break
+        last_index = frame_index
+        func = match.group(2)
+        if func.startswith(_SKIP_FRAME_PREFIXES):
+            continue
+        location = os.path.basename(match.group(3)) if match.group(3) else ""
+        frames.append((func, location))
+        if len(frames) >= top_n:
+            break
+    return kind, frames
+
+
+def replay_crash(harness, crash_path, timeout, top_n):
+    """
+    在子进程中重放一个崩溃文件（由进程池调用）
+    :return: 结果字典
+    """
+    env = dict(os.environ)
+    env.setdefault("ASAN_OPTIONS", "symbolize=1:detect_leaks=0:abort_on_error=1:allocator_may_return_null=1")
+    env.setdefault("UBSAN_OPTIONS", "print_stacktrace=1:halt_on_error=1")
+    start_time = time.time()
+    try:
+        process = subprocess.run([harness, crash_path], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, timeout=timeout, env=env)
+    except subprocess.TimeoutExpired as e:
+        report = (e.stderr or b"").decode("utf-8", errors="replace")
+        return {"status": _STATUS_TIMEOUT, "kind": "timeout", "frames": [], "returncode": None,
+                "report": report, "use_time": time.time() - start_time}
+    report = process.stderr.decode("utf-8", errors="replace")
+    kind, frames = parse_sanitizer_report(report, top_n)
+    if process.returncode == 0 and not kind:
+        status = _STATUS_NO_REPRO
+    else:
+        status = _STATUS_CRASH
+        if not kind:
+            # 非ASAN版本没有报告，只能按信号/退出码分桶
+            kind = f"signal:{-process.returncode}" if process.returncode < 0 else f"exit:{process.returncode}"
+    return {"status": status, "kind": kind, "frames": frames, "returncode": process.returncode,
+            "report": report, "use_time": time.time() - start_time}
+
+
+def bucket_id_of(kind, frames):
+    key = kind + "\n" + "\n".join(func for func, _ in frames)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def _atomic_write_json(path, data):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_index(index_path, harness, top_n):
+    """
+    读取已有的分诊索引；被测程序或栈帧数变化时分桶结果不再可比，重新开始
+    """
+    if os.path.isfile(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if (index.get("version") == INDEX_VERSION and index.get("harness") == harness
+                and index.get("top_n") == top_n):
+            return index
+        print(f"triage index was built with other settings, rebuilding: {index_path}")
+    return {"version": INDEX_VERSION, "harness": harness, "top_n": top_n, "updated_at": None,
+            "crashes": {}, "buckets": {}}
+
+
+def find_new_crashes(output_dir, index):
+    """
+    :return: [(相对output_dir的路径, 实例名, 文件大小), ...]
+    """
+    new_crashes = []
+    for instance in sorted(os.listdir(output_dir)):
+        crash_dir = os.path.join(output_dir, instance, "crashes")
+        if not os.path.isdir(crash_dir):
+            continue
+        for file_name in sorted(os.listdir(crash_dir)):
+            if not file_name.startswith("id:"):
+                continue    # README.txt 等
+            rel_path = os.path.join(instance, "crashes", file_name)
+            if rel_path in index["crashes"]:
+                continue
+            new_crashes.append((rel_path, instance, os.path.getsize(os.path.join(output_dir, rel_path))))
+    return new_crashes
+
+
+def _instance_main_csv(main_csv_path, instance):
+    """
+    多实例FUZZ时每个实例的main.csv位于 <目录>/<实例名>/main.csv（与chilo_factory._instance_path一致），
+    单实例时AFL的实例目录名为default，直接使用原路径
+    """
+    if instance == "default":
+        return main_csv_path
+    head, tail = os.path.split(main_csv_path)
+    instance_path = os.path.join(head, instance, tail)
+    return instance_path if os.path.isfile(instance_path) else main_csv_path
+
+
+def link_origins(output_dir, instance, crashes, main_csv_path):
+    """
+    把一个实例的崩溃与main.csv中产生它的那次fuzz调用对应起来
+    崩溃按发生时刻排序后与main.csv（按real_time递增写入）做一次归并扫描，不需要把整个CSV读入内存
+    :param crashes: [(相对路径, afl文件名字段), ...]
+    :return: {相对路径: 来源字典}
+    """
+    stats_path = os.path.join(output_dir, instance, "fuzzer_stats")
+    afl_start_time = None
+    if os.path.isfile(stats_path):
+        with open(stats_path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.startswith("start_time"):
+                    afl_start_time = float(line.split(":", 1)[1])
+                    break
+    timed_crashes = []
+    for rel_path, fields in crashes:
+        if afl_start_time is not None and fields.get("time", "").isdigit():
+            crash_time = afl_start_time + int(fields["time"]) / 1000
+        else:
+            crash_time = os.path.getmtime(os.path.join(output_dir, rel_path))
+        timed_crashes.append((crash_time, rel_path))
+    timed_crashes.sort()
+
+    origins = {}
+    csv_path = _instance_main_csv(main_csv_path, instance) if main_csv_path else ""
+    if not csv_path or not os.path.isfile(csv_path) or not timed_crashes:
+        return origins
+    last_row = None
+    crash_pos = 0
+    with open(csv_path, "r", newline="", encoding="utf-8", errors="ignore") as f:
+        for row in csv.reader(f):
+            try:
+                real_time = float(row[0])
+            except (ValueError, IndexError):
+                continue    # 每次工厂启动都会重新写一次表头
+            while crash_pos < len(timed_crashes) and timed_crashes[crash_pos][0] < real_time:
+                if last_row is not None:
+                    origins[timed_crashes[crash_pos][1]] = _origin_of(last_row, timed_crashes[crash_pos][0])
+                crash_pos += 1
+            if crash_pos >= len(timed_crashes):
+                break
+            last_row = row
+    while crash_pos < len(timed_crashes) and last_row is not None:
+        origins[timed_crashes[crash_pos][1]] = _origin_of(last_row, timed_crashes[crash_pos][0])
+        crash_pos += 1
+    return origins
+
+
+def _origin_of(row, crash_time):
+    # main.csv 列：real_time, relative_time, fuzz_count_seed_number, fuzz_seed_number, is_by_ramdom,
+    # fuzz_use_time, now_seed_id, real_fuzz_seed_id, real_mutator_id, ..., is_from_structural_mutator, arm
+    return {"seed_id": row[7], "mutator_id": row[8], "is_by_random": row[4],
+            "is_from_structural_mutator": row[14] if len(row) > 14 else "",
+            "arm": row[15] if len(row) > 15 else "chilo",
+            "crash_time": crash_time, "delta_s": round(crash_time - float(row[0]), 3)}
+
+
+def add_to_bucket(index, triage_dir, rel_path, size, result, origin):
+    bucket_id = bucket_id_of(result["kind"], result["frames"])
+    bucket = index["buckets"].get(bucket_id)
+    if bucket is None:
+        bucket = {"bucket_id": bucket_id, "kind": result["kind"],
+                  "frames": [f"{func} {location}".strip() for func, location in result["frames"]],
+                  "count": 0, "representative": None, "representative_size": None,
+                  "first_seen": time.time(), "instances": [], "origins": []}
+        index["buckets"][bucket_id] = bucket
+    bucket["count"] += 1
+    instance = rel_path.split(os.sep, 1)[0]
+    if instance not in bucket["instances"]:
+        bucket["instances"].append(instance)
+    if origin is not None and len(bucket["origins"]) < 20:
+        bucket["origins"].append(dict(origin, crash=rel_path))
+    if bucket["representative_size"] is None or size < bucket["representative_size"]:
+        bucket["representative"] = rel_path
+        bucket["representative_size"] = size
+        bucket["representative_origin"] = origin
+        with open(os.path.join(triage_dir, "reports", f"{bucket_id}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"# {rel_path}\n# returncode: {result['returncode']}\n\n{result['report']}")
+    return bucket_id
+
+
+def main():
+    with open("./fuzz_config.yaml", "r", encoding="utf-8") as f:
+        fuzz_config = yaml.safe_load(f)
+    main_csv_path = ""
+    if os.path.isfile("./config.yaml"):
+        with open("./config.yaml", "r", encoding="utf-8") as f:
+            main_csv_path = ((yaml.safe_load(f) or {}).get("CSV") or {}).get("MAIN_CSV_PATH", "")
+
+    parser = argparse.ArgumentParser(description="replay, bucket and link AFL crashes")
+    parser.add_argument("--output-dir", default=fuzz_config["OUTPUT_DIR"], help="AFL输出目录")
+    parser.add_argument("--harness", default=fuzz_config.get("TRIAGE_HARNESS_PATH", "/home/ossfuzz"),
+                        help="重放使用的被测程序（建议使用ASAN版本）")
+    parser.add_argument("--main-csv", default=main_csv_path, help="Chilo的main.csv路径，用于追溯来源")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="并行重放的进程数")
+    parser.add_argument("--timeout", type=float, default=10, help="单次重放的超时时间（秒）")
+    parser.add_argument("--frames", type=int, default=5, help="分桶使用的栈帧个数")
+    parser.add_argument("--save-every", type=int, default=200, help="每处理多少个崩溃保存一次索引")
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(args.output_dir)
+    harness = os.path.abspath(args.harness)
+    if not os.access(harness, os.X_OK):
+        print(f"harness is not executable: {harness}")
+        sys.exit(1)
+    triage_dir = os.path.join(output_dir, "triage")
+    os.makedirs(os.path.join(triage_dir, "reports"), exist_ok=True)
+    index_path = os.path.join(triage_dir, "index.json")
+    index = load_index(index_path, harness, args.frames)
+
+    new_crashes = find_new_crashes(output_dir, index)
+    print(f"{len(index['crashes'])} crashes already triaged, {len(new_crashes)} new")
+    if not new_crashes:
+        return
+
+    crashes_by_instance = {}
+    for rel_path, instance, _ in new_crashes:
+        crashes_by_instance.setdefault(instance, []).append((rel_path, parse_afl_filename(os.path.basename(rel_path))))
+    origins = {}
+    for instance, crashes in crashes_by_instance.items():
+        origins.update(link_origins(output_dir, instance, crashes, args.main_csv))
+
+    start_time = time.time()
+    done_count = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(replay_crash, harness, os.path.join(output_dir, rel_path), args.timeout,
+                                   args.frames): (rel_path, size) for rel_path, _, size in new_crashes}
+        for future in concurrent.futures.as_completed(futures):
+            rel_path, size = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"replay failed: {rel_path}: {e}")
+                continue
+            origin = origins.get(rel_path)
+            entry = {"size": size, "status": result["status"], "kind": result["kind"],
+                     "use_time": round(result["use_time"], 3), "origin": origin, "bucket": None}
+            if result["status"] != _STATUS_NO_REPRO:
+                entry["bucket"] = add_to_bucket(index, triage_dir, rel_path, size, result, origin)
+            index["crashes"][rel_path] = entry
+            done_count += 1
+            if done_count % args.save_every == 0:
+                index["updated_at"] = time.time()
+                _atomic_write_json(index_path, index)
+                print(f"{done_count}/{len(new_crashes)} replayed, {len(index['buckets'])} buckets, "
+                      f"{done_count / (time.time() - start_time):.1f} crashes/s")
+
+    index["updated_at"] = time.time()
+    _atomic_write_json(index_path, index)
+    no_repro_count = sum(1 for entry in index["crashes"].values() if entry["status"] == _STATUS_NO_REPRO)
+    print(f"done: {done_count} replayed in {time.time() - start_time:.1f}s, "
+          f"{len(index['buckets'])} buckets, {no_repro_count} not reproducible, index: {index_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+在FUZZ开始前精简初始种子库
+
+1. 规范化：统一换行符、去掉行尾空白与首尾空行，按规范化后的内容去重
+2. 把种子分成 jobs 份，每份由一个 afl-showmap -i/-o 批量进程（共用一个forkserver）在被测程序上执行，
+   得到每个种子命中的边及其计数桶
+3. 贪心集合覆盖：从最稀有的边开始，每条尚未覆盖的边选命中它的最小种子，直到所有边都被覆盖
+
+结果写入输出目录（输出目录旁边的 <输出目录>.chilo_distilled 标记表示可以被下次精简覆盖；标记不能放在目录里，
+否则会被AFL当作种子读入），start_fuzz.py 中 DISTILL_CORPUS 打开后用它代替 INPUT_DIR：
+    python distill_corpus.py --input ../docker/sqlite/BGSeed/ --output ../docker/sqlite/BGSeed_distilled/
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+_MARKER_FILE = ".chilo_distilled"
+
+
+def normalize_seed(data: bytes) -> bytes:
+    """
+    只做不改变语义的规范化：CRLF换成LF、去掉行尾空白、去掉首尾空行
+    """
+    lines = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n").split(b"\n")
+    return b"\n".join(line.rstrip() for line in lines).strip(b"\n") + b"\n"
+
+
+def load_unique_seeds(input_dir):
+    """
+    :return: (按文件名排序的 [(文件名, 规范化内容)]，重复的种子个数)
+    """
+    seeds = []
+    seen_digests = set()
+    duplicate_count = 0
+    for file_name in sorted(os.listdir(input_dir)):
+        file_path = os.path.join(input_dir, file_name)
+        if not os.path.isfile(file_path) or file_name.startswith("."):
+            continue
+        with open(file_path, "rb") as f:
+            data = normalize_seed(f.read())
+        digest = hashlib.sha1(data).digest()
+        if digest in seen_digests:
+            duplicate_count += 1
+            continue
+        seen_digests.add(digest)
+        seeds.append((file_name, data))
+    return seeds, duplicate_count
+
+
+def _marker_path(output_dir):
+    return os.path.normpath(output_dir) + _MARKER_FILE
+
+
+def _run_showmap(showmap_path, harness, chunk_dir, map_dir, timeout_ms):
+    """
+    对一个目录中的全部种子批量运行 afl-showmap
+    :return: (返回码, stderr的最后一部分)
+    """
+    cmd = [showmap_path, "-q", "-i", chunk_dir, "-o", map_dir, "-t", str(timeout_ms), "-m", "none",
+           "--", harness, "@@"]
+    env = dict(os.environ, AFL_QUIET="1")
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            env=env)
+    return result.returncode, result.stderr[-2000:].decode("utf-8", errors="replace").strip()
+
+
+def collect_coverage(seeds, showmap_path, harness, jobs, timeout_ms):
+    """
+    :return: {文件名: frozenset(边:计数桶)}，没有产生覆盖图的种子（崩溃/超时）不在其中
+    afl-showmap 无法运行、全部失败或没有任何种子产生覆盖时抛出异常，避免把空目录当作精简结果
+    """
+    coverage = {}
+    with tempfile.TemporaryDirectory(prefix="chilo_distill_") as work_dir:
+        chunks = []
+        for job_index in range(jobs):
+            chunk_dir = os.path.join(work_dir, f"in{job_index}")
+            map_dir = os.path.join(work_dir, f"map{job_index}")
+            os.makedirs(chunk_dir)
+            os.makedirs(map_dir)
+            chunks.append((chunk_dir, map_dir))
+        for i, (file_name, data) in enumerate(seeds):
+            with open(os.path.join(chunks[i % jobs][0], file_name), "wb") as f:
+                f.write(data)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_run_showmap, showmap_path, harness, chunk_dir, map_dir, timeout_ms)
+                       for chunk_dir, map_dir in chunks]
+        errors = []
+        for future in futures:
+            try:
+                returncode, stderr = future.result()
+            except OSError as e:
+                errors.append(str(e))
+                continue
+            if returncode != 0:
+                errors.append(f"afl-showmap exited with {returncode}: {stderr}")
+        if len(errors) == len(chunks):
+            raise Exception(f"All afl-showmap runs failed: {errors[0]}")
+        for _, map_dir in chunks:
+            for file_name in os.listdir(map_dir):
+                with open(os.path.join(map_dir, file_name), "r") as f:
+                    tuples = frozenset(line.strip() for line in f if line.strip())
+                if tuples:
+                    coverage[file_name] = tuples
+    if seeds and not coverage:
+        raise Exception(f"afl-showmap produced no coverage for any seed{': ' + errors[0] if errors else ''}")
+    return coverage
+
+
+def greedy_cover(coverage, sizes):
+    """
+    贪心集合覆盖，与afl-cmin的策略相同：边按命中它的种子数从少到多处理，每条未覆盖的边选命中它的最小种子
+    :param coverage: {文件名: 边集合}
+    :param sizes: {文件名: 大小}
+    :return: 选中的文件名列表
+    """
+    best_seed = {}
+    hit_count = {}
+    for file_name in sorted(coverage, key=lambda name: (sizes[name], name)):
+        for edge in coverage[file_name]:
+            hit_count[edge] = hit_count.get(edge, 0) + 1
+            best_seed.setdefault(edge, file_name)   # 按大小升序遍历，第一个就是最小的
+    covered = set()
+    selected = []
+    for edge in sorted(hit_count, key=lambda e: (hit_count[e], e)):
+        if edge in covered:
+            continue
+        file_name = best_seed[edge]
+        selected.append(file_name)
+        covered |= coverage[file_name]
+    return selected
+
+
+def distill(input_dir, output_dir, showmap_path, harness, jobs=None, timeout_ms=1000):
+    """
+    精简种子库
+    :return: 统计信息字典
+    """
+    start_time = time.time()
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    marker_path = _marker_path(output_dir)
+    is_ours = os.path.exists(marker_path) or os.path.exists(os.path.join(output_dir, _MARKER_FILE))  # 旧版本把标记放在目录里
+    if os.path.isdir(output_dir) and os.listdir(output_dir) and not is_ours:
+        raise Exception(f"Distill output dir is not empty and was not created by distill_corpus: {output_dir}")
+
+    seeds, duplicate_count = load_unique_seeds(input_dir)
+    # 先收集覆盖率，失败时不动上一次的精简结果
+    coverage = collect_coverage(seeds, showmap_path, harness, min(jobs, max(1, len(seeds))), timeout_ms)
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    contents = dict(seeds)
+    sizes = {file_name: len(data) for file_name, data in seeds}
+    selected = greedy_cover(coverage, sizes)
+    for file_name in selected:
+        with open(os.path.join(output_dir, file_name), "wb") as f:
+            f.write(contents[file_name])
+    with open(marker_path, "w") as f:
+        f.write(f"distilled from {os.path.abspath(input_dir)}\n")
+
+    stats = {
+        "input_count": len(seeds) + duplicate_count,
+        "duplicate_count": duplicate_count,
+        "no_coverage_count": len(seeds) - len(coverage),
+        "output_count": len(selected),
+        "input_bytes": sum(sizes.values()),
+        "output_bytes": sum(sizes[file_name] for file_name in selected),
+        "edge_count": len(set().union(*coverage.values())) if coverage else 0,
+        "use_time": time.time() - start_time,
+    }
+    return stats
+
+
+def format_stats(stats):
+    return (f"distilled {stats['input_count']} seeds -> {stats['output_count']} "
+            f"({stats['duplicate_count']} duplicates, {stats['no_coverage_count']} without coverage), "
+            f"{stats['input_bytes']} -> {stats['output_bytes']} bytes, {stats['edge_count']} edge tuples, "
+            f"{stats['use_time']:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="normalize, deduplicate and coverage-minimize the initial corpus")
+    parser.add_argument("--input", required=True, help="原始种子目录")
+    parser.add_argument("--output", required=True, help="精简后的种子目录")
+    parser.add_argument("--showmap", default="../AFLplusplus/afl-showmap", help="afl-showmap 路径")
+    parser.add_argument("--harness", default="/home/ossfuzz", help="插桩后的被测程序")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="并行的 afl-showmap 进程数")
+    parser.add_argument("--timeout", type=int, default=1000, help="单个种子的超时时间（毫秒）")
+    args = parser.parse_args()
+    print(format_stats(distill(args.input, args.output, args.showmap, args.harness, args.jobs, args.timeout)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,96 @@
 import os
+import subprocess
+import sys
 import yaml
 
+import distill_corpus
+
+# 聚合状态时从每个实例的 fuzzer_stats 中读取的字段
+STATUS_SUM_FIELDS = ["execs_done", "execs_per_sec", "corpus_count", "saved_crashes", "saved_hangs"]
+
+
+def read_fuzzer_stats(stats_path):
+    """
+    读取一个AFL实例的 fuzzer_stats 文件
+    :return: 字段字典
+    """
+    stats = {}
+    with open(stats_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                stats[key.strip()] = value.strip()
+    return stats
+
+
+def print_status(output_dir, shared_store_path):
+    """
+    汇总输出目录下所有实例的状态，并统计共享存储中的发布情况
+    """
+    total = {field: 0.0 for field in STATUS_SUM_FIELDS}
+    print(f"{'instance':<10}{'execs_done':>14}{'execs/s':>10}{'corpus':>8}{'crashes':>9}{'hangs':>7}{'bitmap':>9}")
+    for instance in sorted(os.listdir(output_dir)):
+        stats_path = os.path.join(output_dir, instance, "fuzzer_stats")
+        if not os.path.isfile(stats_path):
+            continue
+        stats = read_fuzzer_stats(stats_path)
+        for field in STATUS_SUM_FIELDS:
+            try:
+                total[field] += float(stats.get(field, 0))
+            except ValueError:
+                pass
+        print(f"{instance:<10}{stats.get('execs_done', '-'):>14}{stats.get('execs_per_sec', '-'):>10}"
+              f"{stats.get('corpus_count', '-'):>8}{stats.get('saved_crashes', '-'):>9}"
+              f"{stats.get('saved_hangs', '-'):>7}{stats.get('bitmap_cvg', '-'):>9}")
+    print(f"{'TOTAL':<10}{int(total['execs_done']):>14}{total['execs_per_sec']:>10.2f}"
+          f"{int(total['corpus_count']):>8}{int(total['saved_crashes']):>9}{int(total['saved_hangs']):>7}")
+
+    manifest_path = os.path.join(shared_store_path, "manifest.jsonl")
+    if os.path.isfile(manifest_path):
+        parsed_count = 0
+        mutator_count = 0
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if '"type": "parsed"' in line:
+                    parsed_count += 1
+                elif '"type": "mutator"' in line:
+                    mutator_count += 1
+        print(f"shared store: {parsed_count} parsed seeds, {mutator_count} mutators")
+
+
+def launch_jobs(fuzz_cmd_prefix, fuzz_cmd_suffix, output_dir, fuzz_jobs, cpu_start, shared_store_path):
+    """
+    启动一个 -M 主实例与 fuzz_jobs-1 个 -S 从实例，每个实例绑定一个CPU核心，使用相同的 -V 时间预算
+    主实例在前台显示界面，从实例关闭界面并把输出写入各自的日志文件
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(shared_store_path, exist_ok=True)
+    secondary_processes = []
+    for job_index in range(1, fuzz_jobs):
+        instance_id = f"sec{job_index}"
+        env = dict(os.environ, CHILO_INSTANCE_ID=instance_id, CHILO_SHARED_STORE=shared_store_path, AFL_NO_UI="1")
+        cmd = f"{fuzz_cmd_prefix} -S {instance_id} -b {cpu_start + job_index} {fuzz_cmd_suffix}"
+        log_file = open(os.path.join(output_dir, f"{instance_id}.log"), "w")
+        secondary_processes.append((subprocess.Popen(cmd, shell=True, env=env, stdout=log_file,
+                                                     stderr=subprocess.STDOUT), log_file))
+        print(f"started {instance_id} on cpu {cpu_start + job_index}: {cmd}")
+
+    env = dict(os.environ, CHILO_INSTANCE_ID="main", CHILO_SHARED_STORE=shared_store_path)
+    cmd = f"{fuzz_cmd_prefix} -M main -b {cpu_start} {fuzz_cmd_suffix}"
+    try:
+        subprocess.call(cmd, shell=True, env=env)
+    finally:
+        # 主实例退出后，从实例在 -V 到期时也会退出；等待时被中断则直接结束它们
+        try:
+            for process, log_file in secondary_processes:
+                process.wait()
+                log_file.close()
+        except KeyboardInterrupt:
+            for process, log_file in secondary_processes:
+                process.terminate()
+                log_file.close()
+
+
 def main():
 
     #1. 读取fuzz_config文件
@@ -17,15 +107,56 @@ def main():
     is_use_squirrel = config["IS_USE_SQUIRREL"]
     squirrel_lib_path = config["SQUIRREL_LIB_PATH"]
     squirrel_config_path = config["SQUIRREL_CONFIG_PATH"]
+    # afl：由AFL加载Squirrel并与Chilo固定交替；arm：由ChiloMutate在进程内加载Squirrel，按产出率调度
+    squirrel_mode = config.get("SQUIRREL_MODE", "afl")
+
+    # 多核FUZZ：FUZZ_JOBS 个AFL实例（1个-M，其余为-S），从 FUZZ_CPU_START 号核心开始依次绑定
+    fuzz_jobs = config.get("FUZZ_JOBS", 1)
+    fuzz_cpu_start = config.get("FUZZ_CPU_START", 0)
+    shared_store_path = os.path.abspath(config.get("SHARED_STORE_PATH", os.path.join(output_dir, "chilo_shared")))
+
+    # 工厂守护进程：由一个独立进程持有LLM线程与队列，所有AFL实例作为客户端连接
+    is_use_factory_daemon = config.get("FACTORY_DAEMON", False)
+    factory_socket_path = os.path.abspath(config.get("FACTORY_SOCKET_PATH", "./chilo_factory.sock"))
+
+    if "--status" in sys.argv:
+        print_status(output_dir, shared_store_path)
+        return
 
     can_fuzz_dbms_list = ["SQLite"]
 
     if target_dbms not in can_fuzz_dbms_list:
         raise Exception(f"Unsupported DBMS, plz check fuzz_config.yaml. TARGET_DBMS must in {can_fuzz_dbms_list}")
 
+    # 精简初始种子库：规范化去重后用 afl-showmap 做覆盖率最小化，之后以精简结果作为 -i
+    if config.get("DISTILL_CORPUS", False):
+        distilled_dir = config.get("DISTILL_OUTPUT_DIR", input_dir.rstrip("/") + "_distilled/")
+        showmap_path = os.path.join(os.path.dirname(fuzzer_path), "afl-showmap")
+        try:
+            stats = distill_corpus.distill(input_dir, distilled_dir, showmap_path, "/home/ossfuzz",
+                                           config.get("DISTILL_JOBS"), config.get("DISTILL_TIMEOUT", 1000))
+        except Exception as e:
+            print(f"Corpus distillation failed, using the original corpus {input_dir}: {e}")
+        else:
+            print(distill_corpus.format_stats(stats))
+            input_dir = distilled_dir
+
+    # 预热：工厂启动后立即并发解析 -i 目录中的全部种子，而不是等AFL逐个选中
+    if config.get("WARMUP", False):
+        os.environ["CHILO_WARMUP_DIR"] = os.path.abspath(input_dir)
+
+    # 按需采样分析：向该目录写入 profile.request（内容为秒数）或向进程发送SIGUSR2，各进程把折叠栈写入该目录
+    os.environ["CHILO_PROFILE_DIR"] = os.path.abspath(config.get("PROFILE_DIR", os.path.join(output_dir, "chilo_profiles")))
+    os.environ["CHILO_PROFILE_INTERVAL"] = str(config.get("PROFILE_INTERVAL", 0.005))
+    os.environ["CHILO_PROFILE_DURATION"] = str(config.get("PROFILE_DURATION", 30))
+
     #2. 设置系统环境（FOR AFL++）
     os.environ["AFL_CUSTOM_MUTATOR_ONLY"] = "1" #只使用客制化变异器
-    os.environ["AFL_DISABLE_TRIM"] = "1"    #禁用剪裁
+    # 剪裁：默认禁用；TRIM 打开后由 ChiloMutate 按语句/子句/字面量剪裁队列项，每个队列项最多 TRIM_MAX_STEPS 步
+    if config.get("TRIM", False):
+        os.environ["CHILO_TRIM_MAX_STEPS"] = str(config.get("TRIM_MAX_STEPS", 128))
+    else:
+        os.environ["AFL_DISABLE_TRIM"] = "1"    #禁用剪裁
     os.environ["AFL_FAST_CAL"] = "1"    #禁用初期多次执行种子时的路径校准
     os.environ["PYTHONPATH"] = chilo_mutator_path
     os.environ["AFL_PYTHON_MODULE"] = "ChiloMutate"
@@ -39,7 +170,10 @@ def main():
             print("Invalid path for squirrel lib file")
             raise Exception(f"Invalid path for squirrel lib file: {squirrel_lib_path}")
 
-        os.environ["AFL_CUSTOM_MUTATOR_LIBRARY"]= squirrel_lib_path
+        if squirrel_mode == "arm":
+            os.environ["CHILO_SQUIRREL_LIB"] = os.path.abspath(squirrel_lib_path)
+        else:
+            os.environ["AFL_CUSTOM_MUTATOR_LIBRARY"]= squirrel_lib_path
         os.environ["SQUIRREL_CONFIG"] = squirrel_config_path
 
 
@@ -52,7 +186,22 @@ def main():
     else:
         raise Exception(f"Unsupported DBMS, plz check fuzz_config.yaml. TARGET_DBMS must in {can_fuzz_dbms_list}")
 
-    os.system(cmd)
+    daemon_process = None
+    if is_use_factory_daemon:
+        daemon_process = subprocess.Popen([sys.executable, os.path.join(chilo_mutator_path, "chilo_daemon.py"),
+                                           "--socket", factory_socket_path])
+        os.environ["CHILO_FACTORY_SOCKET"] = factory_socket_path
+
+    try:
+        if fuzz_jobs > 1:
+            fuzz_cmd_prefix, fuzz_cmd_suffix = cmd.split(" -- ", 1)
+            launch_jobs(fuzz_cmd_prefix, f"-- {fuzz_cmd_suffix}", output_dir, fuzz_jobs, fuzz_cpu_start, shared_store_path)
+        else:
+            os.system(cmd)
+    finally:
+        if daemon_process is not None:
+            daemon_process.terminate()
+            daemon_process.wait()
 
 
 if __name__ == "__main__":